@@ -0,0 +1,190 @@
+import csv
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from extract_transform_incendios import IncendiosConafETL
+
+
+class TransformadorFilaAFila(IncendiosConafETL):
+    """
+    Transformación original (antes de pandas), usada solo como referencia: recorre el CSV con
+    csv.DictReader, prueba los dos formatos de fecha con strptime y arma cada feature por separado.
+    """
+
+    def _nivel_alerta_fila(self, estado):
+        if not estado: return 'indefinido'
+        estado_lower = estado.lower()
+        if 'en combate' in estado_lower:
+            return 'rojo'
+        elif 'controlado' in estado_lower:
+            return 'amarillo'
+        elif 'extinguido' in estado_lower:
+            return 'verde'
+        else:
+            return 'gris'
+
+    def transformar_csv(self, contenido):
+        features = []
+        for row in csv.DictReader(io.StringIO(contenido.decode('utf-8'))):
+            try:
+                if not row.get('lat') or not row.get('lon'):
+                    continue
+                fecha_str = row['f_inicio']
+                try:
+                    fecha_obj = datetime.strptime(fecha_str, '%b %d, %Y, %H:%M')
+                except ValueError:
+                    try:
+                        fecha_obj = datetime.strptime(fecha_str, '%Y-%m-%d %H:%M')
+                    except ValueError:
+                        continue
+                features.append({
+                    "type": "Feature",
+                    "properties": {
+                        "tipo_amenaza": "incendio_forestal",
+                        "fuente": "CONAF (GitHub)",
+                        "titulo": row.get('nombre'),
+                        "estado": row.get('estado'),
+                        "comuna": row.get('comuna'),
+                        "region": row.get('region'),
+                        "fecha_inicio_utc": fecha_obj.replace(tzinfo=timezone.utc).isoformat(),
+                        "superficie_ha": float(row['sup_total'].replace(',', '.')) if row.get('sup_total') else 0,
+                        "nivel_alerta": self._nivel_alerta_fila(row.get('estado'))
+                    },
+                    "geometry": {"type": "Point", "coordinates": [float(row['lon']), float(row['lat'])]}
+                })
+            except (ValueError, KeyError, TypeError):
+                continue
+        features.sort(key=lambda item: item['properties']['fecha_inicio_utc'])
+        return features
+
+    def guardar_json(self, features):
+        # La capa se escribía completa e indentada en cada ejecución
+        with open(self.output_path, 'w', encoding='utf-8') as f:
+            json.dump({"type": "FeatureCollection", "features": features}, f, indent=2, ensure_ascii=False)
+
+
+def generar_csv(temporadas, incendios_por_temporada, semilla=0):
+    """
+    CSV con la forma del de CONAF para varias temporadas (julio a junio): mezcla los dos formatos de
+    fecha, usa coma decimal en la superficie e incluye filas sin coordenadas o con fechas inválidas.
+    """
+    azar = random.Random(semilla)
+    estados = ["Extinguido", "Controlado", "En combate", "Extinguido", "Extinguido", "", "Vigilancia"]
+    salida = io.StringIO()
+    escritor = csv.writer(salida)
+    escritor.writerow(["nombre", "estado", "comuna", "region", "f_inicio", "sup_total", "lat", "lon"])
+    inicio = datetime(2025 - temporadas, 7, 1)
+    for i in range(temporadas * incendios_por_temporada):
+        fecha = inicio + timedelta(minutes=azar.randrange(temporadas * 365 * 24 * 60))
+        fecha_texto = fecha.strftime('%b %d, %Y, %H:%M') if azar.random() < 0.5 else fecha.strftime('%Y-%m-%d %H:%M')
+        if azar.random() < 0.01:
+            fecha_texto = "sin fecha"
+        superficie = "" if azar.random() < 0.2 else f"{azar.uniform(0, 5000):.2f}".replace('.', ',')
+        sin_coordenadas = azar.random() < 0.02
+        escritor.writerow([
+            f"INCENDIO {i}", azar.choice(estados), f"Comuna {azar.randint(1, 346)}", f"Región {azar.randint(1, 16)}",
+            fecha_texto, superficie,
+            "" if sin_coordenadas else f"{azar.uniform(-56, -17):.5f}", f"{azar.uniform(-76, -66):.5f}"
+        ])
+    return salida.getvalue().encode('utf-8')
+
+
+def modificar_csv(contenido, fraccion, semilla=1):
+    """
+    Simula una actualización del CSV sobre una fracción de los incendios: a la mitad le cambia el estado
+    y la superficie, a un cuarto le corrige el nombre (cambia su clave) y el otro cuarto lo borra.
+    """
+    azar = random.Random(semilla)
+    filas = list(csv.reader(io.StringIO(contenido.decode('utf-8'))))
+    vigentes = filas[:1]
+    for fila in filas[1:]:
+        sorteo = azar.random()
+        if sorteo < fraccion / 4:
+            continue  # Fila borrada del CSV
+        if sorteo < fraccion / 2:
+            fila[0] = fila[0].title()
+        elif sorteo < fraccion:
+            fila[1] = "Extinguido"
+            fila[5] = f"{azar.uniform(0, 5000):.2f}".replace('.', ',')
+        vigentes.append(fila)
+    salida = io.StringIO()
+    csv.writer(salida).writerows(vigentes)
+    return salida.getvalue().encode('utf-8')
+
+
+class BenchmarkIncendios:
+    """Mide la transformación fila a fila contra la vectorizada, y la escritura completa contra la incremental."""
+
+    def __init__(self, temporadas=5, incendios_por_temporada=20000, fraccion_modificada=0.01):
+        self.temporadas = temporadas
+        self.incendios_por_temporada = incendios_por_temporada
+        self.fraccion_modificada = fraccion_modificada
+
+    def _medir(self, funcion, *args):
+        inicio = time.perf_counter()
+        resultado = funcion(*args)
+        return time.perf_counter() - inicio, resultado
+
+    def ejecutar(self):
+        contenido = generar_csv(self.temporadas, self.incendios_por_temporada)
+        print(f"--- Benchmark de transformación de incendios ({self.temporadas} temporadas, "
+              f"{self.temporadas * self.incendios_por_temporada} filas, {len(contenido) / 1024 / 1024:.1f} MB) ---")
+
+        directorio = tempfile.mkdtemp(prefix='benchmark_incendios_')
+        try:
+            original = TransformadorFilaAFila()
+            vectorizado = IncendiosConafETL()
+            for etl in (original, vectorizado):
+                etl.output_path = os.path.join(directorio, f"{type(etl).__name__}.geojson")
+                etl.estado_path = os.path.join(directorio, f"{type(etl).__name__}.npz")
+
+            t_original, features_original = self._medir(original.transformar_csv, contenido)
+            t_vectorizado, features_vectorizado = self._medir(vectorizado.transformar_csv, contenido)
+            identico = "idénticas" if features_original == features_vectorizado else "DISTINTAS"
+
+            def incremental(datos):
+                capa, estado, conteos = vectorizado.transformar_incremental(datos)
+                vectorizado.actualizar_capa(capa, estado, conteos)
+                return capa, conteos
+
+            # Ejecución completa: transforma y reescribe toda la capa (la vectorizada, la primera vez)
+            t_completa_original, _ = self._medir(lambda: original.guardar_json(original.transformar_csv(contenido)))
+            t_completa, _ = self._medir(incremental, contenido)
+
+            # Ejecuciones incrementales sobre la capa ya escrita: sin cambios y con una fracción modificada
+            t_sin_cambios, (sin_cambios, _) = self._medir(incremental, contenido)
+            modificado = modificar_csv(contenido, self.fraccion_modificada)
+            t_modificado, (features_fusion, (nuevos, modificados, eliminados)) = self._medir(incremental, modificado)
+            fusion_correcta = features_fusion.features() == vectorizado.transformar_csv(modificado)
+            with open(vectorizado.output_path, 'r', encoding='utf-8') as f:
+                fusion_correcta = fusion_correcta and json.load(f)['features'] == features_fusion.features()
+
+            # El mismo CSV modificado reconstruyendo la capa completa (sin estado anterior)
+            os.remove(vectorizado.estado_path)
+            t_modificado_completo, _ = self._medir(incremental, modificado)
+
+            print("\nTransformación del CSV:")
+            print(f"  -> fila a fila (original) {t_original:8.2f} s   ({len(features_original)} incendios)")
+            print(f"  -> vectorizada (pandas)   {t_vectorizado:8.2f} s   ({len(features_vectorizado)} incendios, {identico})")
+            print(f"  -> Aceleración: {t_original / t_vectorizado:.1f}x")
+            print("\nEjecución completa (transformar + guardar la capa):")
+            print(f"  -> original, reescribiendo todo        {t_completa_original:8.2f} s")
+            print(f"  -> vectorizada, capa nueva             {t_completa:8.2f} s")
+            print(f"  -> incremental, CSV sin cambios        {t_sin_cambios:8.2f} s   "
+                  f"({'capa sin reescribir' if sin_cambios is None else 'REESCRITA'})")
+            print(f"  -> incremental, {self.fraccion_modificada:.0%} modificado         {t_modificado:8.2f} s   "
+                  f"({nuevos} nuevos, {modificados} modificados, {eliminados} eliminados, "
+                  f"{'igual a una transformación completa' if fusion_correcta else 'DISTINTA de una transformación completa'})")
+            print(f"  -> completa, {self.fraccion_modificada:.0%} modificado            {t_modificado_completo:8.2f} s   "
+                  f"(incremental {t_modificado_completo / t_modificado:.1f}x más rápida)")
+        finally:
+            shutil.rmtree(directorio, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    BenchmarkIncendios().ejecutar()
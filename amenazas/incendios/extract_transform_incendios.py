@@ -1,109 +1,357 @@
 import requests
-import csv
+import io
 import json
 import os
-from datetime import datetime, timezone
+import sys
+from collections import defaultdict
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..'))
+from comun.http_cache import ClienteHTTP
+
+# Arrays de incendios_filas.npz: huellas de las filas del CSV y, de cada incendio de la capa escrita, la
+# huella de su fila, su clave, su fecha y su largo en bytes, más el byte donde empieza el primero
+CLAVES_ESTADO = ('filas', 'capa_huellas', 'capa_claves', 'capa_fechas', 'capa_largos', 'capa_inicio')
+APERTURA_FEATURES = b'"features":['
+CIERRE_CAPA = b']}'
+
+
+class CapaIncendios:
+    """
+    Capa de incendios ordenada por fecha, guardada como el JSON ya serializado (bytes) de cada feature
+    junto a su clave (título y fecha de inicio), su fecha de inicio y la huella de la fila del CSV que lo
+    generó. Así la actualización incremental quita o inserta incendios sin decodificar ni volver a
+    serializar el resto de la capa.
+    """
+
+    def __init__(self, piezas, claves, fechas, huellas):
+        self.piezas = piezas
+        self.claves = claves
+        self.fechas = fechas
+        self.huellas = huellas
+        self.inicio = None  # Byte del archivo donde empieza el primer incendio (lo registra guardar_json)
+
+    @classmethod
+    def desde_features(cls, features, huellas):
+        codificador = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+        titulos = [f['properties']['titulo'] for f in features]
+        fechas = [f['properties']['fecha_inicio_utc'] for f in features]
+        return cls([codificador.encode(f).encode('utf-8') for f in features],
+                   IncendiosConafETL._hash_claves(titulos, fechas), np.array(fechas, dtype=str), huellas)
+
+    def features(self):
+        """Features decodificadas (para comparar con una transformación completa)."""
+        return [json.loads(pieza) for pieza in self.piezas]
+
+    def estado(self):
+        """Arrays de la capa escrita para incendios_filas.npz."""
+        return {'capa_huellas': self.huellas, 'capa_claves': self.claves, 'capa_fechas': self.fechas,
+                'capa_largos': np.fromiter((len(p) for p in self.piezas), dtype=np.int64, count=len(self.piezas)),
+                'capa_inicio': np.int64(self.inicio)}
 
 
 class IncendiosConafETL:
     """
     Automatiza la extracción de datos de incendios forestales desde el CSV
     público de CONAF en GitHub y los transforma a un archivo GeoJSON estandarizado,
-    ordenado por fecha.
+    ordenado por fecha. La capa existente se actualiza de forma incremental: solo se
+    transforman las filas del CSV nuevas o que cambiaron desde la ejecución anterior, y se quitan
+    los incendios cuyas filas ya no están, así la capa siempre refleja el CSV vigente. El resto de la
+    capa se copia del archivo existente sin volver a decodificarlo ni ordenarlo (ver CapaIncendios).
     """
 
     CSV_URL = "https://raw.githubusercontent.com/deigeprif/public/refs/heads/main/reporte/incendios.csv"
+    FORMATOS_FECHA = ('%b %d, %Y, %H:%M', '%Y-%m-%d %H:%M')  # Se prueban en este orden
 
     def __init__(self):
         self.output_dir = os.path.dirname(os.path.realpath(__file__))
         self.headers = {'User-Agent': 'ProyectoRuteoEconomico-ETL/1.0'}
+        self.client = ClienteHTTP(headers=self.headers)
+        self.output_path = os.path.join(self.output_dir, "amenaza_incendios.geojson")
+        # Huellas (hash) de las filas del CSV ya incorporadas a la capa y la clave del incendio de cada una
+        self.estado_path = os.path.join(self.output_dir, "incendios_filas.npz")
 
     def extraer_y_transformar(self):
         """
-        Extrae los datos del CSV, los procesa y los transforma a GeoJSON.
+        Extrae el CSV y transforma a GeoJSON solo las filas nuevas o modificadas (todas si no hay una capa
+        anterior). Retorna el resultado de transformar_incremental, o None si no se pudo descargar.
         """
         print("-> 1. Extrayendo y transformando datos de incendios desde el CSV de CONAF...")
-        features = []
         try:
-            with requests.get(self.CSV_URL, headers=self.headers, stream=True, timeout=30) as r:
-                r.raise_for_status()
-                lines = (line.decode('utf-8') for line in r.iter_lines())
-                csv_reader = csv.DictReader(lines)
-
-                for row in csv_reader:
-                    try:
-                        if not row.get('lat') or not row.get('lon'):
-                            continue
-
-                        fecha_str = row['f_inicio']
-                        fecha_obj = None
-                        try:
-                            fecha_obj = datetime.strptime(fecha_str, '%b %d, %Y, %H:%M')
-                        except ValueError:
-                            try:
-                                fecha_obj = datetime.strptime(fecha_str, '%Y-%m-%d %H:%M')
-                            except ValueError:
-                                continue
-
-                        fecha_iso = fecha_obj.replace(tzinfo=timezone.utc).isoformat()
-
-                        feature = {
-                            "type": "Feature",
-                            "properties": {
-                                "tipo_amenaza": "incendio_forestal",
-                                "fuente": "CONAF (GitHub)",
-                                "titulo": row.get('nombre'),
-                                "estado": row.get('estado'),
-                                "comuna": row.get('comuna'),
-                                "region": row.get('region'),
-                                "fecha_inicio_utc": fecha_iso,
-                                "superficie_ha": float(row['sup_total'].replace(',', '.')) if row.get(
-                                    'sup_total') else 0,
-                                "nivel_alerta": self._calcular_nivel_alerta(row.get('estado'))
-                            },
-                            "geometry": {
-                                "type": "Point",
-                                "coordinates": [
-                                    float(row['lon']),
-                                    float(row['lat'])
-                                ]
-                            }
-                        }
-                        features.append(feature)
-
-                    except (ValueError, KeyError, TypeError):
-                        continue
-
-            print(f"   -> Transformación completada: {len(features)} incendios procesados.")
-
-            # --- ORDENAMIENTO POR FECHA ---
-            # Ordenamos la lista de 'features' basándonos en la fecha de inicio.
-            print("   -> Ordenando incendios por fecha...")
-            features.sort(key=lambda item: item['properties']['fecha_inicio_utc'])
-            # --- FIN DE LA MODIFICACIÓN ---
-
-            return features
-
+            # Sin cambios en el CSV, GitHub responde 304 a la petición condicional y se usa la copia local
+            r = self.client.get(self.CSV_URL, timeout=30)
+            r.raise_for_status()
         except requests.exceptions.RequestException as e:
             print(f"   -> ERROR de red o HTTP al consultar el CSV: {e}")
             return None
 
+        return self.transformar_incremental(r.content)
+
+    def transformar_incremental(self, contenido):
+        """
+        Compara las filas del CSV (bytes) con las de la ejecución anterior y lleva la capa al mismo
+        resultado que una transformación completa: transforma solo las filas nuevas o modificadas y
+        quita de la capa los incendios de las filas que ya no están (borradas o corregidas en el CSV).
+
+        Retorna (capa, estado, (nuevos, modificados, eliminados)); capa (CapaIncendios) es None si no
+        cambió y estado guarda las huellas de todas las filas del CSV (más, al escribir la capa, la huella
+        de la fila, la clave, la fecha y el largo en bytes de cada incendio).
+        """
+        df = self._leer_csv(contenido)
+        huellas = self._huellas_filas(df)
+        anterior = self._leer_estado()
+        existentes = None
+        if anterior is not None:
+            filas_anteriores = anterior['filas']
+            nuevas = ~np.isin(huellas, filas_anteriores)
+            quitadas = ~np.isin(filas_anteriores, huellas)
+            print(f"   -> {nuevas.sum()} filas del CSV nuevas o modificadas y {quitadas.sum()} que ya no están.")
+            if not nuevas.any() and not quitadas.any():
+                return None, {**anterior, 'filas': huellas}, (0, 0, 0)
+            existentes = self._leer_capa(anterior)
+
+        if existentes is None:
+            # Sin ejecución anterior (o sin capa legible): la capa se arma completa
+            features, indice = self._transformar_filas(df)
+            print(f"   -> Transformación completada: {len(features)} incendios procesados (ordenados por fecha).")
+            return CapaIncendios.desde_features(features, huellas[indice]), {'filas': huellas}, (len(features), 0, 0)
+
+        features, indice = self._transformar_filas(df[nuevas])
+        capa, conteos = self.fusionar(existentes, features, indice, huellas)
+        print(f"   -> Transformación completada: {len(features)} incendios procesados (ordenados por fecha).")
+        return capa, {'filas': huellas}, conteos
+
+    @classmethod
+    def _huellas_filas(cls, df):
+        """
+        Hash de cada fila del CSV. Las filas idénticas reciben huellas distintas según su número de
+        aparición, para que borrar una de ellas también se detecte.
+        """
+        return cls._distinguir_repetidos(pd.util.hash_pandas_object(df, index=False).to_numpy())
+
+    @staticmethod
+    def _distinguir_repetidos(hashes):
+        """Combina cada hash con su número de aparición (la primera queda igual): los repetidos pasan a ser distintos."""
+        ocurrencia = pd.Series(hashes).groupby(hashes).cumcount().to_numpy().astype(np.uint64)
+        return hashes ^ (ocurrencia * np.uint64(0x9E3779B97F4A7C15))
+
+    @staticmethod
+    def _hash_claves(titulos, fechas):
+        """Hash de la clave (título, fecha de inicio) que identifica a cada incendio de la capa."""
+        claves = pd.DataFrame({"titulo": pd.Series(titulos, dtype=object), "fecha": pd.Series(fechas, dtype=object)})
+        return pd.util.hash_pandas_object(claves, index=False).to_numpy()
+
+    @staticmethod
+    def _leer_csv(contenido):
+        df = pd.read_csv(io.BytesIO(contenido), dtype=str, keep_default_na=False, encoding='utf-8')
+        # Los campos faltantes (filas cortas o columnas ausentes) quedan como None, igual que en csv.DictReader
+        return df.astype(object).where(df.notna(), None)
+
+    def transformar_csv(self, contenido):
+        """Transforma el CSV completo de CONAF (bytes) a features GeoJSON ordenadas por fecha de inicio."""
+        return self.transformar(self._leer_csv(contenido))
+
+    def transformar(self, df):
+        """
+        Transforma filas del CSV (DataFrame de textos) a features GeoJSON ordenadas por fecha de inicio,
+        operando sobre columnas completas. Como en el recorrido fila a fila original, se descartan las filas
+        sin coordenadas, con una fecha que no calza con ningún formato o con un número inválido.
+        """
+        return self._transformar_filas(df)[0]
+
+    def _transformar_filas(self, df):
+        """Como transformar(), pero retorna además el índice de la fila de 'df' que generó cada feature."""
+        def columna(nombre):
+            return df[nombre] if nombre in df else pd.Series(None, index=df.index, dtype=object)
+
+        longitud = pd.to_numeric(columna('lon'), errors='coerce')
+        latitud = pd.to_numeric(columna('lat'), errors='coerce')
+
+        texto_fecha = columna('f_inicio')
+        fecha = pd.to_datetime(texto_fecha, format=self.FORMATOS_FECHA[0], errors='coerce')
+        for formato in self.FORMATOS_FECHA[1:]:
+            # Cada formato siguiente se prueba solo en las filas que aún no tienen fecha
+            pendientes = fecha.isna()
+            fecha[pendientes] = pd.to_datetime(texto_fecha[pendientes], format=formato, errors='coerce')
+
+        # Superficie con coma decimal; vacía cuenta como 0
+        texto_superficie = columna('sup_total')
+        sin_superficie = texto_superficie.isna() | (texto_superficie == '')
+        superficie = pd.to_numeric(texto_superficie.str.replace(',', '.', regex=False), errors='coerce')
+        superficie = superficie.mask(sin_superficie, 0.0)
+
+        validas = longitud.notna() & latitud.notna() & fecha.notna() & superficie.notna()
+        orden = fecha[validas].sort_values(kind='stable').index
+
+        estado = columna('estado')
+        # Hay pocos estados distintos: el nivel se calcula una vez por estado y se reparte con sus códigos
+        codigos, estados_unicos = pd.factorize(estado.loc[orden], use_na_sentinel=False)
+        nivel = self._calcular_nivel_alerta(pd.Series(estados_unicos, dtype=object))[codigos]
+        fecha_iso = np.char.add(np.datetime_as_string(fecha.loc[orden].to_numpy(), unit='s'), '+00:00')
+
+        filas = zip(columna('nombre').loc[orden].tolist(), estado.loc[orden].tolist(),
+                    columna('comuna').loc[orden].tolist(), columna('region').loc[orden].tolist(),
+                    fecha_iso.tolist(), superficie.loc[orden].tolist(), nivel.tolist(),
+                    longitud.loc[orden].tolist(), latitud.loc[orden].tolist())
+        features = [
+            {
+                "type": "Feature",
+                "properties": {
+                    "tipo_amenaza": "incendio_forestal",
+                    "fuente": "CONAF (GitHub)",
+                    "titulo": titulo,
+                    "estado": estado_fila,
+                    "comuna": comuna,
+                    "region": region,
+                    "fecha_inicio_utc": fecha_fila,
+                    "superficie_ha": superficie_fila,
+                    "nivel_alerta": nivel_fila
+                },
+                "geometry": {
+                    "type": "Point",
+                    "coordinates": [lon, lat]
+                }
+            }
+            for titulo, estado_fila, comuna, region, fecha_fila, superficie_fila, nivel_fila, lon, lat in filas
+        ]
+        return features, orden.to_numpy()
+
+
     def _calcular_nivel_alerta(self, estado):
-        if not estado: return 'indefinido'
-        estado_lower = estado.lower()
-        if 'en combate' in estado_lower:
-            return 'rojo'
-        elif 'controlado' in estado_lower:
-            return 'amarillo'
-        elif 'extinguido' in estado_lower:
-            return 'verde'
-        else:
-            return 'gris'
+        """Nivel de alerta de cada fila según el texto de su estado (Series -> array)."""
+        estado_lower = estado.fillna('').str.lower()
+        return np.select(
+            [estado.isna() | (estado == ''),
+             estado_lower.str.contains('en combate', regex=False),
+             estado_lower.str.contains('controlado', regex=False),
+             estado_lower.str.contains('extinguido', regex=False)],
+            ['indefinido', 'rojo', 'amarillo', 'verde'],
+            default='gris'
+        )
+
+    def _leer_estado(self):
+        """
+        Estado de la ejecución anterior (ver transformar_incremental), o None si no hay una capa anterior
+        a la cual aplicar los cambios o el estado es de una versión que no describe la capa.
+        """
+        if not os.path.exists(self.output_path):
+            return None
+        try:
+            with np.load(self.estado_path) as estado:
+                return {clave: estado[clave] for clave in CLAVES_ESTADO}
+        except (IOError, ValueError, KeyError):
+            return None
 
-    def guardar_json(self, features):
-        if features is None:
+    def _guardar_estado(self, estado):
+        temporal = f"{self.estado_path}.tmp"
+        try:
+            with open(temporal, 'wb') as f:
+                np.savez(f, **estado)
+            os.replace(temporal, self.estado_path)
+        except IOError as e:
+            print(f"   -> Advertencia: No se pudo guardar el estado del CSV (la próxima vez se procesa completo). Error: {e}")
+
+    def _leer_capa(self, estado):
+        """
+        Capa existente como CapaIncendios, con el JSON de cada incendio cortado del archivo según los
+        largos del estado (sin decodificarlo), o None si el archivo no calza con el estado.
+        """
+        try:
+            with open(self.output_path, 'rb') as f:
+                contenido = f.read()
+        except FileNotFoundError:
+            return None
+        except IOError as e:
+            print(f"   -> Advertencia: No se pudo leer la capa existente, se reescribe completa. Error: {e}")
+            return None
+        largos = estado['capa_largos']
+        inicio = int(estado['capa_inicio'])
+        # Cada incendio empieza después del anterior y de su coma
+        inicios = inicio + np.concatenate(([0], np.cumsum(largos[:-1] + 1))) if len(largos) else largos
+        fin = inicio + int(largos.sum()) + max(len(largos) - 1, 0)
+        if contenido[fin:] != CIERRE_CAPA or contenido[inicio - len(APERTURA_FEATURES):inicio] != APERTURA_FEATURES:
+            print("   -> Advertencia: La capa existente no calza con el estado guardado, se reescribe completa.")
+            return None
+        vista = memoryview(contenido)
+        piezas = [bytes(vista[a:a + n]) for a, n in zip(inicios.tolist(), largos.tolist())]
+        return CapaIncendios(piezas, estado['capa_claves'], estado['capa_fechas'], estado['capa_huellas'])
+
+    def fusionar(self, existentes, features, filas_features, huellas):
+        """
+        Aplica a la capa 'existentes' (CapaIncendios) los cambios del CSV. 'features' son los incendios de
+        las filas nuevas o modificadas, 'filas_features' su fila en el CSV y 'huellas' las de todas las
+        filas del CSV actual. Se quitan los incendios cuya fila ya no está; el resto conserva su orden y no
+        se vuelve a serializar, y los nuevos se insertan por búsqueda binaria en su fecha y, a igual fecha,
+        por su fila en el CSV, el mismo orden de una transformación completa. Solo si el CSV cambió el
+        orden de filas con la misma fecha se reordena la capa.
+
+        Un incendio nuevo con la clave (título y fecha) de uno quitado cuenta como modificado si su
+        contenido cambió; los demás, como nuevos o eliminados.
+        Retorna (capa, (nuevos, modificados, eliminados)), con capa None si no cambió.
+        """
+        nuevas = CapaIncendios.desde_features(features, huellas[filas_features])
+        conservar = np.isin(existentes.huellas, huellas)
+        quitados = np.flatnonzero(~conservar)
+        if not len(nuevas.piezas) and not len(quitados):
+            return None, (0, 0, 0)
+
+        quitados_por_clave = defaultdict(list)
+        for posicion, clave in zip(quitados.tolist(), existentes.claves[quitados].tolist()):
+            quitados_por_clave[clave].append(posicion)
+        reemplazados = modificados = 0
+        for pieza, clave in zip(nuevas.piezas, nuevas.claves.tolist()):
+            if quitados_por_clave[clave]:
+                reemplazados += 1
+                modificados += existentes.piezas[quitados_por_clave[clave].pop()] != pieza
+        conteos = (len(nuevas.piezas) - reemplazados, modificados, len(quitados) - reemplazados)
+
+        indices = np.flatnonzero(conservar)
+        piezas = [existentes.piezas[i] for i in indices.tolist()] if len(quitados) else existentes.piezas
+        huellas_capa, claves, fechas = (existentes.huellas[indices], existentes.claves[indices],
+                                        existentes.fechas[indices])
+        # Fila actual del CSV de cada incendio conservado (sus huellas siguen en el CSV)
+        orden_csv = np.argsort(huellas)
+        filas = orden_csv[np.searchsorted(huellas, huellas_capa, sorter=orden_csv)]
+        en_orden = (fechas[1:] > fechas[:-1]) | ((fechas[1:] == fechas[:-1]) & (filas[1:] > filas[:-1]))
+        if not en_orden.all():
+            orden = np.lexsort((filas, fechas))
+            piezas = [piezas[i] for i in orden.tolist()]
+            huellas_capa, claves, fechas, filas = huellas_capa[orden], claves[orden], fechas[orden], filas[orden]
+
+        # Lugar de cada incendio nuevo entre los conservados, en orden de (fecha, fila del CSV)
+        filas_nuevas = np.asarray(filas_features, dtype=np.int64)
+        orden = np.lexsort((filas_nuevas, nuevas.fechas))
+        filas_nuevas = filas_nuevas[orden]
+        fechas_nuevas = nuevas.fechas[orden]
+        lugares = np.searchsorted(fechas, fechas_nuevas, side='left')
+        hasta = np.searchsorted(fechas, fechas_nuevas, side='right')
+        for k in np.flatnonzero(hasta > lugares).tolist():
+            lugares[k] += np.searchsorted(filas[lugares[k]:hasta[k]], filas_nuevas[k])
+
+        capa = []
+        anterior = 0
+        for lugar, i in zip(lugares.tolist(), orden.tolist()):
+            capa.extend(piezas[anterior:lugar])
+            capa.append(nuevas.piezas[i])
+            anterior = lugar
+        capa.extend(piezas[anterior:])
+        # Mismo tipo para las fechas conservadas y las nuevas (np.insert convierte al tipo del array)
+        fechas = fechas.astype(np.result_type(fechas, nuevas.fechas))
+        capa = CapaIncendios(capa, np.insert(claves, lugares, nuevas.claves[orden]),
+                             np.insert(fechas, lugares, fechas_nuevas),
+                             np.insert(huellas_capa, lugares, nuevas.huellas[orden]))
+        return capa, conteos
+
+    def guardar_json(self, capa):
+        """
+        Escribe la capa completa (CapaIncendios) y registra en ella dónde empiezan sus incendios.
+        Retorna False si no se pudo guardar.
+        """
+        if capa is None:
             print("-> No se generaron datos para guardar.")
-            return
+            return False
 
         feature_collection = {
             "type": "FeatureCollection",
@@ -111,25 +359,50 @@ class IncendiosConafETL:
                 "generado": datetime.now().isoformat(),
                 "fuente_datos": self.CSV_URL,
                 "descripcion": "Incendios forestales de la temporada actual reportados por CONAF."
-            },
-            "features": features
+            }
         }
+        # Mismo documento que json.dumps con "features" al final, armado con el JSON ya serializado de
+        # cada incendio: los que no cambiaron se copian tal cual desde la capa anterior
+        cabecera = json.dumps(feature_collection, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        cabecera = cabecera[:-1] + b',' + APERTURA_FEATURES
 
-        output_path = os.path.join(self.output_dir, "amenaza_incendios.geojson")
+        temporal = f"{self.output_path}.tmp"
         try:
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(feature_collection, f, indent=2, ensure_ascii=False)
+            with open(temporal, 'wb') as f:
+                f.write(cabecera + b','.join(capa.piezas) + CIERRE_CAPA)
+            os.replace(temporal, self.output_path)
+            capa.inicio = len(cabecera)
             print(f"-> 2. Archivo 'amenaza_incendios.geojson' guardado exitosamente.")
+            return True
         except IOError as e:
             print(f"   -> ERROR al guardar el archivo: {e}")
+            return False
+
+    def actualizar_capa(self, capa, estado, conteos):
+        """Guarda la capa si cambió y registra las filas del CSV ya incorporadas."""
+        if capa is None:
+            print("-> 2. Sin incendios nuevos, modificados ni eliminados: la capa existente sigue vigente.")
+        else:
+            print("   -> {} incendios nuevos, {} modificados y {} eliminados.".format(*conteos))
+            if not self.guardar_json(capa):
+                return False
+            estado = {**estado, **capa.estado()}
+        self._guardar_estado(estado)
+        return True
 
     def ejecutar(self):
+        """Actualiza la capa de incendios. Retorna True si la capa quedó al día."""
         print("\n--- Iniciando Proceso ETL para Amenaza de Incendios (Fuente: CONAF CSV) ---")
         datos_transformados = self.extraer_y_transformar()
-        self.guardar_json(datos_transformados)
+        if datos_transformados is None:
+            actualizada = self.guardar_json(None)
+        else:
+            actualizada = self.actualizar_capa(*datos_transformados)
         print("--- Proceso Finalizado ---\n")
+        return actualizada
 
 
 if __name__ == "__main__":
     etl_incendios = IncendiosConafETL()
-    etl_incendios.ejecutar()
\ No newline at end of file
+    if not etl_incendios.ejecutar():
+        sys.exit(1)
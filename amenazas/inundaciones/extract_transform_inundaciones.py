@@ -1,9 +1,14 @@
 import requests
 import json
 import os
+import sys
 from datetime import datetime, timezone
 import urllib3
 
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..'))
+from comun.arcgis import ClienteArcGIS
+from comun.http_cache import ClienteHTTP
+
 # --- ADVERTENCIA DE SEGURIDAD ---
 # La siguiente línea deshabilita los warnings de seguridad para conexiones SSL.
 # Se usa porque el servidor del MOP puede tener un certificado que no es validado
@@ -17,49 +22,47 @@ class InundacionesETL:
     servicio MapServer de la DGA a un archivo GeoJSON estandarizado.
     """
 
-    API_URL = "https://rest-sit.mop.gob.cl/arcgis/rest/services/DGA/ALERTAS/MapServer/0/query"
+    API_URL = "https://rest-sit.mop.gob.cl/arcgis/rest/services/DGA/ALERTAS/MapServer/0"
+    # Solo los atributos que usa la transformación
+    CAMPOS = ["NOMBRE_ESTACION", "RIO", "REGION", "ESTADO_ALERTA", "CAUDAL", "FECHA_REGISTRO"]
 
     def __init__(self):
         self.output_dir = os.path.dirname(os.path.realpath(__file__))
         self.headers = {'User-Agent': 'ProyectoRuteoEconomico-ETL/1.0'}
+        self.client = ClienteHTTP(headers=self.headers)
+        # Se usa verify=False debido a problemas con el certificado SSL del servidor del MOP.
+        self.arcgis = ClienteArcGIS(self.API_URL, self.CAMPOS, cliente_http=self.client, verify=False)
 
     def extraer_alertas(self):
         """
-        Extrae los datos crudos de las alertas hidrológicas desde la API de la DGA.
+        Extrae las alertas hidrológicas desde la API de la DGA como GeoJSON, todas las
+        páginas de la capa (el servidor limita los registros por consulta).
         """
         print("-> 1. Extrayendo datos de alertas hidrológicas desde la API de la DGA...")
-        params = {
-            'where': '1=1',  # Traer todos los registros
-            'outFields': '*',  # Traer todos los campos
-            'f': 'json',  # Formato de salida
-            'returnGeometry': 'true'  # Incluir las coordenadas
-        }
         try:
-            # Se usa verify=False debido a problemas con el certificado SSL del servidor del MOP.
-            response = requests.get(self.API_URL, params=params, headers=self.headers, timeout=30, verify=False)
-            response.raise_for_status()
-            alertas_data = response.json()
-
-            num_alertas = len(alertas_data.get('features', []))
-            print(f"   -> Extracción exitosa: Se encontraron {num_alertas} alertas.")
-            return alertas_data
+            features = self.arcgis.consultar()
+            print(f"   -> Extracción exitosa: Se encontraron {len(features)} alertas.")
+            return {"type": "FeatureCollection", "features": features}
 
         except requests.exceptions.RequestException as e:
             print(f"   -> ERROR de red o HTTP al consultar la API de la DGA: {e}")
         except json.JSONDecodeError:
             print("   -> ERROR: La respuesta de la API de la DGA no es un JSON válido.")
+        except ValueError as e:
+            print(f"   -> ERROR en la consulta a la API de la DGA: {e}")
         return None
 
     def transformar_a_geojson(self, alertas_crudas):
         """
-        Transforma los datos crudos de formato ArcGIS a un GeoJSON FeatureCollection estándar.
+        Transforma las features de ArcGIS (GeoJSON con los atributos originales) al GeoJSON
+        FeatureCollection estandarizado de amenazas.
         """
         print("-> 2. Transformando alertas a formato GeoJSON...")
         features = []
         for alerta in alertas_crudas.get('features', []):
             try:
-                attrs = alerta.get('attributes', {})
-                geom = alerta.get('geometry', {})
+                attrs = alerta.get('properties') or {}
+                geom = alerta.get('geometry') or {}
 
                 # Los timestamps de ArcGIS a menudo vienen en milisegundos desde la época Unix
                 timestamp_ms = attrs.get('FECHA_REGISTRO')
@@ -83,7 +86,7 @@ class InundacionesETL:
                     },
                     "geometry": {
                         "type": "Point",
-                        "coordinates": [geom.get('x'), geom.get('y')]
+                        "coordinates": geom['coordinates'][:2]
                     }
                 }
                 features.append(feature)
@@ -125,19 +128,24 @@ class InundacionesETL:
             with open(output_path, 'w', encoding='utf-8') as f:
                 json.dump(data_geojson, f, indent=2, ensure_ascii=False)
             print(f"-> 3. Archivo 'amenaza_inundaciones.geojson' guardado exitosamente.")
+            return True
         except IOError as e:
             print(f"   -> ERROR al guardar el archivo: {e}")
+            return False
 
     def ejecutar(self):
-        """Orquesta el proceso completo de Extracción, Transformación y Guardado."""
+        """Orquesta el proceso completo de Extracción, Transformación y Guardado. Retorna True si se guardó la capa."""
         print("\n--- Iniciando Proceso ETL para Amenaza de Inundaciones ---")
         datos_crudos = self.extraer_alertas()
+        guardado = False
         if datos_crudos:
             datos_geojson = self.transformar_a_geojson(datos_crudos)
-            self.guardar_json(datos_geojson)
+            guardado = self.guardar_json(datos_geojson)
         print("--- Proceso Finalizado ---\n")
+        return guardado
 
 
 if __name__ == "__main__":
     etl_inundaciones = InundacionesETL()
-    etl_inundaciones.ejecutar()
\ No newline at end of file
+    if not etl_inundaciones.ejecutar():
+        sys.exit(1)
\ No newline at end of file
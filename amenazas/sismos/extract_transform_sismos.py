@@ -1,10 +1,17 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
 import json
 import os
+import sys
 from datetime import datetime
 from urllib.parse import urljoin
-import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..'))
+from comun import metricas
+from comun.http_cache import ClienteHTTP
 
 
 class SismosWebScraperETL:
@@ -15,16 +22,49 @@ class SismosWebScraperETL:
 
     BASE_URL = "https://www.sismologia.cl/"
     MIN_MAGNITUDE = 3.5  # Filtro para sismos relevantes
+    DETAIL_MAX_AGE = 30 * 24 * 3600  # El detalle de un sismo ya informado no cambia: se reutiliza 30 días
+    DETAIL_CONCURRENCY = 4  # Páginas de detalle descargadas a la vez (y conexiones keep-alive del pool)
 
     def __init__(self):
         self.output_dir = os.path.dirname(os.path.realpath(__file__))
+        # Coordenadas ya resueltas por URL de detalle: en la siguiente ejecución solo se consultan los sismos nuevos
+        self.events_path = os.path.join(self.output_dir, "sismos_resueltos.json")
         self.headers = {'User-Agent': 'ProyectoRuteoEconomico-Scraper/1.0'}
+        # Una sola sesión para todos los hilos, con una conexión por hilo y reintentos ante 429/5xx
+        session = requests.Session()
+        retry = Retry(total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods=["GET"], respect_retry_after_header=True)
+        adapter = HTTPAdapter(pool_connections=self.DETAIL_CONCURRENCY, pool_maxsize=self.DETAIL_CONCURRENCY,
+                              max_retries=retry)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        self.client = ClienteHTTP(session=session, headers=self.headers)
+
+    def _load_events(self):
+        """Lee las coordenadas resueltas en ejecuciones anteriores ({detalle_url: {latitud, longitud}})."""
+        try:
+            with open(self.events_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (IOError, ValueError) as e:
+            print(f"   -> Advertencia: No se pudo leer '{os.path.basename(self.events_path)}', se reconstruye. Error: {e}")
+            return {}
+
+    def _save_events(self, events):
+        temporal = f"{self.events_path}.tmp"
+        try:
+            with open(temporal, 'w', encoding='utf-8') as f:
+                json.dump(events, f, ensure_ascii=False)
+            os.replace(temporal, self.events_path)
+        except IOError as e:
+            print(f"   -> Advertencia: No se pudo guardar '{os.path.basename(self.events_path)}'. Error: {e}")
 
     def _scrape_main_page(self):
         """Extrae la lista inicial de sismos desde la tabla principal."""
         print("-> 1. Extrayendo tabla de sismos desde la página principal...")
         try:
-            response = requests.get(self.BASE_URL, headers=self.headers, timeout=10)
+            response = self.client.get(self.BASE_URL, timeout=10)
             response.raise_for_status()
 
             soup = BeautifulSoup(response.content, 'html.parser')
@@ -69,7 +109,7 @@ class SismosWebScraperETL:
     def _scrape_detail_page(self, url):
         """Extrae las coordenadas de la página de detalle de un sismo."""
         try:
-            response = requests.get(url, headers=self.headers, timeout=10)
+            response = self.client.get(url, max_edad=self.DETAIL_MAX_AGE, timeout=10)
             response.raise_for_status()
             soup = BeautifulSoup(response.content, 'html.parser')
             table = soup.find('table', class_='sismologia informe')
@@ -92,20 +132,36 @@ class SismosWebScraperETL:
             return None
 
     def ejecutar(self):
-        """Orquesta el proceso completo de Extracción y Transformación."""
+        """Orquesta el proceso completo de Extracción y Transformación. Retorna True si se guardó la capa."""
         print("\n--- Iniciando Proceso ETL (Web Scraping) para Amenaza de Sismos ---")
         sismos_base = self._scrape_main_page()
         if not sismos_base:
             print("--- Proceso Finalizado: No se extrajeron datos. ---")
-            return
+            return False
 
         print("-> 2. Enriqueciendo datos con coordenadas de páginas de detalle...")
-        features = []
-        for i, sismo in enumerate(sismos_base):
-            if not sismo['detalle_url']: continue
+        known = self._load_events()
+        pending = list(dict.fromkeys(sismo['detalle_url'] for sismo in sismos_base
+                                     if sismo['detalle_url'] and sismo['detalle_url'] not in known))
+        resolved = sum(1 for sismo in sismos_base if sismo['detalle_url'] in known)
+        print(f"   -> {resolved} sismos ya resueltos, {len(pending)} nuevos por consultar.")
+        if pending:
+            with ThreadPoolExecutor(max_workers=self.DETAIL_CONCURRENCY) as executor:
+                results = executor.map(metricas.propagar(self._scrape_detail_page), pending)
+                for i, (url, coords) in enumerate(zip(pending, results), start=1):
+                    print(f"   -> Procesando sismo {i}/{len(pending)}...", end='\r')
+                    # Solo se recuerdan los detalles completos; los fallidos se reintentan la próxima vez
+                    if coords and 'latitud' in coords and 'longitud' in coords:
+                        known[url] = coords
+            print()
+
+        # Se conservan solo los sismos que siguen en la tabla, así el archivo no crece sin límite
+        vigentes = {sismo['detalle_url'] for sismo in sismos_base}
+        self._save_events({url: coords for url, coords in known.items() if url in vigentes})
 
-            print(f"   -> Procesando sismo {i + 1}/{len(sismos_base)}...", end='\r')
-            coords = self._scrape_detail_page(sismo['detalle_url'])
+        features = []
+        for sismo in sismos_base:
+            coords = known.get(sismo['detalle_url'])
 
             if coords and 'latitud' in coords and 'longitud' in coords:
                 feature = {
@@ -127,9 +183,7 @@ class SismosWebScraperETL:
                 }
                 features.append(feature)
 
-            time.sleep(0.5)
-
-        print("\n   -> Transformación completada.")
+        print("   -> Transformación completada.")
 
         feature_collection = {
             "type": "FeatureCollection",
@@ -144,10 +198,13 @@ class SismosWebScraperETL:
             print(f"-> 3. Archivo 'amenaza_sismos.geojson' guardado con {len(features)} sismos.")
         except IOError as e:
             print(f"   -> ERROR al guardar el archivo: {e}")
+            return False
 
         print("--- Proceso Finalizado ---\n")
+        return True
 
 
 if __name__ == "__main__":
     etl = SismosWebScraperETL()
-    etl.ejecutar()
\ No newline at end of file
+    if not etl.ejecutar():
+        sys.exit(1)
\ No newline at end of file
@@ -1,8 +1,10 @@
 import requests
-import json
 import os
+import sys
 from dotenv import load_dotenv
-from datetime import datetime
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..'))
+from comun.artefactos import AlmacenArtefactos
 
 
 class ExtractorCongestion:
@@ -18,6 +20,7 @@ class ExtractorCongestion:
 
         self.api_url = "https://maps.googleapis.com/maps/api/directions/json"
         self.output_dir = os.path.dirname(os.path.realpath(__file__))
+        self.almacen_crudos = AlmacenArtefactos(self.output_dir, "raw_congestion")
 
         # Lista de tramos de ruta representativos para analizar en Santiago.
         # Puedes añadir, modificar o quitar los que estimes convenientes.
@@ -37,6 +40,7 @@ class ExtractorCongestion:
     def extraer(self):
         """
         Itera sobre los segmentos, consulta la API de Google y guarda los resultados crudos.
+        Retorna True si se guardaron, False si ningún tramo respondió o no se pudo guardar.
         """
         print(f"Iniciando extracción de datos de congestión para {len(self.segmentos)} tramos...")
         resultados_crudos = []
@@ -66,22 +70,23 @@ class ExtractorCongestion:
             except requests.exceptions.RequestException as e:
                 print(f"  -> Error de red al consultar el tramo '{segmento['nombre']}': {e}")
 
-        self.guardar_json(resultados_crudos)
+        if not resultados_crudos:
+            print("Error: Ningún tramo devolvió datos de congestión; no se guardó un archivo crudo.")
+            return False
+        return self.guardar_json(resultados_crudos)
 
     def guardar_json(self, data):
-        """Guarda los datos crudos en un archivo JSON con timestamp."""
-        timestamp_str = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        filename = f"raw_congestion_{timestamp_str}.json"
-        filepath = os.path.join(self.output_dir, filename)
-
+        """Guarda los datos crudos como JSON comprimido con timestamp ('raw_congestion_<fecha>.json.gz')."""
         try:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            filepath = self.almacen_crudos.guardar_crudo(data)
             print(f"\nDatos crudos de congestión guardados en: {filepath}")
+            return True
         except IOError as e:
             print(f"Error al guardar el archivo JSON: {e}")
+            return False
 
 
 if __name__ == "__main__":
     extractor = ExtractorCongestion()
-    extractor.extraer()
\ No newline at end of file
+    if not extractor.extraer():
+        sys.exit(1)
@@ -1,8 +1,10 @@
-import json
 import os
-import glob
+import sys
 from datetime import datetime
 
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..'))
+from comun.artefactos import AlmacenArtefactos, leer_crudo
+
 
 class TransformadorCongestion:
     """
@@ -12,33 +14,33 @@ class TransformadorCongestion:
 
     def __init__(self):
         self.script_dir = os.path.dirname(os.path.realpath(__file__))
+        self.almacen_crudos = AlmacenArtefactos(self.script_dir, "raw_congestion")
+        self.almacen_transformados = AlmacenArtefactos(self.script_dir, "transformed_congestion")
 
     def encontrar_ultimo_json_crudo(self):
-        """Encuentra el archivo raw_congestion_*.json más reciente."""
+        """Encuentra el archivo raw_congestion_* más reciente (según el puntero del almacén)."""
         try:
-            lista_de_archivos = glob.glob(os.path.join(self.script_dir, 'raw_congestion_*.json'))
-            if not lista_de_archivos: return None
-            return max(lista_de_archivos, key=os.path.getctime)
+            return self.almacen_crudos.ultima()
         except Exception as e:
             print(f"Error buscando archivo crudo: {e}")
             return None
 
     def transformar(self):
+        """Transforma el crudo más reciente. Retorna True si se guardó el archivo transformado, False si no."""
         print("--- Iniciando Proceso de Transformación de Datos de Congestión ---")
 
         archivo_crudo = self.encontrar_ultimo_json_crudo()
         if not archivo_crudo:
-            print("Error: No se encontró un archivo 'raw_congestion_*.json' para procesar.")
-            return
+            print("Error: No se encontró un archivo 'raw_congestion_*' para procesar.")
+            return False
 
         print(f"Procesando archivo: {os.path.basename(archivo_crudo)}")
 
         try:
-            with open(archivo_crudo, 'r', encoding='utf-8') as f:
-                datos_crudos = json.load(f)
-        except (json.JSONDecodeError, IOError) as e:
+            datos_crudos = leer_crudo(archivo_crudo)
+        except (ValueError, IOError) as e:
             print(f"Error al leer el archivo JSON crudo: {e}")
-            return
+            return False
 
         tramos_transformados = []
         fecha_medicion = datetime.now().isoformat()
@@ -73,21 +75,20 @@ class TransformadorCongestion:
                     f"  -> Advertencia: No se pudo procesar el tramo '{resultado.get('segmento_nombre', 'N/A')}' por falta de datos. Error: {e}")
 
         print(f"Transformación completada. Se procesaron {len(tramos_transformados)} tramos.")
-        self.guardar_json(tramos_transformados)
+        return self.guardar_json(tramos_transformados)
 
     def guardar_json(self, data):
-        timestamp_str = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        filename = f"transformed_congestion_{timestamp_str}.json"
-        filepath = os.path.join(self.script_dir, filename)
-
         try:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            # Formato según ETL_FORMATO_ARTEFACTOS; las versiones antiguas se borran según la retención
+            filepath, _ = self.almacen_transformados.guardar(data)
             print(f"Archivo transformado guardado exitosamente en: {filepath}")
+            return True
         except IOError as e:
             print(f"Error al guardar el archivo JSON transformado: {e}")
+            return False
 
 
 if __name__ == '__main__':
     transformador = TransformadorCongestion()
-    transformador.transformar()
\ No newline at end of file
+    if not transformador.transformar():
+        sys.exit(1)
@@ -0,0 +1,137 @@
+from concurrent.futures import ThreadPoolExecutor
+from comun import metricas
+from comun.http_cache import ClienteHTTP
+
+CONCURRENCIA_ARCGIS = 4  # Páginas pedidas a la vez al mismo servicio
+PRECISION_GEOMETRIA = 6  # Decimales de las coordenadas (~0,1 m), en vez de los ~15 que envía ArcGIS
+LIMITE_POR_DEFECTO = 1000  # maxRecordCount habitual, si la capa no lo informa
+
+
+class ClienteArcGIS:
+    """
+    Descarga completa de una capa de un MapServer/FeatureServer de ArcGIS ('.../MapServer/<id>').
+
+    Una sola consulta con 'outFields=*' se corta sin aviso en el 'maxRecordCount' del servidor y trae
+    todos los atributos. Este cliente lee el límite de la capa, cuenta los registros que cumplen el filtro
+    y pide las páginas en paralelo (con 'resultOffset', o por lotes de OBJECTID si la capa no soporta
+    paginación), solo con los campos indicados, en GeoJSON y con la precisión de geometría acotada.
+    Las peticiones pasan por ClienteHTTP, así que se revalidan contra su caché en disco.
+    """
+
+    def __init__(self, url_capa, campos, cliente_http=None, concurrencia=CONCURRENCIA_ARCGIS,
+                 precision=PRECISION_GEOMETRIA, **kwargs_peticion):
+        self.url_capa = url_capa.rstrip("/")
+        self.campos = list(campos)
+        self.cliente = cliente_http or ClienteHTTP()
+        self.concurrencia = concurrencia
+        self.precision = precision
+        # Argumentos para cada GET (ej. timeout, verify=False para el certificado del MOP)
+        self.kwargs_peticion = {"timeout": 30, **kwargs_peticion}
+
+    def _get(self, url, params):
+        respuesta = self.cliente.get(url, params=params, **self.kwargs_peticion)
+        respuesta.raise_for_status()
+        datos = respuesta.json()
+        # ArcGIS informa los errores con un 200 y un objeto 'error'
+        if isinstance(datos, dict) and "error" in datos:
+            error = datos["error"]
+            raise ValueError(f"ArcGIS respondió con un error {error.get('code')}: {error.get('message')} "
+                             f"{' '.join(error.get('details') or [])}".strip())
+        return datos
+
+    def _consultar(self, params):
+        return self._get(f"{self.url_capa}/query", params)
+
+    def informacion_capa(self):
+        """Metadatos de la capa: límite de registros por consulta, soporte de paginación y campo de OBJECTID."""
+        datos = self._get(self.url_capa, {"f": "json"})
+        campo_id = datos.get("objectIdField") or next(
+            (campo["name"] for campo in datos.get("fields") or [] if campo.get("type") == "esriFieldTypeOID"),
+            "OBJECTID")
+        return {
+            "limite": datos.get("maxRecordCount") or LIMITE_POR_DEFECTO,
+            "paginacion": bool((datos.get("advancedQueryCapabilities") or {}).get("supportsPagination")),
+            "campo_id": campo_id
+        }
+
+    def _params_features(self, where):
+        return {
+            "where": where,
+            "outFields": ",".join(self.campos),
+            "returnGeometry": "true",
+            "geometryPrecision": self.precision,
+            "outSR": 4326,
+            "f": "geojson"
+        }
+
+    def consultar(self, where="1=1"):
+        """Retorna todas las features (GeoJSON) que cumplen 'where', en el orden de su OBJECTID."""
+        info = self.informacion_capa()
+        limite = info["limite"]
+        params = self._params_features(where)
+
+        if info["paginacion"]:
+            total = self._consultar({"where": where, "returnCountOnly": "true", "f": "json"}).get("count", 0)
+            # Se ordena por OBJECTID para que las páginas no se solapen ni dejen huecos
+            paginas = [{**params, "orderByFields": info["campo_id"], "resultOffset": desplazamiento,
+                        "resultRecordCount": limite} for desplazamiento in range(0, total, limite)]
+        else:
+            ids = sorted(self._consultar({"where": where, "returnIdsOnly": "true", "f": "json"}).get("objectIds") or [])
+            total = len(ids)
+            paginas = [{**params, "where": "1=1", "objectIds": ",".join(map(str, ids[i:i + limite]))}
+                       for i in range(0, total, limite)]
+
+        with ThreadPoolExecutor(max_workers=self.concurrencia) as executor:
+            resultados = list(executor.map(metricas.propagar(self._consultar), paginas))
+
+        features = []
+        for pagina, resultado in zip(paginas, resultados):
+            recibidas = resultado.get("features") or []
+            esperadas = min(limite, total - len(features))
+            if len(recibidas) < esperadas or resultado.get("exceededTransferLimit") or \
+                    (resultado.get("properties") or {}).get("exceededTransferLimit"):
+                # El servidor aplicó un límite menor al informado: se completa la página por su cuenta
+                recibidas = self._completar_pagina(pagina, recibidas, esperadas, info["campo_id"])
+            features.extend(recibidas)
+        if len(features) != total:
+            print(f"   -> Advertencia: ArcGIS informó {total} registros pero se recibieron {len(features)}.")
+        return features
+
+    @staticmethod
+    def _id_feature(feature, campo_id):
+        """OBJECTID de una feature GeoJSON (en 'id', o en sus atributos si se pidió el campo)."""
+        atributos = feature.get("properties") or feature.get("attributes") or {}
+        return atributos.get(campo_id, feature.get("id"))
+
+    def _completar_pagina(self, pagina, recibidas, esperadas, campo_id):
+        """
+        Completa una página que el servidor cortó en un límite menor al informado: con 'resultOffset' pide
+        desde donde terminó; con un lote de OBJECTID vuelve a pedir los que faltan, en lotes del tamaño
+        que el servidor sí entregó, y deja la página en el orden del lote.
+        """
+        recibidas = list(recibidas)
+        if "resultOffset" in pagina:
+            while recibidas and len(recibidas) < esperadas:
+                siguiente = {**pagina, "resultOffset": pagina["resultOffset"] + len(recibidas),
+                             "resultRecordCount": esperadas - len(recibidas)}
+                nuevas = self._consultar(siguiente).get("features") or []
+                if not nuevas:
+                    break
+                recibidas.extend(nuevas)
+            return recibidas
+
+        ids_lote = [int(i) for i in pagina["objectIds"].split(",")]
+        limite_real = len(recibidas)
+        while recibidas and len(recibidas) < esperadas:
+            obtenidos = {self._id_feature(feature, campo_id) for feature in recibidas}
+            if None in obtenidos:
+                # Sin OBJECTID en la respuesta no se sabe cuáles faltan
+                break
+            faltantes = [i for i in ids_lote if i not in obtenidos][:limite_real]
+            nuevas = self._consultar({**pagina, "objectIds": ",".join(map(str, faltantes))}).get("features") or []
+            if not nuevas:
+                break
+            recibidas.extend(nuevas)
+        posiciones = {objectid: posicion for posicion, objectid in enumerate(ids_lote)}
+        recibidas.sort(key=lambda feature: posiciones.get(self._id_feature(feature, campo_id), len(posiciones)))
+        return recibidas
@@ -0,0 +1,353 @@
+import glob
+import gzip
+import itertools
+import json
+import os
+import time
+import zipfile
+from datetime import datetime
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Formato de los archivos intermedios entre transformación y carga (ver FORMATOS)
+FORMATO_POR_DEFECTO = os.getenv("ETL_FORMATO_ARTEFACTOS", "ndjson")
+
+CLAVE_METADATA = "__metadata__"
+
+# Retención de los artefactos con fecha (ver AlmacenArtefactos): se conservan las N versiones más
+# recientes y, si ETL_RETENER_DIAS es mayor que 0, además todas las de esos últimos días.
+RETENER_ARTEFACTOS = int(os.getenv("ETL_RETENER_ARTEFACTOS", "5"))
+RETENER_DIAS = float(os.getenv("ETL_RETENER_DIAS", "0"))
+
+# Compresión de las respuestas crudas de las APIs: 'gzip', 'zstd' (requiere el paquete zstandard) o 'ninguna'
+COMPRESION_CRUDOS = os.getenv("ETL_COMPRESION_CRUDOS", "gzip")
+COMPRESIONES = {"gzip": ".gz", "zstd": ".zst", "ninguna": ""}
+
+
+# --- JSON (formato original: un solo documento, se lee completo) ---
+
+def _escribir_json(ruta, registros, metadata, clave_registros):
+    registros = list(registros)
+    documento = {"metadata": metadata, clave_registros: registros} if clave_registros else registros
+    with open(ruta, "w", encoding="utf-8") as f:
+        json.dump(documento, f, ensure_ascii=False, indent=2)
+    return len(registros)
+
+
+def _leer_json(ruta, clave_registros):
+    with open(ruta, "r", encoding="utf-8") as f:
+        documento = json.load(f)
+    if clave_registros:
+        return documento.get("metadata"), iter(documento.get(clave_registros, []))
+    return None, iter(documento)
+
+
+# --- NDJSON (un registro por línea: se escribe y se lee de a uno) ---
+
+def _escribir_ndjson(ruta, registros, metadata, clave_registros):
+    total = 0
+    with open(ruta, "w", encoding="utf-8") as f:
+        if metadata is not None:
+            f.write(json.dumps({CLAVE_METADATA: metadata}, ensure_ascii=False) + "\n")
+        for registro in registros:
+            f.write(json.dumps(registro, ensure_ascii=False, separators=(",", ":")) + "\n")
+            total += 1
+    return total
+
+
+def _leer_ndjson(ruta, clave_registros):
+    f = open(ruta, "r", encoding="utf-8")
+    primera = f.readline()
+    metadata = None
+    if primera.startswith('{"' + CLAVE_METADATA + '"'):
+        metadata = json.loads(primera)[CLAVE_METADATA]
+        primera = None
+
+    def registros():
+        with f:
+            if primera and primera.strip():
+                yield json.loads(primera)
+            for linea in f:
+                if linea.strip():
+                    yield json.loads(linea)
+    return metadata, registros()
+
+
+# --- NPZ columnar (una columna por campo, con tipos binarios, en grupos de filas) ---
+# Los registros se guardan en grupos de FILAS_POR_GRUPO filas, como los row groups de Parquet: se escribe
+# y se lee de a un grupo, así la memoria depende del tamaño del grupo y no del total de registros.
+# En cada grupo, cada columna guarda un array 'estado' por fila (0 = valor, 1 = null, 2 = campo ausente) y
+# sus valores: números y booleanos como arrays de NumPy; textos (y campos anidados, como JSON) como un solo
+# bloque UTF-8 más los desplazamientos de cada fila, igual que las columnas de texto de Arrow.
+
+VALOR, NULO, AUSENTE = 0, 1, 2
+FILAS_POR_GRUPO = int(os.getenv("ETL_NPZ_FILAS_POR_GRUPO", "4096"))
+
+
+def _tipo_columna(valores):
+    presentes = [v for v in valores if v is not None]
+    if not presentes:
+        return "json"
+    tipos = {type(v) for v in presentes}
+    if tipos == {bool}:
+        return "bool"
+    if tipos == {int} and all(-2 ** 63 <= v < 2 ** 63 for v in presentes):
+        return "int"
+    if tipos <= {int, float}:
+        return "float"
+    if tipos == {str}:
+        return "texto"
+    return "json"
+
+
+def _columnas_grupo(registros, prefijo):
+    """Arrays de un grupo de registros (con nombres '<prefijo>c<i>_...') y su esquema [[columna, tipo], ...]."""
+    columnas = list(dict.fromkeys(clave for registro in registros for clave in registro))
+    arrays = {}
+    esquema = []
+    for i, columna in enumerate(columnas):
+        estado = np.array([(VALOR if registro.get(columna) is not None else NULO) if columna in registro
+                           else AUSENTE for registro in registros], dtype=np.uint8)
+        valores = [registro.get(columna) for registro in registros]
+        tipo = _tipo_columna(valores)
+        if tipo in ("bool", "int", "float"):
+            dtype = {"bool": np.bool_, "int": np.int64, "float": np.float64}[tipo]
+            relleno = {"bool": False, "int": 0, "float": np.nan}[tipo]
+            arrays[f"{prefijo}c{i}_valores"] = np.array([relleno if v is None else v for v in valores], dtype=dtype)
+        else:
+            textos = [("" if v is None else v) if tipo == "texto"
+                      else ("" if v is None else json.dumps(v, ensure_ascii=False, separators=(",", ":")))
+                      for v in valores]
+            codificados = [texto.encode("utf-8") for texto in textos]
+            desplazamientos = np.zeros(len(codificados) + 1, dtype=np.int64)
+            np.cumsum([len(c) for c in codificados], out=desplazamientos[1:])
+            arrays[f"{prefijo}c{i}_desplazamientos"] = desplazamientos
+            arrays[f"{prefijo}c{i}_datos"] = np.frombuffer(b"".join(codificados), dtype=np.uint8)
+        arrays[f"{prefijo}c{i}_estado"] = estado
+        esquema.append([columna, tipo])
+    return arrays, esquema
+
+
+def _escribir_npz(ruta, registros, metadata, clave_registros):
+    # Mismo contenedor que np.savez (un ZIP con un '.npy' por array, que np.load abre sin cambios), pero
+    # cada array se agrega al terminar su grupo en vez de juntar todos para una sola llamada
+    grupos = []
+    total = 0
+    with zipfile.ZipFile(ruta, "w", zipfile.ZIP_STORED, allowZip64=True) as archivo:
+        def agregar(nombre, array):
+            with archivo.open(f"{nombre}.npy", "w", force_zip64=True) as destino:
+                np.lib.format.write_array(destino, array, allow_pickle=False)
+
+        iterador = iter(registros)
+        while True:
+            grupo = list(itertools.islice(iterador, FILAS_POR_GRUPO))
+            if not grupo:
+                break
+            arrays, esquema = _columnas_grupo(grupo, f"g{len(grupos)}_")
+            for nombre, array in arrays.items():
+                agregar(nombre, array)
+            grupos.append({"columnas": esquema, "filas": len(grupo)})
+            total += len(grupo)
+        agregar("esquema", np.frombuffer(json.dumps({"grupos": grupos, "filas": total,
+                                                     "metadata": metadata}).encode("utf-8"), dtype=np.uint8))
+    return total
+
+
+def _leer_grupo_npz(archivo, prefijo, columnas_esquema, filas):
+    """Registros de un grupo: solo se decodifican sus columnas."""
+    columnas = []
+    for i, (nombre, tipo) in enumerate(columnas_esquema):
+        estado = archivo[f"{prefijo}c{i}_estado"]
+        if tipo in ("bool", "int", "float"):
+            valores = archivo[f"{prefijo}c{i}_valores"].tolist()
+        else:
+            datos = archivo[f"{prefijo}c{i}_datos"].tobytes()
+            desplazamientos = archivo[f"{prefijo}c{i}_desplazamientos"].tolist()
+            valores = [datos[a:b].decode("utf-8") for a, b in zip(desplazamientos, desplazamientos[1:])]
+            if tipo == "json":
+                valores = [json.loads(v) if v else None for v in valores]
+        columnas.append((nombre, estado.tolist(), valores))
+    for fila in range(filas):
+        registro = {}
+        for nombre, estado, valores in columnas:
+            if estado[fila] == VALOR:
+                registro[nombre] = valores[fila]
+            elif estado[fila] == NULO:
+                registro[nombre] = None
+        yield registro
+
+
+def _leer_npz(ruta, clave_registros):
+    archivo = np.load(ruta, allow_pickle=False)
+    esquema = json.loads(archivo["esquema"].tobytes().decode("utf-8"))
+    # Archivos anteriores a los grupos de filas: un solo grupo sin prefijo
+    grupos = esquema.get("grupos")
+    if grupos is None:
+        grupos = [{"columnas": esquema["columnas"], "filas": esquema["filas"], "prefijo": ""}]
+
+    def registros():
+        with archivo:
+            for g, grupo in enumerate(grupos):
+                yield from _leer_grupo_npz(archivo, grupo.get("prefijo", f"g{g}_"), grupo["columnas"], grupo["filas"])
+    return esquema["metadata"], registros()
+
+
+# formato -> (extensión, escribir, leer)
+FORMATOS = {
+    "json": (".json", _escribir_json, _leer_json),
+    "ndjson": (".ndjson", _escribir_ndjson, _leer_ndjson),
+    "npz": (".npz", _escribir_npz, _leer_npz),
+}
+
+
+def escribir_artefacto(ruta_base, registros, metadata=None, formato=None, clave_registros=None):
+    """
+    Escribe 'registros' (un iterable de diccionarios) en '<ruta_base>.<extensión del formato>'.
+    'clave_registros' solo se usa en el formato JSON, para anidar los registros junto a 'metadata'
+    como en los archivos originales (ej. {"metadata": ..., "estaciones": [...]}).
+    Retorna la ruta escrita y la cantidad de registros.
+    """
+    formato = formato or FORMATO_POR_DEFECTO
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato de artefacto desconocido: '{formato}'. Opciones: {', '.join(FORMATOS)}.")
+    extension, escribir, _ = FORMATOS[formato]
+    ruta = ruta_base + extension
+    temporal = f"{ruta}.tmp"
+    total = escribir(temporal, registros, metadata, clave_registros)
+    os.replace(temporal, ruta)
+    return ruta, total
+
+
+def leer_artefacto(ruta, clave_registros=None):
+    """
+    Abre un artefacto según su extensión. Retorna (metadata, registros), donde 'registros' es un
+    iterador: en NDJSON se lee del disco a medida que se recorre y en NPZ de a un grupo de filas.
+    """
+    for extension, _, leer in FORMATOS.values():
+        if ruta.endswith(extension):
+            return leer(ruta, clave_registros)
+    raise ValueError(f"Extensión de artefacto desconocida: '{ruta}'.")
+
+
+def buscar_artefacto(patron_base):
+    """Artefacto más reciente cuyo nombre sin extensión calza con 'patron_base' (glob), en cualquier formato."""
+    candidatos = [ruta for extension, _, _ in FORMATOS.values() for ruta in glob.glob(patron_base + extension)]
+    return max(candidatos, key=os.path.getmtime) if candidatos else None
+
+
+# --- Almacén de artefactos con fecha ---
+
+def leer_crudo(ruta):
+    """Lee una respuesta cruda guardada con AlmacenArtefactos.guardar_crudo (o un JSON sin comprimir)."""
+    if ruta.endswith(".gz"):
+        archivo = gzip.open(ruta, "rt", encoding="utf-8")
+    elif ruta.endswith(".zst"):
+        if zstandard is None:
+            raise ValueError(f"'{ruta}' está comprimido con zstd y el paquete 'zstandard' no está instalado.")
+        archivo = zstandard.open(ruta, "rt", encoding="utf-8")
+    else:
+        archivo = open(ruta, "r", encoding="utf-8")
+    with archivo:
+        return json.load(archivo)
+
+
+class AlmacenArtefactos:
+    """
+    Versiones con fecha de un mismo artefacto ('raw_combustibles', 'transformed_congestion'...) en un
+    directorio, guardadas como '<nombre>_<fecha>.<extensión>'. Cada versión se escribe a un temporal que
+    luego se renombra, y el archivo '<nombre>.ultimo' apunta a la más reciente: se reemplaza de forma
+    atómica al publicar, así que encontrarla no requiere listar el directorio y un lector nunca ve una
+    versión a medio escribir. Después de publicar se borran las versiones que quedan fuera de la retención.
+    """
+
+    def __init__(self, directorio, nombre, retener=None, retener_dias=None):
+        self.directorio = directorio
+        self.nombre = nombre
+        # Siempre se conserva al menos la versión actual
+        self.retener = max(1, RETENER_ARTEFACTOS if retener is None else retener)
+        self.retener_dias = RETENER_DIAS if retener_dias is None else retener_dias
+        self.puntero = os.path.join(directorio, f"{nombre}.ultimo")
+
+    def _nueva_ruta_base(self):
+        return os.path.join(self.directorio, f"{self.nombre}_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}")
+
+    def guardar(self, registros, metadata=None, formato=None, clave_registros=None):
+        """Guarda una nueva versión con escribir_artefacto y la publica. Retorna la ruta y la cantidad de registros."""
+        ruta, total = escribir_artefacto(self._nueva_ruta_base(), registros, metadata, formato, clave_registros)
+        self._publicar(ruta)
+        return ruta, total
+
+    def guardar_crudo(self, datos, compresion=None):
+        """Guarda una respuesta cruda como JSON comprimido ('<nombre>_<fecha>.json.gz') y la publica. Retorna la ruta."""
+        compresion = compresion or COMPRESION_CRUDOS
+        if compresion not in COMPRESIONES:
+            raise ValueError(f"Compresión desconocida: '{compresion}'. Opciones: {', '.join(COMPRESIONES)}.")
+        if compresion == "zstd" and zstandard is None:
+            print("Advertencia: el paquete 'zstandard' no está instalado, se comprime con gzip.")
+            compresion = "gzip"
+        contenido = json.dumps(datos, ensure_ascii=False).encode("utf-8")
+        # Sin fecha en la cabecera gzip: el mismo contenido da el mismo archivo (y el mismo hash en main.py)
+        if compresion == "gzip":
+            contenido = gzip.compress(contenido, mtime=0)
+        elif compresion == "zstd":
+            contenido = zstandard.ZstdCompressor().compress(contenido)
+        ruta = self._nueva_ruta_base() + ".json" + COMPRESIONES[compresion]
+        temporal = f"{ruta}.tmp"
+        with open(temporal, "wb") as f:
+            f.write(contenido)
+        os.replace(temporal, ruta)
+        self._publicar(ruta)
+        return ruta
+
+    def ultima(self):
+        """Ruta de la versión más reciente, o None si no hay ninguna."""
+        try:
+            with open(self.puntero, "r", encoding="utf-8") as f:
+                archivo = f.read().strip()
+        except FileNotFoundError:
+            archivo = ""
+        if archivo and os.path.exists(os.path.join(self.directorio, archivo)):
+            return os.path.join(self.directorio, archivo)
+        # Sin puntero (ej. archivos anteriores al almacén): se busca una vez y queda apuntada
+        versiones = self.versiones()
+        if not versiones:
+            return None
+        self._escribir_puntero(versiones[-1])
+        return versiones[-1]
+
+    def versiones(self):
+        """Versiones guardadas, de la más antigua a la más reciente (la fecha del nombre se ordena como texto)."""
+        return sorted(ruta for ruta in glob.glob(os.path.join(self.directorio, f"{self.nombre}_*"))
+                      if not ruta.endswith(".tmp"))
+
+    def aplicar_retencion(self):
+        """Borra las versiones fuera de la retención, nunca la actual. Retorna cuántas borró."""
+        versiones = self.versiones()
+        actual = self.ultima()
+        limite = time.time() - self.retener_dias * 24 * 60 * 60 if self.retener_dias > 0 else None
+        borradas = 0
+        for ruta in versiones[:-self.retener]:
+            if ruta == actual or (limite is not None and os.path.getmtime(ruta) >= limite):
+                continue
+            try:
+                os.remove(ruta)
+                borradas += 1
+            except OSError as e:
+                print(f"Advertencia: no se pudo borrar el artefacto antiguo '{ruta}': {e}")
+        return borradas
+
+    def _escribir_puntero(self, ruta):
+        temporal = f"{self.puntero}.tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            f.write(os.path.basename(ruta))
+        os.replace(temporal, self.puntero)
+
+    def _publicar(self, ruta):
+        self._escribir_puntero(ruta)
+        borradas = self.aplicar_retencion()
+        if borradas:
+            print(f"Retención: se borraron {borradas} versiones antiguas de '{self.nombre}'.")
@@ -0,0 +1,172 @@
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from comun import metricas
+from comun.arcgis import ClienteArcGIS
+from comun.http_cache import ClienteHTTP
+
+RUTA_CAPA = "/arcgis/rest/services/PRUEBA/Capa/MapServer/0"
+CAMPOS = ["OBJECTID", "Nombre", "Posicion", "Contrato"]
+
+
+class MapServerSimulado:
+    """
+    Capa de ArcGIS en memoria que responde como un MapServer: informa su maxRecordCount, corta las
+    consultas en ese límite (con 'exceededTransferLimit'), y soporta returnCountOnly, returnIdsOnly,
+    objectIds, resultOffset/resultRecordCount, outFields, geometryPrecision y f=json/geojson.
+    Con 'limite_real' menor que 'limite' simula un servidor que informa un maxRecordCount pero corta las
+    respuestas antes, sin marcar 'exceededTransferLimit'.
+    """
+
+    def __init__(self, total, limite, paginacion=True, limite_real=None, semilla=0):
+        azar = random.Random(semilla)
+        self.limite = limite
+        self.limite_real = limite_real or limite
+        self.paginacion = paginacion
+        self.registros = []
+        for objectid in range(1, total + 1):
+            atributos = {"OBJECTID": objectid, "Nombre": f"Peaje {objectid}",
+                         "Posicion": azar.choice(["Troncal", "Lateral"]), "Contrato": f"Concesión {objectid % 37}"}
+            # Atributos que los scripts no usan, como los de las capas reales del MOP
+            atributos.update({f"Campo_{i}": f"valor {azar.random()}" for i in range(12)})
+            self.registros.append((atributos, azar.uniform(-76, -66), azar.uniform(-56, -17)))
+
+    def informacion(self):
+        return {"name": "Capa", "objectIdField": "OBJECTID", "maxRecordCount": self.limite,
+                "advancedQueryCapabilities": {"supportsPagination": self.paginacion},
+                "fields": [{"name": nombre, "type": "esriFieldTypeOID" if nombre == "OBJECTID" else "esriFieldTypeString"}
+                           for nombre in self.registros[0][0]]}
+
+    def consultar(self, params):
+        registros = self.registros
+        if params.get("objectIds"):
+            ids = {int(i) for i in params["objectIds"].split(",")}
+            registros = [r for r in registros if r[0]["OBJECTID"] in ids]
+        if params.get("returnCountOnly") == "true":
+            return {"count": len(registros)}
+        if params.get("returnIdsOnly") == "true":
+            return {"objectIdFieldName": "OBJECTID", "objectIds": [r[0]["OBJECTID"] for r in registros]}
+        if "resultOffset" in params:
+            if not self.paginacion:
+                return {"error": {"code": 400, "message": "Pagination is not supported.", "details": []}}
+            desplazamiento = int(params["resultOffset"])
+            registros = registros[desplazamiento:desplazamiento + int(params.get("resultRecordCount", self.limite))]
+        excedido = len(registros) > self.limite
+        registros = registros[:self.limite_real]
+
+        campos = params.get("outFields", "*")
+        precision = int(params["geometryPrecision"]) if "geometryPrecision" in params else None
+        features = []
+        for atributos, x, y in registros:
+            if campos != "*":
+                atributos = {campo: atributos[campo] for campo in campos.split(",")}
+            if precision is not None:
+                x, y = round(x, precision), round(y, precision)
+            if params.get("f") == "geojson":
+                features.append({"type": "Feature", "id": atributos.get("OBJECTID"), "properties": atributos,
+                                 "geometry": {"type": "Point", "coordinates": [x, y]}})
+            else:
+                features.append({"attributes": atributos, "geometry": {"x": x, "y": y}})
+        if params.get("f") == "geojson":
+            return {"type": "FeatureCollection", "features": features,
+                    "properties": {"exceededTransferLimit": excedido}}
+        return {"objectIdFieldName": "OBJECTID", "features": features, "exceededTransferLimit": excedido}
+
+
+def iniciar_servidor(capa, latencia):
+    class Manejador(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            time.sleep(latencia)
+            partes = urlsplit(self.path)
+            params = {clave: valores[0] for clave, valores in parse_qs(partes.query).items()}
+            if partes.path == RUTA_CAPA:
+                datos = capa.informacion()
+            elif partes.path == f"{RUTA_CAPA}/query":
+                datos = capa.consultar(params)
+            else:
+                self.send_error(404)
+                return
+            cuerpo = json.dumps(datos).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), Manejador)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+class BenchmarkArcGIS:
+    """
+    Compara, contra un MapServer simulado con latencia, la consulta única original ('outFields=*',
+    f=json) con ClienteArcGIS paginando por 'resultOffset' y por lotes de OBJECTID, también contra un
+    servidor que corta las respuestas antes de su maxRecordCount. Verifica que el cliente traiga todos
+    los registros, en orden y solo con los campos pedidos.
+    """
+
+    def __init__(self, total=5000, limite=1000, latencia=0.3):
+        self.total = total
+        self.limite = limite
+        self.latencia = latencia
+
+    def _medir(self, nombre, consulta):
+        with metricas.en_paso(nombre):
+            inicio = time.perf_counter()
+            features = consulta()
+            segundos = time.perf_counter() - inicio
+        contadores = metricas.contadores(nombre)
+        return segundos, features, contadores.get("peticiones_http", 0), contadores.get("bytes_descargados", 0)
+
+    def ejecutar(self):
+        print(f"--- Benchmark de extracción ArcGIS ({self.total} registros, maxRecordCount {self.limite}, "
+              f"latencia {self.latencia} s) ---")
+        directorio_cache = tempfile.mkdtemp(prefix="benchmark_arcgis_cache_")
+        resultados = {}
+        try:
+            # (nombre, paginación, límite que el servidor aplica de verdad)
+            escenarios = [("paginado (resultOffset)", True, None), ("lotes de OBJECTID", False, None),
+                          ("paginado, límite real menor", True, self.limite // 3),
+                          ("lotes, límite real menor", False, self.limite // 3)]
+            for nombre, paginacion, limite_real in escenarios:
+                capa = MapServerSimulado(self.total, self.limite, paginacion, limite_real)
+                servidor = iniciar_servidor(capa, self.latencia)
+                url = f"http://127.0.0.1:{servidor.server_address[1]}{RUTA_CAPA}"
+                # Directorio de caché distinto por medición, para que ninguna se sirva desde la anterior
+                cliente = ClienteHTTP(directorio=os.path.join(directorio_cache, nombre))
+                try:
+                    if not resultados:
+                        resultados["consulta única (original)"] = self._medir("original", lambda: cliente.get(
+                            f"{url}/query", params={"where": "1=1", "outFields": "*", "f": "json",
+                                                    "returnGeometry": "true"}, timeout=30).json()["features"])
+                    resultados[nombre] = self._medir(nombre, ClienteArcGIS(url, CAMPOS, cliente_http=cliente).consultar)
+                finally:
+                    servidor.shutdown()
+        finally:
+            shutil.rmtree(directorio_cache, ignore_errors=True)
+
+        print("\nResultados:")
+        esperados = list(range(1, self.total + 1))
+        for nombre, (segundos, features, peticiones, descargados) in resultados.items():
+            ids = [(f.get("properties") or f.get("attributes"))["OBJECTID"] for f in features]
+            campos = set().union(*((f.get("properties") or f.get("attributes")).keys() for f in features))
+            estado = "completo" if ids == esperados else f"INCOMPLETO ({len(ids)}/{self.total})"
+            print(f"  -> {nombre:<28} {segundos:6.2f} s  {peticiones:3d} peticiones  {descargados / 1024:8.1f} KB"
+                  f"  {len(campos):2d} campos  {estado}")
+
+
+if __name__ == "__main__":
+    BenchmarkArcGIS().ejecutar()
@@ -0,0 +1,112 @@
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from comun.artefactos import FORMATOS, escribir_artefacto, leer_artefacto
+
+DIRECTORIO_RAIZ = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+
+
+def estaciones_sinteticas(cantidad, semilla=0):
+    """Estaciones con la misma forma que 'transformed_combustibles_*' (no hay uno versionado en el repo)."""
+    azar = random.Random(semilla)
+    marcas = ["COPEC", "Shell", "Petrobras", "Aramco", "ENEX", None]
+    combustibles = ["gasolina_93", "gasolina_95", "gasolina_97", "petroleo_diesel", "glp_vehicular"]
+    estaciones = []
+    for i in range(cantidad):
+        estaciones.append({
+            "id_estacion_cne": f"co{100000 + i}",
+            "nombre": f"ESTACIÓN DE SERVICIO {i}",
+            "marca": azar.choice(marcas),
+            "direccion": f"AVENIDA {azar.randint(1, 500)} #{azar.randint(1, 9999)}",
+            "comuna": f"Comuna {azar.randint(1, 346)}",
+            "region": f"Región {azar.randint(1, 16)}",
+            "horario": "Lunes a Domingo 24 horas",
+            "latitud": round(azar.uniform(-56, -17), 6),
+            "longitud": round(azar.uniform(-76, -66), 6),
+            "precios": [{"tipo_combustible": tipo, "precio": azar.randint(900, 1600),
+                         "fecha_actualizacion": "2025-10-09T14:07:32"}
+                        for tipo in azar.sample(combustibles, azar.randint(1, len(combustibles)))]
+        })
+    return estaciones
+
+
+class BenchmarkArtefactos:
+    """
+    Compara los formatos de artefactos intermedios (ver comun/artefactos.py) con datos reales del repo:
+    tamaño en disco, tiempo de escritura, tiempo de lectura completa y memoria máxima al escribir desde un
+    iterador y al recorrer los registros como lo hacen los scripts de carga. Verifica además que cada
+    formato devuelva los mismos datos.
+    """
+
+    def __init__(self, repeticiones=3):
+        self.repeticiones = repeticiones
+
+    def _conjuntos(self):
+        with open(os.path.join(DIRECTORIO_RAIZ, 'metadata', 'vehiculos', 'chileautos_data.json'), 'r',
+                  encoding='utf-8') as f:
+            yield "chileautos_data", json.load(f), None
+        with open(os.path.join(DIRECTORIO_RAIZ, 'metadata', 'vehiculos', 'metadata_vehiculos.json'), 'r',
+                  encoding='utf-8') as f:
+            yield "metadata_vehiculos", json.load(f), None
+        with open(os.path.join(DIRECTORIO_RAIZ, 'metadata', 'peajes', 'peajes_enriquecidos.json'), 'r',
+                  encoding='utf-8') as f:
+            yield "peajes_enriquecidos", json.load(f), None
+        estaciones = estaciones_sinteticas(20000)
+        yield "combustibles (sintético)", estaciones, {"total_estaciones_procesadas": len(estaciones)}
+
+    def _medir(self, directorio, formato, registros, metadata):
+        ruta_base = os.path.join(directorio, f"artefacto_{formato}")
+        escritura = lectura = float('inf')
+        for _ in range(self.repeticiones):
+            inicio = time.perf_counter()
+            ruta, _ = escribir_artefacto(ruta_base, registros, metadata, formato=formato, clave_registros="registros")
+            escritura = min(escritura, time.perf_counter() - inicio)
+
+            inicio = time.perf_counter()
+            metadata_leida, iterador = leer_artefacto(ruta, clave_registros="registros")
+            leidos = list(iterador)
+            lectura = min(lectura, time.perf_counter() - inicio)
+        identico = leidos == registros and metadata_leida == metadata
+
+        # Memoria al escribir desde un iterador, como los transformadores que generan los registros
+        tracemalloc.start()
+        escribir_artefacto(ruta_base, iter(registros), metadata, formato=formato, clave_registros="registros")
+        memoria_escritura = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        # Memoria al recorrer sin acumular, como los cargadores
+        tracemalloc.start()
+        _, iterador = leer_artefacto(ruta, clave_registros="registros")
+        for _ in iterador:
+            pass
+        memoria = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return os.path.getsize(ruta), escritura, lectura, memoria_escritura, memoria, identico
+
+    def ejecutar(self):
+        print(f"--- Benchmark de formatos de artefactos intermedios (mejor de {self.repeticiones}) ---")
+        directorio = tempfile.mkdtemp(prefix='benchmark_artefactos_')
+        try:
+            for nombre, registros, metadata in self._conjuntos():
+                print(f"\n{nombre}: {len(registros)} registros")
+                resultados = {formato: self._medir(directorio, formato, registros, metadata) for formato in FORMATOS}
+                tamano_json = resultados["json"][0]
+                for formato, (tamano, escritura, lectura, memoria_escritura, memoria, identico) in resultados.items():
+                    print(f"  -> {formato:<7} {tamano / 1024:9.1f} KB ({tamano / tamano_json:5.0%})"
+                          f"   escritura {escritura * 1000:7.1f} ms   lectura {lectura * 1000:7.1f} ms"
+                          f"   memoria escritura {memoria_escritura / 1024 / 1024:6.1f} MB"
+                          f"   lectura {memoria / 1024 / 1024:6.1f} MB"
+                          f"   {'idéntico' if identico else 'DISTINTO'}")
+        finally:
+            shutil.rmtree(directorio, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    BenchmarkArtefactos().ejecutar()
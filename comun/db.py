@@ -0,0 +1,93 @@
+import os
+import threading
+from contextlib import contextmanager
+from psycopg2.extensions import cursor
+from psycopg2.pool import ThreadedConnectionPool
+from dotenv import load_dotenv
+from comun import metricas
+
+# Conexiones abiertas como máximo por proceso (al correr los pasos en proceso, las comparten todos)
+MAX_CONEXIONES_POOL = int(os.getenv("DB_POOL_MAX", "8"))
+
+_pool = None
+_pool_lock = threading.Lock()
+# ThreadedConnectionPool lanza PoolError si se pide una conexión con todas prestadas: este semáforo
+# hace que los hilos que sobran esperen a que se devuelva una
+_cupos_pool = threading.BoundedSemaphore(MAX_CONEXIONES_POOL)
+
+
+class CursorMedido(cursor):
+    """
+    Cursor que suma a las métricas del paso actual las filas de cada sentencia, según el estado que
+    informa PostgreSQL ('SELECT 10', 'INSERT 0 5', 'UPDATE 3'...): las de un SELECT como leídas y las
+    de INSERT/UPDATE/DELETE/COPY como escritas.
+    """
+
+    def _medir(self):
+        partes = (self.statusmessage or "").split()
+        if len(partes) < 2 or not partes[-1].isdigit():
+            return
+        if partes[0] == "SELECT":
+            metricas.sumar(filas_leidas=int(partes[-1]))
+        elif partes[0] in ("INSERT", "UPDATE", "DELETE", "COPY", "MERGE"):
+            metricas.sumar(filas_escritas=int(partes[-1]))
+
+    def execute(self, query, vars=None):
+        resultado = super().execute(query, vars)
+        self._medir()
+        return resultado
+
+    def executemany(self, query, vars_list):
+        # El estado solo refleja la última ejecución: se suman las filas de cada una
+        for vars in vars_list:
+            self.execute(query, vars)
+
+
+def configuracion_db():
+    """Parámetros de conexión a la base de datos desde el archivo .env."""
+    load_dotenv()
+    return {
+        "dbname": os.getenv("DB_NAME"),
+        "user": os.getenv("DB_USER"),
+        "password": os.getenv("DB_PASSWORD"),
+        "host": os.getenv("DB_HOST", "localhost"),
+        "port": os.getenv("DB_PORT", "5432")
+    }
+
+
+def _obtener_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadedConnectionPool(1, MAX_CONEXIONES_POOL, cursor_factory=CursorMedido, **configuracion_db())
+        return _pool
+
+
+@contextmanager
+def conexion():
+    """
+    Presta una conexión del pool del proceso, con la misma semántica que 'with psycopg2.connect(...)':
+    commit al salir sin errores y rollback si hay una excepción. Al terminar la conexión vuelve al pool
+    en vez de cerrarse, así los pasos del ETL que corren en el mismo proceso no reconectan.
+    Si las MAX_CONEXIONES_POOL conexiones están prestadas, espera a que se libere una.
+    """
+    pool = _obtener_pool()
+    _cupos_pool.acquire()
+    try:
+        conn = pool.getconn()
+        try:
+            with conn:
+                yield conn
+        finally:
+            pool.putconn(conn, close=bool(conn.closed))
+    finally:
+        _cupos_pool.release()
+
+
+def cerrar_pool():
+    """Cierra todas las conexiones del pool (al final del pipeline)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
@@ -0,0 +1,322 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import requests
+from requests.structures import CaseInsensitiveDict
+from comun import metricas
+
+DIRECTORIO_RAIZ = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+DIRECTORIO_CACHE = os.getenv("HTTP_CACHE_DIR", os.path.join(DIRECTORIO_RAIZ, ".cache_http"))
+TAMANO_MAXIMO_CACHE = int(os.getenv("HTTP_CACHE_MAX_MB", "512")) * 1024 * 1024
+TAMANO_BLOQUE_DESCARGA = 4 * 1024 * 1024  # Bloques de 4 MB para las descargas grandes
+
+# Cabeceras de la respuesta que se guardan junto al cuerpo
+CABECERAS_GUARDADAS = ("Content-Type", "ETag", "Last-Modified", "Cache-Control")
+
+
+def _segundos_max_age(cabeceras):
+    """
+    Retorna el 'max-age' de la cabecera Cache-Control, 0 si la respuesta no debe reutilizarse
+    sin revalidar ('no-cache') o None si el servidor no indica nada.
+    """
+    cache_control = (cabeceras.get("Cache-Control") or "").lower()
+    if "no-cache" in cache_control:
+        return 0
+    coincidencia = re.search(r"max-age=(\d+)", cache_control)
+    return int(coincidencia.group(1)) if coincidencia else None
+
+
+def _leer_indice(directorio):
+    """Lee los metadatos de todas las entradas; el último uso es la fecha de modificación del cuerpo."""
+    indice = {}
+    for nombre in os.listdir(directorio):
+        if not nombre.endswith(".json"):
+            continue
+        clave = nombre[:-len(".json")]
+        try:
+            with open(os.path.join(directorio, nombre), "r", encoding="utf-8") as f:
+                entrada = json.load(f)
+            entrada["ultimo_uso"] = os.path.getmtime(os.path.join(directorio, f"{clave}.cuerpo")) if entrada["tamano"] else 0
+        except (IOError, ValueError, KeyError):
+            continue
+        indice[clave] = entrada
+    return indice
+
+
+class _IndiceCompartido:
+    """
+    Índice, lock y tamaño máximo de un directorio de caché. Todos los ClienteHTTP del proceso que usan
+    el mismo directorio comparten uno (ver _indice_de), así una entrada que uno desaloja desaparece
+    también para los demás y el límite de tamaño se aplica al directorio completo.
+    """
+
+    def __init__(self, directorio, tamano_maximo):
+        self.entradas = _leer_indice(directorio)
+        self.lock = threading.Lock()
+        self.tamano_maximo = tamano_maximo
+
+
+_indices = {}
+_indices_lock = threading.Lock()
+
+
+def _indice_de(directorio, tamano_maximo):
+    """Índice compartido del directorio. Si se piden tamaños máximos distintos, rige el menor."""
+    ruta = os.path.realpath(directorio)
+    with _indices_lock:
+        if ruta not in _indices:
+            os.makedirs(ruta, exist_ok=True)
+            _indices[ruta] = _IndiceCompartido(ruta, tamano_maximo)
+        compartido = _indices[ruta]
+    with compartido.lock:
+        compartido.tamano_maximo = min(compartido.tamano_maximo, tamano_maximo)
+    return compartido
+
+
+class ClienteHTTP:
+    """
+    Cliente HTTP compartido por los extractores, con una caché persistente en disco por URL.
+
+    - Mientras una respuesta está fresca ('max-age' del servidor, o 'max_edad' de la llamada)
+      se devuelve desde disco sin hacer ninguna petición.
+    - Cuando vence se revalida con If-None-Match / If-Modified-Since: un 304 reutiliza el
+      cuerpo guardado y solo un 200 vuelve a descargarlo.
+    - La caché tiene un tamaño máximo; al superarlo se eliminan las entradas usadas hace más tiempo (LRU).
+      Los clientes del proceso que usan el mismo directorio comparten el índice y el límite.
+    - Si el cuerpo de una entrada ya no está en disco (lo borró otro proceso), se trata como ausente.
+
+    Es seguro usarlo desde varios hilos. Las respuestas se entregan como 'requests.Response',
+    así el código que las consume no cambia.
+    """
+
+    def __init__(self, session=None, headers=None, directorio=DIRECTORIO_CACHE, tamano_maximo=TAMANO_MAXIMO_CACHE):
+        self.session = session or requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+        self.directorio = directorio
+        self.compartido = _indice_de(directorio, tamano_maximo)
+        self.lock = self.compartido.lock
+        self.indice = self.compartido.entradas
+
+    # --- Índice de la caché ---
+
+    def _ruta(self, clave, extension):
+        return os.path.join(self.directorio, f"{clave}.{extension}")
+
+    def _guardar_entrada(self, clave, entrada, cuerpo=None):
+        """Escribe el cuerpo (si lo hay) y los metadatos de forma atómica, y aplica el límite de tamaño."""
+        if cuerpo is not None:
+            temporal = self._ruta(clave, f"cuerpo.{threading.get_ident()}.tmp")
+            with open(temporal, "wb") as f:
+                f.write(cuerpo)
+            os.replace(temporal, self._ruta(clave, "cuerpo"))
+        temporal = self._ruta(clave, f"json.{threading.get_ident()}.tmp")
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump({k: v for k, v in entrada.items() if k != "ultimo_uso"}, f, ensure_ascii=False)
+        os.replace(temporal, self._ruta(clave, "json"))
+        entrada["ultimo_uso"] = time.time()
+        self.indice[clave] = entrada
+        self._desalojar()
+
+    def _desalojar(self):
+        total = sum(entrada["tamano"] for entrada in self.indice.values())
+        if total <= self.compartido.tamano_maximo:
+            return
+        for clave, entrada in sorted(self.indice.items(), key=lambda item: item[1]["ultimo_uso"]):
+            if total <= self.compartido.tamano_maximo:
+                break
+            if not entrada["tamano"]:
+                continue
+            for extension in ("cuerpo", "json"):
+                try:
+                    os.remove(self._ruta(clave, extension))
+                except OSError:
+                    pass
+            total -= entrada["tamano"]
+            del self.indice[clave]
+
+    def _marcar_uso(self, clave):
+        self.indice[clave]["ultimo_uso"] = time.time()
+        try:
+            os.utime(self._ruta(clave, "cuerpo"))
+        except OSError:
+            pass
+
+    @staticmethod
+    def _expiracion(cabeceras, max_edad):
+        segundos = max_edad if max_edad is not None else _segundos_max_age(cabeceras)
+        return time.time() + segundos if segundos else 0
+
+    # --- Peticiones ---
+
+    @staticmethod
+    def _clave(url):
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def _respuesta_desde_cache(self, url, clave, entrada):
+        """Respuesta con el cuerpo guardado, o None si el cuerpo ya no está (la entrada se quita del índice)."""
+        try:
+            with open(self._ruta(clave, "cuerpo"), "rb") as f:
+                cuerpo = f.read()
+        except OSError:
+            self.indice.pop(clave, None)
+            return None
+        respuesta = requests.Response()
+        respuesta.status_code = 200
+        respuesta.url = url
+        respuesta.headers = CaseInsensitiveDict(entrada["cabeceras"])
+        respuesta.encoding = requests.utils.get_encoding_from_headers(respuesta.headers)
+        respuesta._content = cuerpo
+        respuesta._content_consumed = True
+        respuesta.desde_cache = True
+        return respuesta
+
+    def get(self, url, params=None, max_edad=None, **kwargs):
+        """
+        GET con caché. 'max_edad' (segundos) reemplaza el max-age del servidor, para fuentes que no
+        envían Cache-Control pero cuyo contenido no cambia (ej. el detalle de un sismo ya ocurrido).
+        El resto de los argumentos se pasan a 'requests.Session.get' (timeout, verify, headers...).
+        """
+        url_completa = requests.Request("GET", url, params=params).prepare().url
+        clave = self._clave(url_completa)
+
+        with self.lock:
+            entrada = self.indice.get(clave)
+            if entrada and entrada["tamano"] and time.time() < entrada["expira"]:
+                respuesta = self._respuesta_desde_cache(url_completa, clave, entrada)
+                if respuesta is not None:
+                    self._marcar_uso(clave)
+                    return respuesta
+                entrada = None
+
+        cabeceras = dict(kwargs.pop("headers", None) or {})
+        if entrada and entrada["tamano"]:
+            if entrada["cabeceras"].get("ETag"):
+                cabeceras["If-None-Match"] = entrada["cabeceras"]["ETag"]
+            if entrada["cabeceras"].get("Last-Modified"):
+                cabeceras["If-Modified-Since"] = entrada["cabeceras"]["Last-Modified"]
+
+        respuesta = self.session.get(url_completa, headers=cabeceras, **kwargs)
+        metricas.sumar(peticiones_http=1, bytes_descargados=len(respuesta.content))
+
+        with self.lock:
+            if respuesta.status_code == 304:
+                entrada = self.indice.get(clave)
+                desde_cache = self._respuesta_desde_cache(url_completa, clave, entrada) if entrada else None
+                if desde_cache is not None:
+                    entrada["expira"] = self._expiracion(respuesta.headers, max_edad)
+                    self._guardar_entrada(clave, entrada)
+                    return desde_cache
+                # Otro cliente desalojó la entrada mientras se revalidaba: se pide completa
+                cabeceras.pop("If-None-Match", None)
+                cabeceras.pop("If-Modified-Since", None)
+                respuesta = self.session.get(url_completa, headers=cabeceras, **kwargs)
+                metricas.sumar(peticiones_http=1, bytes_descargados=len(respuesta.content))
+
+            respuesta.desde_cache = False
+            no_store = "no-store" in (respuesta.headers.get("Cache-Control") or "").lower()
+            expira = self._expiracion(respuesta.headers, max_edad)
+            # Sin validadores ni max-age la copia nunca se podría reutilizar: no se guarda
+            reutilizable = expira or "ETag" in respuesta.headers or "Last-Modified" in respuesta.headers
+            if respuesta.status_code == 200 and not no_store and reutilizable:
+                self._guardar_entrada(clave, {
+                    "url": url_completa,
+                    "cabeceras": {k: respuesta.headers[k] for k in CABECERAS_GUARDADAS if k in respuesta.headers},
+                    "expira": expira,
+                    "tamano": len(respuesta.content)
+                }, respuesta.content)
+        return respuesta
+
+    def descargar(self, url, destino, progreso=None, md5_esperado=None, tamano_bloque=TAMANO_BLOQUE_DESCARGA,
+                  releer_md5=None, **kwargs):
+        """
+        Descarga 'url' a 'destino' en streaming, sin copiarlo a la caché (pensado para archivos grandes).
+
+        - Si 'destino' ya existe se revalida con los ETag/Last-Modified de la descarga anterior y un 304
+          lo deja intacto.
+        - Los bloques se escriben directo a '<destino>.part'. Si una descarga se corta, la siguiente la
+          continúa con 'Range' (e 'If-Range', para no mezclar versiones distintas del archivo).
+        - El MD5 se calcula mientras se escribe; si se indica 'md5_esperado' y no coincide, se borra la
+          descarga y se lanza ValueError. Antes se llama una vez a 'releer_md5()', si se indica: el archivo
+          pudo publicarse de nuevo durante la descarga, y si el MD5 que retorna coincide se conserva.
+
+        'progreso(descargados, total)' se llama por cada bloque recibido.
+        Retorna True si se descargó de nuevo y False si el archivo local seguía vigente.
+        """
+        clave = self._clave(url)
+        parcial = f"{destino}.part"
+        cabeceras_originales = kwargs.pop("headers", None) or {}
+        cabeceras = dict(cabeceras_originales)
+        with self.lock:
+            entrada = dict(self.indice.get(clave) or {"url": url, "cabeceras": {}, "expira": 0, "tamano": 0})
+        if os.path.exists(destino):
+            if entrada["cabeceras"].get("ETag"):
+                cabeceras["If-None-Match"] = entrada["cabeceras"]["ETag"]
+            if entrada["cabeceras"].get("Last-Modified"):
+                cabeceras["If-Modified-Since"] = entrada["cabeceras"]["Last-Modified"]
+        if os.path.exists(parcial) and entrada.get("validador_parcial"):
+            cabeceras["Range"] = f"bytes={os.path.getsize(parcial)}-"
+            cabeceras["If-Range"] = entrada["validador_parcial"]
+
+        with self.session.get(url, headers=cabeceras, stream=True, **kwargs) as r:
+            metricas.sumar(peticiones_http=1)
+            if r.status_code == 304:
+                # El archivo local sigue vigente; una descarga parcial pendiente ya no sirve
+                if os.path.exists(parcial):
+                    os.remove(parcial)
+                return False
+            if r.status_code == 416:
+                # La parte local ya no calza con el archivo remoto: se descarta y se parte de cero
+                os.remove(parcial)
+                return self.descargar(url, destino, progreso, md5_esperado, tamano_bloque, releer_md5,
+                                      headers=cabeceras_originales, **kwargs)
+            r.raise_for_status()
+
+            md5 = hashlib.md5()
+            if r.status_code == 206:
+                # Continúa la descarga: solo el tramo ya escrito se vuelve a leer para el MD5
+                with open(parcial, "rb") as f:
+                    for bloque in iter(lambda: f.read(tamano_bloque), b""):
+                        md5.update(bloque)
+                descargados = os.path.getsize(parcial)
+                modo = "ab"
+                print(f"   -> Reanudando la descarga desde {descargados / 1024 / 1024:.1f} MB.")
+            else:
+                descargados = 0
+                modo = "wb"
+                # Se registra la versión que se está bajando, para poder reanudarla si se corta
+                validador = r.headers.get("ETag") or r.headers.get("Last-Modified")
+                if validador:
+                    entrada["validador_parcial"] = validador
+                    with self.lock:
+                        self._guardar_entrada(clave, entrada)
+            total = descargados + int(r.headers.get("content-length", 0))
+
+            with open(parcial, modo) as f:
+                for bloque in r.iter_content(chunk_size=tamano_bloque):
+                    f.write(bloque)
+                    md5.update(bloque)
+                    descargados += len(bloque)
+                    metricas.sumar(bytes_descargados=len(bloque))
+                    if progreso:
+                        progreso(descargados, total)
+
+        if md5_esperado and md5.hexdigest() != md5_esperado.lower() and releer_md5:
+            md5_esperado = releer_md5() or md5_esperado
+        if md5_esperado and md5.hexdigest() != md5_esperado.lower():
+            os.remove(parcial)
+            raise ValueError(f"El MD5 de la descarga ({md5.hexdigest()}) no coincide con el publicado ({md5_esperado}).")
+        os.replace(parcial, destino)
+
+        with self.lock:
+            self._guardar_entrada(clave, {
+                "url": url,
+                "cabeceras": {k: r.headers[k] for k in CABECERAS_GUARDADAS if k in r.headers},
+                "expira": 0,
+                "tamano": 0,  # El archivo vive en 'destino', fuera del límite de la caché
+                "md5": md5.hexdigest()
+            })
+        return True
@@ -0,0 +1,70 @@
+import atexit
+import json
+import os
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+# Si está definida, el proceso corre un solo paso del pipeline en un subproceso: al terminar escribe
+# sus contadores en este archivo para que main.py los lea.
+ARCHIVO_METRICAS = os.getenv("ETL_METRICAS_ARCHIVO")
+
+_contadores = {}
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def paso_actual():
+    """Paso del pipeline al que se atribuye el trabajo del hilo actual (None fuera de un paso)."""
+    return getattr(_local, "paso", None)
+
+
+@contextmanager
+def en_paso(paso):
+    """Atribuye a 'paso' los contadores que se sumen desde este hilo mientras dure el bloque."""
+    anterior = paso_actual()
+    _local.paso = paso
+    try:
+        yield
+    finally:
+        _local.paso = anterior
+
+
+def propagar(funcion):
+    """
+    Envuelve 'funcion' para que, al correr en otro hilo (ej. un ThreadPoolExecutor), sus contadores
+    se sigan atribuyendo al paso del hilo que la envolvió.
+    """
+    paso = paso_actual()
+
+    def envuelta(*args, **kwargs):
+        with en_paso(paso):
+            return funcion(*args, **kwargs)
+    return envuelta
+
+
+def sumar(**valores):
+    """Suma valores a los contadores del paso actual (filas_leidas, filas_escritas, bytes_descargados...)."""
+    paso = paso_actual()
+    with _lock:
+        _contadores.setdefault(paso, Counter()).update(valores)
+
+
+def contadores(paso=None):
+    """Copia de los contadores de un paso."""
+    with _lock:
+        return dict(_contadores.get(paso, {}))
+
+
+def _guardar_contadores():
+    # En un subproceso todo su trabajo es del mismo paso, corra en el hilo que corra
+    total = Counter()
+    with _lock:
+        for valores in _contadores.values():
+            total.update(valores)
+    with open(ARCHIVO_METRICAS, "w", encoding="utf-8") as f:
+        json.dump(dict(total), f)
+
+
+if ARCHIVO_METRICAS:
+    atexit.register(_guardar_contadores)
@@ -0,0 +1,100 @@
+-- Archivo: database/benchmark_tarifas_peaje.sql
+-- Descripción: Compara el plan de la consulta de tarifas de una ruta de 50 peajes con el formato
+-- anterior de 'tarifas_peaje' (textos repetidos, sin índice en peaje_id) y con el formato normalizado
+-- (IDs SMALLINT de los catálogos y llave primaria (peaje_id, categoria_id, tipo_tarifa_id) INCLUDE (precio)).
+--
+-- Uso (después de load_peajes.py):
+--   psql -d <base> -v replicas=1000 -f database/benchmark_tarifas_peaje.sql
+--
+-- Las tarifas cargadas se replican 'replicas' veces en tablas temporales para que el tamaño sea
+-- comparable al de una red completa; no se modifica ninguna tabla del proyecto.
+--
+-- Resultados (PostgreSQL 16.2, replicas=1000, 1.197.000 filas por tabla, 1.197 tarifas de 176 peajes cargadas
+-- con load_peajes.py; salida completa en database/benchmark_tarifas_peaje_resultados.txt):
+--   * Tamaño: 'antes' 82 MB de tabla + 26 MB de índices; 'despues' 51 MB + 36 MB (el índice incluye el precio).
+--   * ANTES: 'Seq Scan on tarifas_antes' que filtra 1.000.000 de filas por texto y un Hash Join con la ruta,
+--     181-236 ms en tres ejecuciones.
+--   * DESPUÉS: 'Index Only Scan using tarifas_despues_pkey', 50 búsquedas con 'Heap Fetches: 0',
+--     0,43-0,56 ms en tres ejecuciones.
+-- La base de medición no tenía PostGIS: 'peajes.ubicacion' se creó como POINT nativo con ST_MakePoint y
+-- ST_SetSRID equivalentes en SQL. Las consultas medidas no usan esa columna.
+
+\if :{?replicas}
+\else
+    \set replicas 1000
+\endif
+
+\echo ">>> Preparando tablas temporales (":replicas" réplicas de las tarifas cargadas)..."
+
+-- Formato anterior: categoría y tipo de tarifa como texto en cada fila, solo con índice en 'id'.
+CREATE TEMP TABLE tarifas_antes (
+    id SERIAL PRIMARY KEY,
+    peaje_id INT NOT NULL,
+    categoria_vehiculo VARCHAR(255) NOT NULL,
+    tipo_tarifa VARCHAR(50) NOT NULL,
+    precio NUMERIC(10, 2) NOT NULL
+);
+
+INSERT INTO tarifas_antes (peaje_id, categoria_vehiculo, tipo_tarifa, precio)
+SELECT r * 100000 + t.peaje_id, c.nombre, tt.codigo, t.precio
+FROM generate_series(0, :replicas - 1) AS r
+CROSS JOIN tarifas_peaje t
+JOIN categorias_vehiculo c ON c.id = t.categoria_id
+JOIN tipos_tarifa tt ON tt.id = t.tipo_tarifa_id;
+
+-- Formato nuevo: IDs de los catálogos y llave primaria compuesta que incluye el precio.
+CREATE TEMP TABLE tarifas_despues (
+    peaje_id INT NOT NULL,
+    categoria_id SMALLINT NOT NULL,
+    tipo_tarifa_id SMALLINT NOT NULL,
+    precio NUMERIC(10, 2) NOT NULL,
+    PRIMARY KEY (peaje_id, categoria_id, tipo_tarifa_id) INCLUDE (precio)
+);
+
+INSERT INTO tarifas_despues (peaje_id, categoria_id, tipo_tarifa_id, precio)
+SELECT r * 100000 + t.peaje_id, t.categoria_id, t.tipo_tarifa_id, t.precio
+FROM generate_series(0, :replicas - 1) AS r
+CROSS JOIN tarifas_peaje t;
+
+VACUUM (ANALYZE) tarifas_antes;
+VACUUM (ANALYZE) tarifas_despues;
+
+-- Ruta de ejemplo: 50 peajes con tarifas para la categoría más frecuente, tomados de réplicas distintas.
+CREATE TEMP TABLE ruta AS
+SELECT ROW_NUMBER() OVER () AS orden, peaje_id
+FROM (
+    SELECT peaje_id FROM tarifas_despues
+    WHERE categoria_id = (SELECT categoria_id FROM tarifas_peaje GROUP BY categoria_id ORDER BY COUNT(*) DESC LIMIT 1)
+    GROUP BY peaje_id
+    ORDER BY md5(peaje_id::text)
+    LIMIT 50
+) AS p;
+
+SELECT c.id AS categoria_id, c.nombre AS categoria
+FROM categorias_vehiculo c
+WHERE c.id = (SELECT categoria_id FROM tarifas_peaje GROUP BY categoria_id ORDER BY COUNT(*) DESC LIMIT 1) \gset
+
+\echo ">>> Tamaño de las tablas:"
+SELECT 'antes' AS formato, pg_size_pretty(pg_table_size('tarifas_antes')) AS tabla,
+       pg_size_pretty(pg_indexes_size('tarifas_antes')) AS indices
+UNION ALL
+SELECT 'despues', pg_size_pretty(pg_table_size('tarifas_despues')),
+       pg_size_pretty(pg_indexes_size('tarifas_despues'));
+
+\echo ">>> ANTES: tarifas de la ruta filtrando por textos, sin índice en peaje_id"
+EXPLAIN (ANALYZE, BUFFERS)
+SELECT r.orden, t.tipo_tarifa, t.precio
+FROM ruta r
+JOIN tarifas_antes t ON t.peaje_id = r.peaje_id
+WHERE t.categoria_vehiculo = :'categoria'
+ORDER BY r.orden;
+
+\echo ">>> DESPUÉS: tarifas de la ruta por IDs, resuelto con Index Only Scan sobre la llave primaria"
+EXPLAIN (ANALYZE, BUFFERS)
+SELECT r.orden, tt.codigo, t.precio
+FROM ruta r
+JOIN tarifas_despues t ON t.peaje_id = r.peaje_id AND t.categoria_id = :categoria_id
+JOIN tipos_tarifa tt ON tt.id = t.tipo_tarifa_id
+ORDER BY r.orden;
+
+DROP TABLE ruta, tarifas_antes, tarifas_despues;
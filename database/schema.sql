@@ -114,8 +114,41 @@ CREATE TABLE IF NOT EXISTS precios_combustibles (
     UNIQUE (estacion_id, tipo_combustible)
 );
 
+-- Vista materializada con el precio "típico" de cada combustible por comuna, por región y a nivel país.
+-- Evita cruzar 'precios_combustibles' con 'estaciones_servicio' cada vez que se estima el costo de una ruta.
+-- La columna 'nivel' indica la agregación de la fila: 'comuna', 'region' o 'pais'
+-- (en las filas de nivel 'region' la comuna es NULL, y en las de nivel 'pais' también la región).
+CREATE MATERIALIZED VIEW IF NOT EXISTS precios_combustibles_region AS
+SELECT
+    CASE GROUPING(e.region, e.comuna)
+        WHEN 0 THEN 'comuna'
+        WHEN 1 THEN 'region'
+        ELSE 'pais'
+    END AS nivel,
+    e.region,
+    e.comuna,
+    p.tipo_combustible,
+    percentile_cont(0.5) WITHIN GROUP (ORDER BY p.precio) AS precio_mediana,
+    percentile_cont(0.1) WITHIN GROUP (ORDER BY p.precio) AS precio_p10,
+    percentile_cont(0.9) WITHIN GROUP (ORDER BY p.precio) AS precio_p90,
+    COUNT(*) AS total_estaciones                    -- Hay un solo precio por estación y combustible.
+FROM precios_combustibles p
+JOIN estaciones_servicio e ON e.id = p.estacion_id
+GROUP BY GROUPING SETS (
+    (e.region, e.comuna, p.tipo_combustible),
+    (e.region, p.tipo_combustible),
+    (p.tipo_combustible)
+);
+
+-- Índice único requerido para poder hacer 'REFRESH MATERIALIZED VIEW CONCURRENTLY'
+-- (la vista se puede seguir consultando mientras se refresca después de cada carga).
+-- NULLS NOT DISTINCT porque las filas de nivel 'region' y 'pais' tienen columnas NULL.
+CREATE UNIQUE INDEX IF NOT EXISTS idx_precios_region_unico
+    ON precios_combustibles_region (nivel, region, comuna, tipo_combustible) NULLS NOT DISTINCT;
+
 -- Mensaje de finalización para la consola.
 \echo ">>> Tablas para combustibles 'estaciones_servicio' y 'precios_combustibles' creadas/actualizadas."
+\echo ">>> Vista materializada 'precios_combustibles_region' creada."
 
 -- ========= SECCIÓN 3: METADATA DE PEAJES (PÓRTICOS) =========
 
@@ -125,6 +158,7 @@ CREATE TABLE IF NOT EXISTS peajes (
     nombre VARCHAR(255) NOT NULL,                   -- Nombre del pórtico o plaza de peaje.
     concesionaria VARCHAR(255),                     -- Nombre de la autopista o concesionaria.
     tipo VARCHAR(50),                               -- Tipo de peaje, ej: 'Troncal', 'Lateral'.
+    horarios JSONB,                                 -- Rangos horarios de punta/saturación, ej: {"punta_laboral_tbp": ["07:30-09:30"]}.
 
     -- Columna para la ubicación geoespacial del peaje.
     ubicacion GEOMETRY(Point, 4326),
@@ -136,20 +170,76 @@ CREATE TABLE IF NOT EXISTS peajes (
 -- Crear un índice espacial en la columna 'ubicacion' para acelerar búsquedas geográficas.
 CREATE INDEX IF NOT EXISTS idx_peajes_ubicacion ON peajes USING GIST (ubicacion);
 
+-- Para bases creadas antes de que existiera la columna 'horarios'.
+ALTER TABLE peajes ADD COLUMN IF NOT EXISTS horarios JSONB;
+
+
+-- Catálogos de categorías de vehículo y tipos de tarifa.
+-- 'tarifas_peaje' guarda solo sus IDs (SMALLINT) en vez de repetir textos como 'autos_y_camionetas' en cada fila.
+CREATE TABLE IF NOT EXISTS categorias_vehiculo (
+    id SMALLSERIAL PRIMARY KEY,
+    nombre VARCHAR(255) NOT NULL UNIQUE             -- Categoría tal como la publica la concesionaria, ej: 'categoria_1y4'.
+);
+
+CREATE TABLE IF NOT EXISTS tipos_tarifa (
+    id SMALLSERIAL PRIMARY KEY,
+    codigo VARCHAR(50) NOT NULL UNIQUE,             -- Código del tipo de tarifa, ej: 'TBFP', 'TBP', 'TS'.
+    descripcion VARCHAR(100)                        -- Descripción legible del código.
+);
+
+INSERT INTO tipos_tarifa (codigo, descripcion) VALUES
+    ('TBFP', 'Tarifa Base Fuera Punta'),
+    ('TBP', 'Tarifa Base Punta'),
+    ('TS', 'Tarifa Saturación'),
+    ('TAG', 'Pago electrónico en pórtico (TAG)'),
+    ('MANUAL', 'Pago manual en caseta')
+ON CONFLICT (codigo) DO NOTHING;
+
+-- Bases creadas antes de los catálogos: 'tarifas_peaje' tenía las columnas de texto 'categoria_vehiculo'
+-- y 'tipo_tarifa'. Se elimina para crearla con el nuevo formato; load_peajes.py la vuelve a poblar completa.
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM information_schema.columns
+               WHERE table_name = 'tarifas_peaje' AND column_name = 'categoria_vehiculo') THEN
+        DROP TABLE tarifas_peaje;
+    END IF;
+END $$;
 
 -- Tabla para almacenar las diferentes tarifas asociadas a cada peaje.
 CREATE TABLE IF NOT EXISTS tarifas_peaje (
-    id SERIAL PRIMARY KEY,
     peaje_id INT NOT NULL,                          -- Llave foránea que referencia el ID de la tabla 'peajes'.
-    categoria_vehiculo VARCHAR(255) NOT NULL,       -- Descripción de la categoría del vehículo.
-    tipo_tarifa VARCHAR(50) NOT NULL,               -- Tipo de tarifa, ej: 'TBFP' (Fuera de Punta), 'TBP' (Punta), 'TS' (Saturación).
+    categoria_id SMALLINT NOT NULL,                 -- Llave foránea que referencia 'categorias_vehiculo'.
+    tipo_tarifa_id SMALLINT NOT NULL,               -- Llave foránea que referencia 'tipos_tarifa'.
     precio NUMERIC(10, 2) NOT NULL,                 -- El costo del peaje. Usamos NUMERIC para valores monetarios.
 
+    -- Una tarifa por peaje, categoría y tipo. El índice de la llave primaria incluye el precio,
+    -- así las consultas de tarifas de una ruta se resuelven con un 'Index Only Scan' sin leer la tabla.
+    PRIMARY KEY (peaje_id, categoria_id, tipo_tarifa_id) INCLUDE (precio),
+
     -- Restricción de llave foránea. Si un peaje se elimina, sus tarifas también.
     CONSTRAINT fk_peaje
         FOREIGN KEY(peaje_id)
         REFERENCES peajes(id)
-        ON DELETE CASCADE
+        ON DELETE CASCADE,
+    CONSTRAINT fk_categoria_vehiculo
+        FOREIGN KEY(categoria_id)
+        REFERENCES categorias_vehiculo(id),
+    CONSTRAINT fk_tipo_tarifa
+        FOREIGN KEY(tipo_tarifa_id)
+        REFERENCES tipos_tarifa(id)
+);
+
+\echo ">>> Tablas para peajes 'peajes' y 'tarifas_peaje' creadas/actualizadas."
+\echo ">>> Catálogos 'categorias_vehiculo' y 'tipos_tarifa' creados/actualizados."
+
+-- ========= SECCIÓN 4: CONTROL DE VERSIONES DE LOS DATOS =========
+
+-- Tabla con la fecha de la última carga de cada fuente de datos (ej. 'combustibles').
+-- Los cargadores la actualizan al terminar y el sitio web la consulta para saber
+-- cuándo debe recargar sus cachés en memoria, sin tener que releer las tablas completas.
+CREATE TABLE IF NOT EXISTS versiones_datos (
+    fuente VARCHAR(50) PRIMARY KEY,                 -- Nombre de la fuente de datos.
+    actualizado_en TIMESTAMP NOT NULL DEFAULT NOW() -- Fecha y hora de la última carga exitosa.
 );
 
-\echo ">>> Tablas para peajes 'peajes' y 'tarifas_peaje' creadas/actualizadas."
\ No newline at end of file
+\echo ">>> Tabla de control 'versiones_datos' creada/actualizada."
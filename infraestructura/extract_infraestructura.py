@@ -1,52 +1,186 @@
 import requests
 import os
+import re
+import sys
 from datetime import datetime
 
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from comun.http_cache import ClienteHTTP
+
+# Con más diffs pendientes que esto es más rápido reimportar el PBF completo
+MAX_DIFFS_POR_ACTUALIZACION = 30
+# Última secuencia de diffs aplicada a la base, que registra transform_load_infraestructura.py
+ESTADO_APLICADO_FILENAME = "replicacion_estado.txt"
+
+
+def leer_secuencia_estado(texto):
+    """Número de secuencia de un 'state.txt' de replicación de OSM. Lanza ValueError si no lo tiene."""
+    coincidencia = re.search(r"sequenceNumber=(\d+)", texto)
+    if not coincidencia:
+        raise ValueError("No se encontró 'sequenceNumber' en state.txt de Geofabrik.")
+    return int(coincidencia.group(1))
+
+
+def leer_secuencia_aplicada(ruta):
+    """Secuencia guardada en 'replicacion_estado.txt', o None si no hay una importación con estado."""
+    if not os.path.exists(ruta):
+        return None
+    with open(ruta, 'r', encoding='utf-8') as f:
+        contenido = f.read().strip()
+    return int(contenido) if contenido.isdigit() else None
+
 
 class ExtractorInfraestructura:
     """
     Descarga el archivo de datos de OpenStreetMap para Chile desde Geofabrik.
     """
 
-    # URL directa al archivo .osm.pbf de Chile
+    # URL directa al archivo .osm.pbf de Chile y su suma MD5 publicada por Geofabrik
     PBF_URL = "https://download.geofabrik.de/south-america/chile-latest.osm.pbf"
+    MD5_URL = PBF_URL + ".md5"
+    # Estado de replicación: último diff publicado, del que parte la actualización incremental
+    ESTADO_URL = "https://download.geofabrik.de/south-america/chile-updates/state.txt"
 
     def __init__(self):
         self.output_dir = os.path.dirname(os.path.realpath(__file__))
         self.output_filename = "chile-latest.osm.pbf"
         self.filepath = os.path.join(self.output_dir, self.output_filename)
+        self.md5_filepath = self.filepath + ".md5"
+        self.estado_filepath = self.filepath + ".state.txt"
+        self.estado_aplicado_filepath = os.path.join(self.output_dir, ESTADO_APLICADO_FILENAME)
+        # MD5 publicado contra el que se verifica la descarga en curso
+        self.md5_publicado = None
         self.headers = {'User-Agent': 'ProyectoRuteoEconomico-ETL/1.0'}
+        self.client = ClienteHTTP(headers=self.headers)
+
+    @staticmethod
+    def _mostrar_progreso(downloaded_size, total_size):
+        if not total_size:
+            return
+        done = int(50 * downloaded_size / total_size)
+        print(
+            f"\r   [{'=' * done}{' ' * (50 - done)}] {downloaded_size / 1024 / 1024:.2f} MB / {total_size / 1024 / 1024:.2f} MB",
+            end='')
+
+    def _obtener_md5_remoto(self):
+        """Lee el MD5 publicado junto al PBF (formato '<md5>  chile-latest.osm.pbf'). None si no está disponible."""
+        try:
+            # max_edad=0: siempre se revalida, para no comparar contra un MD5 guardado en la caché HTTP
+            response = self.client.get(self.MD5_URL, timeout=30, max_edad=0)
+            response.raise_for_status()
+            return response.text.split()[0].lower()
+        except (requests.RequestException, IndexError) as e:
+            print(f"   -> Advertencia: No se pudo obtener el MD5 publicado ({e}). Se descargará sin verificar.")
+            return None
 
-    def descargar(self):
+    def _releer_md5_remoto(self):
         """
-        Descarga el archivo PBF, mostrando el progreso.
+        Se llama cuando la descarga no coincide con el MD5 leído antes de empezar: Geofabrik pudo publicar
+        un PBF nuevo mientras se descargaba. Deja en 'md5_publicado' el MD5 vigente.
+        """
+        print("\n   -> El MD5 no coincide; se vuelve a leer el publicado por si el archivo cambió durante la descarga.")
+        self.md5_publicado = self._obtener_md5_remoto()
+        return self.md5_publicado
+
+    def _obtener_estado_replicacion(self):
+        """Contenido de 'state.txt' de Geofabrik ('sequenceNumber=...'). None si no está disponible."""
+        try:
+            response = self.client.get(self.ESTADO_URL, timeout=30)
+            response.raise_for_status()
+            return response.text if "sequenceNumber=" in response.text else None
+        except requests.RequestException as e:
+            print(f"   -> Advertencia: No se pudo obtener el estado de replicación ({e}).")
+            return None
+
+    def _guardar_estado_replicacion(self, estado):
+        """
+        Guarda junto al PBF el estado de replicación leído antes de descargarlo. Si no se pudo leer, borra
+        el de la descarga anterior, que ya no corresponde al archivo.
+        """
+        if estado is None:
+            if os.path.exists(self.estado_filepath):
+                os.remove(self.estado_filepath)
+            print("   -> El PBF queda sin estado de replicación: la próxima carga será completa.")
+            return
+        with open(self.estado_filepath, 'w', encoding='utf-8') as f:
+            f.write(estado)
+
+    def _diffs_alcanzan(self, estado):
+        """
+        True si transform_load_infraestructura.py puede poner la base al día solo con diffs: ya hay una
+        importación con secuencia registrada y los diffs pendientes hasta 'estado' no superan
+        MAX_DIFFS_POR_ACTUALIZACION. Si la base perdió las tablas de osm2pgsql, el cargador igual
+        descarga el PBF antes de reimportarlo (ver InfraestructuraLoader.importar_completo).
+        """
+        secuencia_local = leer_secuencia_aplicada(self.estado_aplicado_filepath)
+        if secuencia_local is None or estado is None:
+            return False
+        pendientes = leer_secuencia_estado(estado) - secuencia_local
+        if pendientes > MAX_DIFFS_POR_ACTUALIZACION:
+            print(f"   -> Hay {pendientes} diffs pendientes: se descarga el PBF completo.")
+            return False
+        print(f"-> La base se actualiza con {max(pendientes, 0)} diffs; no se descarga el PBF.")
+        return True
+
+    def _leer_md5_local(self):
+        """MD5 del PBF local, guardado al terminar la última descarga verificada."""
+        if not (os.path.exists(self.filepath) and os.path.exists(self.md5_filepath)):
+            return None
+        with open(self.md5_filepath, 'r', encoding='utf-8') as f:
+            contenido = f.read().split()
+        return contenido[0].lower() if contenido else None
+
+    def descargar(self, forzar=False):
+        """
+        Descarga el archivo PBF, mostrando el progreso. No descarga nada si los diffs de Geofabrik
+        alcanzan para poner la base al día (salvo con 'forzar', que usa el cargador al reimportar), si
+        el MD5 publicado coincide con el del archivo local o si el servidor responde 304; una descarga
+        cortada se reanuda. Si la descarga no coincide con el MD5 publicado, este se vuelve a leer una
+        vez antes de descartarla.
+        Retorna la ruta del PBF (True si no hizo falta), o False si la descarga falló.
+
+        Junto al PBF se guarda el 'state.txt' de Geofabrik leído antes de descargarlo, que usa
+        transform_load_infraestructura.py como punto de partida de los diffs. Al leerlo antes, un diff
+        publicado durante la descarga queda pendiente en vez de saltarse: a lo sumo se vuelve a aplicar
+        uno que el PBF ya incluía, lo que osm2pgsql --append tolera.
         """
         print(f"-> Iniciando descarga de infraestructura desde Geofabrik...")
         print(f"   URL: {self.PBF_URL}")
         try:
-            with requests.get(self.PBF_URL, headers=self.headers, stream=True, timeout=30) as r:
-                r.raise_for_status()
-                total_size = int(r.headers.get('content-length', 0))
-
-                with open(self.filepath, 'wb') as f:
-                    downloaded_size = 0
-                    for chunk in r.iter_content(chunk_size=8192):
-                        f.write(chunk)
-                        downloaded_size += len(chunk)
-                        # Imprimir progreso
-                        done = int(50 * downloaded_size / total_size)
-                        print(
-                            f"\r   [{'=' * done}{' ' * (50 - done)}] {downloaded_size / 1024 / 1024:.2f} MB / {total_size / 1024 / 1024:.2f} MB",
-                            end='')
+            estado = self._obtener_estado_replicacion()
+            if not forzar and self._diffs_alcanzan(estado):
+                return True
+
+            self.md5_publicado = self._obtener_md5_remoto()
+            if self.md5_publicado and self.md5_publicado == self._leer_md5_local():
+                print(f"-> El archivo local coincide con el MD5 publicado, no se descargó de nuevo: {self.filepath}")
+                return self.filepath
+
+            # Si ya hay un PBF descargado, Geofabrik responde 304 cuando no hay una versión nueva
+            if not self.client.descargar(self.PBF_URL, self.filepath, progreso=self._mostrar_progreso,
+                                         md5_esperado=self.md5_publicado, releer_md5=self._releer_md5_remoto,
+                                         timeout=30):
+                print(f"-> El archivo local está actualizado, no se descargó de nuevo: {self.filepath}")
+                return self.filepath
+
+            if self.md5_publicado:
+                with open(self.md5_filepath, 'w', encoding='utf-8') as f:
+                    f.write(f"{self.md5_publicado}  {self.output_filename}\n")
+                print(f"\n   -> MD5 verificado: {self.md5_publicado}")
+            self._guardar_estado_replicacion(estado)
 
             print(f"\n\n-> Descarga completada. Archivo guardado en: {self.filepath}")
             return self.filepath
 
         except requests.RequestException as e:
             print(f"\n-> ERROR: No se pudo descargar el archivo. {e}")
-            return None
-
+            print("   La parte ya descargada se conserva y se reanudará en la próxima ejecución.")
+            return False
+        except ValueError as e:
+            print(f"\n-> ERROR: {e}")
+            return False
 
 if __name__ == "__main__":
     extractor = ExtractorInfraestructura()
-    extractor.descargar()
\ No newline at end of file
+    if not extractor.descargar():
+        sys.exit(1)
@@ -0,0 +1,168 @@
+import os
+import sys
+import time
+import numpy as np
+import psycopg2
+from dotenv import load_dotenv
+
+# Filas leídas por viaje desde el cursor del servidor
+FILAS_POR_LOTE = 200_000
+# Coordenadas guardadas como enteros en microgrados (precisión ~0,1 m)
+MICROGRADOS = 1_000_000
+
+
+def _tamano_filas_python(filas):
+    """Bytes que ocupan unas filas como tuplas de objetos Python (tupla + cada valor)."""
+    return sum(sys.getsizeof(fila) + sum(sys.getsizeof(valor) for valor in fila) for fila in filas)
+
+
+def _formato_mb(n_bytes):
+    return f"{n_bytes / 1024 / 1024:,.1f} MB"
+
+
+class ConstructorGrafoCompacto:
+    """
+    Exporta la red vial ('red_vial' y 'red_vial_vertices_pgr') a un grafo compacto en un archivo .npz,
+    para rutear en memoria sin diccionarios ni enteros de Python:
+
+    - Vértices y aristas renumerados con IDs densos int32 (0..n-1).
+    - Cada arista de 'red_vial' se convierte en arcos dirigidos: uno de 'source' a 'target', y otro de
+      'target' a 'source' si su 'reverse_cost' es >= 0 (vías de doble sentido). 'inverso' marca los
+      arcos que recorren la vía contra el sentido de su geometría.
+    - Costos de cada arco en float32 (metros y segundos), ya en el sentido en que se recorre.
+    - Coordenadas de los vértices en microgrados int32.
+    - Arcos ordenados por vértice de origen, con 'inicio_vertice' como índice de adyacencia (CSR):
+      los arcos que salen del vértice v son los del rango [inicio_vertice[v], inicio_vertice[v + 1]).
+    - 'osm_ids' (int64, sin repetidos) y 'arista_osm' (int32) para volver de un arco a su vía de OSM;
+      'arista_red_vial' guarda el 'id' original de la arista en 'red_vial'.
+    """
+
+    def __init__(self):
+        load_dotenv()
+        self.db_config = {
+            "dbname": os.getenv("DB_NAME"),
+            "user": os.getenv("DB_USER"),
+            "password": os.getenv("DB_PASSWORD"),
+            "host": os.getenv("DB_HOST", "localhost"),
+            "port": os.getenv("DB_PORT", "5432")
+        }
+        script_dir = os.path.dirname(os.path.realpath(__file__))
+        self.output_file = os.path.join(script_dir, "grafo_red_vial.npz")
+
+    def _leer_aristas(self, cur):
+        """
+        Lee las aristas por lotes y las acumula directamente en arrays. Retorna los arrays y la estimación
+        de lo que habrían ocupado como filas de Python, extrapolada desde el primer lote.
+        """
+        cur.execute("""
+            SELECT id, osm_id, "source", "target", cost, reverse_cost, tiempo_seg, reverse_tiempo_seg
+            FROM red_vial
+            WHERE "source" IS NOT NULL AND "target" IS NOT NULL
+            ORDER BY id;
+        """)
+        enteros, costos = [], []
+        bytes_por_fila = None
+        while True:
+            filas = cur.fetchmany(FILAS_POR_LOTE)
+            if not filas:
+                break
+            if bytes_por_fila is None:
+                bytes_por_fila = _tamano_filas_python(filas) / len(filas)
+            enteros.append(np.array([fila[:4] for fila in filas], dtype=np.int64))
+            costos.append(np.array([fila[4:] for fila in filas], dtype=np.float64))
+        if not enteros:
+            return None, None, 0
+        enteros, costos = np.concatenate(enteros), np.concatenate(costos)
+        return enteros, costos, int(bytes_por_fila * len(enteros))
+
+    def _leer_vertices(self, cur):
+        cur.execute("SELECT id, ST_X(the_geom), ST_Y(the_geom) FROM red_vial_vertices_pgr ORDER BY id;")
+        filas = cur.fetchall()
+        ids = np.array([fila[0] for fila in filas], dtype=np.int64)
+        coordenadas = np.array([fila[1:] for fila in filas], dtype=np.float64)
+        return ids, coordenadas, _tamano_filas_python(filas)
+
+    @staticmethod
+    def compactar(enteros, costos, ids_vertices, coordenadas):
+        """Arma los arrays del grafo compacto a partir de las aristas y vértices leídos de la base de datos."""
+        id_arista, osm_id, origen, destino = enteros.T
+
+        # Solo quedan los vértices que usa alguna arista, renumerados en el orden de su ID original
+        vertices_usados = np.unique(np.concatenate([origen, destino]))
+        origen = np.searchsorted(vertices_usados, origen).astype(np.int32)
+        destino = np.searchsorted(vertices_usados, destino).astype(np.int32)
+        posiciones = np.searchsorted(ids_vertices, vertices_usados)
+        coordenadas_micro = np.round(coordenadas[posiciones] * MICROGRADOS).astype(np.int32)
+
+        # Arcos dirigidos: el sentido de la geometría y, en las vías de doble sentido, el contrario
+        directo = costos[:, 0] >= 0
+        inverso = costos[:, 1] >= 0
+        arco_origen = np.concatenate([origen[directo], destino[inverso]])
+        arco_destino = np.concatenate([destino[directo], origen[inverso]])
+        arco_costos = np.concatenate([costos[directo][:, [0, 2]], costos[inverso][:, [1, 3]]]).astype(np.float32)
+        arco_arista = np.concatenate([np.flatnonzero(directo), np.flatnonzero(inverso)])
+        arco_inverso = np.concatenate([np.zeros(directo.sum(), dtype=bool), np.ones(inverso.sum(), dtype=bool)])
+
+        # Arcos ordenados por origen (orden estable: a igual origen, primero los directos y por ID)
+        orden = np.argsort(arco_origen, kind="stable")
+        inicio_vertice = np.zeros(len(vertices_usados) + 1, dtype=np.int32)
+        np.cumsum(np.bincount(arco_origen, minlength=len(vertices_usados)), out=inicio_vertice[1:])
+
+        arista = arco_arista[orden]
+        osm_ids, arista_osm = np.unique(osm_id[arista], return_inverse=True)
+        arco_costos = arco_costos[orden]
+        return {
+            "inicio_vertice": inicio_vertice,
+            "destino": arco_destino[orden],
+            "origen": arco_origen[orden],
+            "costo_m": arco_costos[:, 0],
+            "tiempo_seg": arco_costos[:, 1],
+            "inverso": arco_inverso[orden],
+            "lon_micro": coordenadas_micro[:, 0],
+            "lat_micro": coordenadas_micro[:, 1],
+            "arista_red_vial": id_arista[arista].astype(np.int32),
+            "arista_osm": arista_osm.astype(np.int32),
+            "osm_ids": osm_ids,
+            "vertice_pgr": vertices_usados,
+        }
+
+    def ejecutar(self):
+        print("-> Construyendo el grafo compacto de la red vial...")
+        inicio = time.perf_counter()
+        try:
+            with psycopg2.connect(**self.db_config) as conn:
+                # Cursor del lado del servidor: la tabla completa nunca se trae de una sola vez
+                with conn.cursor(name="grafo_compacto_aristas") as cur:
+                    cur.itersize = FILAS_POR_LOTE
+                    enteros, costos, bytes_aristas = self._leer_aristas(cur)
+                with conn.cursor() as cur:
+                    ids_vertices, coordenadas, bytes_vertices = self._leer_vertices(cur)
+            conn.close()
+        except psycopg2.Error as e:
+            print(f"   -> ERROR de base de datos al leer la red vial: {e}")
+            return False
+
+        if enteros is None:
+            print("   -> ERROR: 'red_vial' no tiene aristas con topología. Ejecuta 'transform_load_infraestructura.py' primero.")
+            return False
+
+        grafo = self.compactar(enteros, costos, ids_vertices, coordenadas)
+        bytes_compacto = sum(array.nbytes for array in grafo.values())
+        bytes_tipos_bd = enteros.nbytes + costos.nbytes + ids_vertices.nbytes + coordenadas.nbytes
+
+        temporal = self.output_file + ".tmp.npz"
+        np.savez(temporal, **grafo)
+        os.replace(temporal, self.output_file)
+
+        print(f"   -> {len(enteros)} aristas ({len(grafo['destino'])} arcos dirigidos) y {len(grafo['vertice_pgr'])} vértices "
+              f"en {time.perf_counter() - inicio:.1f} s. Archivo: {self.output_file}")
+        print("   -> Memoria del grafo:")
+        print(f"      Filas como tuplas de Python (estimado):  {_formato_mb(bytes_aristas + bytes_vertices)}")
+        print(f"      Arrays con los tipos de la BD (int64/float64): {_formato_mb(bytes_tipos_bd)}")
+        print(f"      Grafo compacto (int32/float32):          {_formato_mb(bytes_compacto)}")
+        return True
+
+
+if __name__ == "__main__":
+    if not ConstructorGrafoCompacto().ejecutar():
+        sys.exit(1)
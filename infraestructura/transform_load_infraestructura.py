@@ -1,14 +1,119 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import glob
+import re
 import subprocess
 import os
 import sys
+import time
 import psycopg2
+import requests
 from dotenv import load_dotenv
 
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+# extract_infraestructura está en esta carpeta (main.py importa este script por su ruta)
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+from comun import metricas
+from comun.db import CursorMedido
+from comun.http_cache import ClienteHTTP
+from extract_infraestructura import (
+    ESTADO_APLICADO_FILENAME, MAX_DIFFS_POR_ACTUALIZACION, ExtractorInfraestructura, leer_secuencia_aplicada,
+    leer_secuencia_estado
+)
+
+# Valores de 'highway' que entran a la red ruteable (vehículos motorizados)
+CLASES_RUTEABLES = (
+    "motorway", "motorway_link", "trunk", "trunk_link", "primary", "primary_link",
+    "secondary", "secondary_link", "tertiary", "tertiary_link", "unclassified",
+    "residential", "living_street", "service", "road"
+)
+# Velocidad (km/h) de las vías sin 'maxspeed' numérico, según su clase (límites de la Ley de Tránsito)
+VELOCIDADES_POR_CLASE = {
+    "motorway": 120, "motorway_link": 60, "trunk": 100, "trunk_link": 60,
+    "primary": 80, "primary_link": 50, "secondary": 60, "secondary_link": 50,
+    "tertiary": 50, "tertiary_link": 40, "unclassified": 50, "residential": 40,
+    "living_street": 20, "service": 20, "road": 40
+}
+# Valores implícitos de 'maxspeed' usados en Chile
+VELOCIDADES_IMPLICITAS = {"CL:urban": 50, "CL:rural": 100, "CL:motorway": 120, "CL:living_street": 20}
+# 'maxspeed' numérico por encima de este valor se considera un error de etiquetado y se ignora
+MAXSPEED_MAXIMA_KMH = 200
+KMH_POR_MPH = 1.609344
+# Valores de 'oneway' que anulan el sentido único implícito de autopistas y rotondas
+ONEWAY_DOBLE_SENTIDO = ("no", "0", "false")
+# Carga de 'red_vial' en paralelo: cantidad de tramos de osm_id y conexiones simultáneas
+TRAMOS_RED_VIAL = 64
+CONEXIONES_RED_VIAL = min(8, os.cpu_count() or 1)
+# Tolerancia (en grados, la geometría de 'red_vial' está en EPSG:4326) para unir extremos de aristas
+TOLERANCIA_TOPOLOGIA = 0.000001
+
+
+class FuenteDiffsGeofabrik:
+    """
+    Archivos de cambios diarios (.osc.gz) que publica Geofabrik para Chile.
+    'state.txt' indica el último número de secuencia y cada diff vive en 'AAA/BBB/CCC.osc.gz'.
+    """
+
+    BASE_URL = "https://download.geofabrik.de/south-america/chile-updates/"
+
+    def __init__(self, directorio_descargas):
+        self.directorio_descargas = directorio_descargas
+        self.client = ClienteHTTP(headers={'User-Agent': 'ProyectoRuteoEconomico-ETL/1.0'})
+
+    def secuencia_actual(self):
+        response = self.client.get(self.BASE_URL + "state.txt", timeout=30)
+        response.raise_for_status()
+        return leer_secuencia_estado(response.text)
+
+    def obtener(self, secuencia):
+        """Descarga el diff 'secuencia' y retorna la ruta local del archivo."""
+        ruta_remota = f"{secuencia:09d}"
+        ruta_remota = f"{ruta_remota[0:3]}/{ruta_remota[3:6]}/{ruta_remota[6:9]}.osc.gz"
+        destino = os.path.join(self.directorio_descargas, f"{secuencia}.osc.gz")
+        os.makedirs(self.directorio_descargas, exist_ok=True)
+        self.client.descargar(self.BASE_URL + ruta_remota, destino, timeout=60)
+        return destino
+
+    def liberar(self, ruta):
+        """Borra el diff una vez aplicado."""
+        if os.path.exists(ruta):
+            os.remove(ruta)
+
+
+class FuenteDiffsLocal:
+    """
+    Diffs en un directorio local, nombrados por su número de secuencia (ej. '123.osc' o '123.osc.gz').
+    Permite probar la actualización incremental sin depender de Geofabrik.
+    """
+
+    def __init__(self, directorio):
+        self.archivos = {}
+        for ruta in glob.glob(os.path.join(directorio, "*.osc*")):
+            coincidencia = re.match(r"(\d+)\.osc(\.gz)?$", os.path.basename(ruta))
+            if coincidencia:
+                self.archivos[int(coincidencia.group(1))] = ruta
+
+    def secuencia_actual(self):
+        return max(self.archivos, default=0)
+
+    def obtener(self, secuencia):
+        if secuencia not in self.archivos:
+            raise ValueError(f"Falta el diff con secuencia {secuencia} en el directorio local.")
+        return self.archivos[secuencia]
+
+    def liberar(self, ruta):
+        pass  # Los archivos locales no se borran
+
 
 class InfraestructuraLoader:
-    def __init__(self):
+    def __init__(self, fuente_diffs=None):
         self.script_dir = os.path.dirname(os.path.realpath(__file__))
         self.pbf_file = os.path.join(self.script_dir, "chile-latest.osm.pbf")
+        # Estado de replicación que extract_infraestructura.py guarda al descargar el PBF
+        self.pbf_estado_file = self.pbf_file + ".state.txt"
+        # Última secuencia de diffs aplicada a la base (se inicializa con cada importación completa)
+        self.estado_file = os.path.join(self.script_dir, ESTADO_APLICADO_FILENAME)
+        self.fuente_diffs = fuente_diffs or FuenteDiffsGeofabrik(os.path.join(self.script_dir, "diffs"))
 
         load_dotenv()
         self.db_config = {
@@ -21,22 +126,30 @@ class InfraestructuraLoader:
         if not all(self.db_config.values()):
             raise ValueError("Faltan variables de BD en el archivo .env.")
 
-    def run_osm2pgsql(self):
-        print("-> [Paso 1/2] Ejecutando osm2pgsql para importar la infraestructura vial...")
-        print("   (Este proceso puede tardar varios minutos)...")
+    def run_osm2pgsql(self, modo="--create", archivo=None):
+        """
+        Ejecuta osm2pgsql. Con '--create' importa el PBF completo; con '--append' aplica un diff
+        (.osc) sobre las tablas slim de una importación anterior.
+        """
+        if modo == "--create":
+            print("-> [Paso 1/2] Ejecutando osm2pgsql para importar la infraestructura vial...")
+            print("   (Este proceso puede tardar varios minutos)...")
+        else:
+            print(f"   -> Aplicando diff {os.path.basename(archivo)} con osm2pgsql --append...")
 
         env = os.environ.copy()
         env['PGPASSWORD'] = self.db_config['password']
 
         command = [
             "osm2pgsql", "-d", self.db_config['dbname'], "-U", self.db_config['user'],
-            "-H", self.db_config['host'], "--create", "--slim", "-C", "2048", "--hstore",
-            "--style", "/usr/share/osm2pgsql/default.style", self.pbf_file
+            "-H", self.db_config['host'], modo, "--slim", "-C", "2048", "--hstore",
+            "--style", "/usr/share/osm2pgsql/default.style", archivo or self.pbf_file
         ]
 
         try:
             subprocess.run(command, check=True, text=True, capture_output=True, env=env)
-            print("   -> ¡osm2pgsql completado exitosamente!")
+            if modo == "--create":
+                print("   -> ¡osm2pgsql completado exitosamente!")
             return True
         except FileNotFoundError:
             print("   -> ERROR: El comando 'osm2pgsql' no fue encontrado.")
@@ -46,52 +159,375 @@ class InfraestructuraLoader:
             print(e.stderr)
             return False
 
+    @staticmethod
+    def _sql_insertar_red_vial(filtro):
+        """
+        INSERT de las vías ruteables de 'planet_osm_line' que cumplen 'filtro' (condición SQL) en 'red_vial'.
+        Las vías con oneway = '-1' se guardan invertidas, para que 'source' -> 'target' sea siempre el sentido permitido.
+        Autopistas y rotondas son de sentido único salvo que la vía tenga 'oneway' = 'no' explícito.
+        El tiempo de viaje usa 'maxspeed' (los valores en mph se pasan a km/h) o, si la vía no lo tiene o está
+        fuera de 1..MAXSPEED_MAXIMA_KMH, la velocidad por defecto de su clase.
+        """
+        clases = ", ".join(f"'{clase}'" for clase in CLASES_RUTEABLES)
+        implicitas = " ".join(f"WHEN '{valor}' THEN {kmh}" for valor, kmh in VELOCIDADES_IMPLICITAS.items())
+        por_clase = " ".join(f"WHEN '{clase}' THEN {kmh}" for clase, kmh in VELOCIDADES_POR_CLASE.items())
+        doble_sentido = ", ".join(f"'{valor}'" for valor in ONEWAY_DOBLE_SENTIDO)
+        return f"""
+            INSERT INTO red_vial (osm_id, clase, nombre, maxspeed_kmh, velocidad_kmh, sentido_unico, largo_m,
+                                  cost, reverse_cost, tiempo_seg, reverse_tiempo_seg, geom)
+            SELECT osm_id, clase, nombre, maxspeed_kmh, velocidad_kmh, sentido_unico, largo_m,
+                   largo_m, CASE WHEN sentido_unico THEN -1 ELSE largo_m END,
+                   tiempo_seg, CASE WHEN sentido_unico THEN -1 ELSE tiempo_seg END, geom
+            FROM (
+                SELECT *, largo_m * 3.6 / velocidad_kmh AS tiempo_seg
+                FROM (
+                    SELECT *, COALESCE(maxspeed_kmh, CASE maxspeed_tag {implicitas} END,
+                                       CASE clase {por_clase} END)::SMALLINT AS velocidad_kmh
+                    FROM (
+                        SELECT l.osm_id, l.highway AS clase, l.name AS nombre, l.tags -> 'maxspeed' AS maxspeed_tag,
+                               -- Se compara como NUMERIC para que etiquetas como '99999' no desborden el SMALLINT
+                               CASE WHEN ROUND(m.maxspeed) BETWEEN 1 AND {MAXSPEED_MAXIMA_KMH}
+                                    THEN ROUND(m.maxspeed)::SMALLINT
+                               END AS maxspeed_kmh,
+                               (l.oneway IN ('yes', '1', 'true', '-1')
+                                OR ((l.highway = 'motorway' OR l.junction = 'roundabout')
+                                    AND COALESCE(l.oneway, '') NOT IN ({doble_sentido}))) AS sentido_unico,
+                               ST_Length(ST_Transform(l.way, 4326)::geography) AS largo_m,
+                               CASE WHEN l.oneway = '-1' THEN ST_Reverse(ST_Transform(l.way, 4326))
+                                    ELSE ST_Transform(l.way, 4326) END AS geom
+                        FROM planet_osm_line l
+                        -- 'maxspeed' numérico en km/h ('50') o en millas por hora ('50 mph')
+                        CROSS JOIN LATERAL (
+                            SELECT substring(l.tags -> 'maxspeed' FROM '^\\d+(?:\\.\\d+)?')::NUMERIC
+                                   * CASE WHEN l.tags -> 'maxspeed' ~* '^[\\d.]+\\s*mph$' THEN {KMH_POR_MPH} ELSE 1 END
+                                   AS maxspeed
+                        ) AS m
+                        WHERE l.highway IN ({clases}) AND {filtro}
+                        ORDER BY l.osm_id
+                    ) AS vias
+                ) AS con_velocidad
+            ) AS con_tiempo;
+        """
+
+    def _ejecutar_sql(self, sql_commands):
+        with psycopg2.connect(**self.db_config, cursor_factory=CursorMedido) as conn:
+            with conn.cursor() as cur:
+                for i, command in enumerate(sql_commands):
+                    print(f"   -> Ejecutando SQL {i + 1}/{len(sql_commands)}...")
+                    cur.execute(command)
+
+    def _reportar_red_vial(self, segundos):
+        """Imprime el tiempo de construcción y el tamaño de 'red_vial' comparado con 'planet_osm_line'."""
+        with psycopg2.connect(**self.db_config, cursor_factory=CursorMedido) as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT (SELECT COUNT(*) FROM red_vial),
+                           pg_size_pretty(pg_total_relation_size('red_vial')),
+                           (SELECT COUNT(*) FROM red_vial_vertices_pgr),
+                           (SELECT reltuples::BIGINT FROM pg_class WHERE relname = 'planet_osm_line'),
+                           pg_size_pretty(pg_total_relation_size('planet_osm_line'));
+                """)
+                aristas, tamano, vertices, lineas, tamano_lineas = cur.fetchone()
+        print(f"   -> 'red_vial' construida en {segundos:.1f} s: {aristas} aristas, {vertices} vértices, {tamano}.")
+        print(f"      (planet_osm_line: ~{lineas} líneas, {tamano_lineas})")
+
+    def _preparar_red_vial(self):
+        """
+        Crea 'red_vial' vacía y la tabla 'red_vial_tramos', que divide las vías ruteables en rangos de
+        osm_id con la misma cantidad de vías cada uno y registra cuáles ya se cargaron.
+
+        osm2pgsql divide las vías largas en varias filas con el mismo osm_id, así que los tramos se
+        reparten sobre los osm_id distintos y los rangos son semiabiertos [desde, hasta): una vía
+        queda siempre en un solo tramo, aunque sus filas caigan en el borde entre dos.
+        """
+        clases = ", ".join(f"'{clase}'" for clase in CLASES_RUTEABLES)
+        self._ejecutar_sql([
+            # Columnas que versiones anteriores agregaban a planet_osm_line para rutear sobre ella
+            'ALTER TABLE planet_osm_line DROP COLUMN IF EXISTS "source", DROP COLUMN IF EXISTS "target", '
+            'DROP COLUMN IF EXISTS "cost", DROP COLUMN IF EXISTS "reverse_cost";',
+            'DROP TABLE IF EXISTS red_vial, red_vial_vertices_pgr, red_vial_tramos;',
+            """
+            CREATE TABLE red_vial (
+                id SERIAL PRIMARY KEY,                  -- ID correlativo de la arista (usado por pgRouting).
+                osm_id BIGINT NOT NULL,                 -- ID de la vía en OpenStreetMap.
+                clase VARCHAR(30) NOT NULL,             -- Valor de 'highway', ej: 'primary', 'residential'.
+                nombre TEXT,
+                maxspeed_kmh SMALLINT,                  -- Velocidad máxima señalizada, si está en OSM.
+                velocidad_kmh SMALLINT NOT NULL,        -- maxspeed_kmh o, si no hay, la velocidad por defecto de la clase.
+                sentido_unico BOOLEAN NOT NULL,         -- Solo se puede recorrer de 'source' a 'target'.
+                largo_m DOUBLE PRECISION NOT NULL,      -- Largo de la vía en metros.
+                cost DOUBLE PRECISION,
+                reverse_cost DOUBLE PRECISION,          -- -1 en vías de sentido único.
+                tiempo_seg DOUBLE PRECISION,            -- Costo en segundos de viaje a velocidad_kmh.
+                reverse_tiempo_seg DOUBLE PRECISION,    -- -1 en vías de sentido único.
+                "source" INTEGER,
+                "target" INTEGER,
+                geom GEOMETRY(LineString, 4326) NOT NULL
+            );
+            """,
+            """
+            CREATE TABLE red_vial_tramos (
+                id SERIAL PRIMARY KEY,
+                osm_id_desde BIGINT NOT NULL,           -- Incluido.
+                osm_id_hasta BIGINT,                    -- Excluido (el osm_id_desde del tramo siguiente); NULL en el último.
+                vias INTEGER NOT NULL,                  -- osm_id distintos del tramo.
+                completado BOOLEAN NOT NULL DEFAULT FALSE
+            );
+            """,
+            f"""
+            INSERT INTO red_vial_tramos (osm_id_desde, osm_id_hasta, vias)
+            SELECT desde, LEAD(desde) OVER (ORDER BY tramo), vias
+            FROM (
+                SELECT tramo, MIN(osm_id) AS desde, COUNT(*) AS vias
+                FROM (
+                    SELECT osm_id, ntile({TRAMOS_RED_VIAL}) OVER (ORDER BY osm_id) AS tramo
+                    FROM (SELECT DISTINCT osm_id FROM planet_osm_line WHERE highway IN ({clases})) AS ids
+                ) AS vias
+                GROUP BY tramo
+            ) AS tramos
+            ORDER BY tramo;
+            """
+        ])
+
+    def _tramos_pendientes(self):
+        """Tramos de 'red_vial_tramos' sin cargar, o None si no hay una construcción en curso."""
+        with psycopg2.connect(**self.db_config, cursor_factory=CursorMedido) as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT to_regclass('red_vial_tramos') IS NOT NULL;")
+                if not cur.fetchone()[0]:
+                    return None
+                cur.execute("SELECT id, osm_id_desde, osm_id_hasta, vias FROM red_vial_tramos WHERE NOT completado ORDER BY id;")
+                return cur.fetchall()
+
+    def _cargar_tramo(self, tramo):
+        """
+        Inserta en 'red_vial' las vías de un tramo, con su largo y costos calculados en la misma pasada,
+        y lo marca como completado en la misma transacción: un tramo queda cargado entero o no queda.
+        """
+        tramo_id, desde, hasta, _ = tramo
+        with psycopg2.connect(**self.db_config, cursor_factory=CursorMedido) as conn:
+            with conn.cursor() as cur:
+                filtro = f"l.osm_id >= {int(desde)}"
+                if hasta is not None:
+                    filtro += f" AND l.osm_id < {int(hasta)}"
+                cur.execute(self._sql_insertar_red_vial(filtro))
+                cur.execute("UPDATE red_vial_tramos SET completado = TRUE WHERE id = %s;", (tramo_id,))
+        conn.close()
+        return tramo
+
+    def _poblar_red_vial(self, tramos):
+        """Carga los tramos pendientes en paralelo, con una conexión por tramo en curso."""
+        with psycopg2.connect(**self.db_config, cursor_factory=CursorMedido) as conn:
+            with conn.cursor() as cur:
+                # Con menos vías que TRAMOS_RED_VIAL, ntile() genera menos tramos
+                cur.execute("SELECT COUNT(*) FROM red_vial_tramos;")
+                total_tramos = cur.fetchone()[0]
+        conn.close()
+        completados = total_tramos - len(tramos)
+        if completados:
+            print(f"   -> Reanudando la construcción: {completados}/{total_tramos} tramos ya estaban cargados.")
+        with ThreadPoolExecutor(max_workers=CONEXIONES_RED_VIAL) as executor:
+            futuros = [executor.submit(metricas.propagar(self._cargar_tramo), tramo) for tramo in tramos]
+            for futuro in as_completed(futuros):
+                _, desde, hasta, vias = futuro.result()
+                completados += 1
+                limite = f"menor a {hasta}" if hasta is not None else "en adelante"
+                print(f"   -> Tramo {completados}/{total_tramos} cargado: {vias} vías (osm_id desde {desde}, {limite}).")
+
     def create_pgrouting_topology(self):
-        print("-> [Paso 2/2] Creando la topología para pgRouting...")
+        """
+        Construye 'red_vial', una tabla de aristas solo con las vías ruteables (sin ríos, tendidos
+        eléctricos ni límites administrativos), con IDs enteros correlativos, largo precalculado,
+        clase de vía, velocidad máxima y sentido, y crea la topología de pgRouting sobre ella.
+
+        Las aristas se cargan por tramos de osm_id en varias conexiones a la vez; si la carga se
+        interrumpe, la siguiente ejecución continúa desde los tramos que faltan.
+        """
+        print("-> [Paso 2/2] Creando la red vial y su topología para pgRouting...")
+        inicio = time.perf_counter()
 
         # --- MEJORA: Comandos separados para un mejor control de errores ---
         sql_commands = [
-            'ALTER TABLE planet_osm_line ADD COLUMN IF NOT EXISTS "source" INTEGER;',
-            'ALTER TABLE planet_osm_line ADD COLUMN IF NOT EXISTS "target" INTEGER;',
-            'ALTER TABLE planet_osm_line ADD COLUMN IF NOT EXISTS "cost" DOUBLE PRECISION;',
-            'ALTER TABLE planet_osm_line ADD COLUMN IF NOT EXISTS "reverse_cost" DOUBLE PRECISION;',
-            'UPDATE planet_osm_line SET cost = ST_Length(ST_Transform(way, 4326)::geography);',
-            'UPDATE planet_osm_line SET reverse_cost = cost;',
-            "UPDATE planet_osm_line SET reverse_cost = -1 WHERE oneway = 'yes';",
-            "SELECT pgr_createTopology('planet_osm_line', 0.00001, 'way', 'osm_id');",
-            'CREATE INDEX IF NOT EXISTS source_idx ON planet_osm_line("source");',
-            'CREATE INDEX IF NOT EXISTS target_idx ON planet_osm_line("target");',
-            'CREATE INDEX IF NOT EXISTS way_idx ON planet_osm_line USING GIST (way);'
+            'CREATE INDEX red_vial_geom_idx ON red_vial USING GIST (geom);',
+            f"SELECT pgr_createTopology('red_vial', {TOLERANCIA_TOPOLOGIA}, 'geom', 'id');",
+            'CREATE INDEX red_vial_source_idx ON red_vial ("source");',
+            'CREATE INDEX red_vial_target_idx ON red_vial ("target");',
+            'CREATE INDEX red_vial_osm_id_idx ON red_vial (osm_id);',
+            # Aristas cercanas quedan en las mismas páginas: menos lecturas al rutear por zonas
+            'CLUSTER red_vial USING red_vial_geom_idx;',
+            'ANALYZE red_vial;',
+            # Marca de sincronización: las filas existentes quedan en TRUE sin reescribir la tabla (DEFAULT
+            # al agregar la columna) y las que osm2pgsql --append inserte después quedan en NULL.
+            'ALTER TABLE planet_osm_line DROP COLUMN IF EXISTS en_red_vial;',
+            'ALTER TABLE planet_osm_line ADD COLUMN en_red_vial BOOLEAN DEFAULT TRUE;',
+            'ALTER TABLE planet_osm_line ALTER COLUMN en_red_vial DROP DEFAULT;',
+            'CREATE INDEX IF NOT EXISTS sin_red_vial_idx ON planet_osm_line (osm_id) WHERE en_red_vial IS NULL;',
+            'DROP TABLE red_vial_tramos;'
         ]
 
         try:
-            with psycopg2.connect(**self.db_config) as conn:
-                with conn.cursor() as cur:
-                    for i, command in enumerate(sql_commands):
-                        print(f"   -> Ejecutando SQL {i + 1}/{len(sql_commands)}...")
-                        cur.execute(command)
-
-            print("   -> ¡Topología de ruteo creada exitosamente!")
+            tramos = self._tramos_pendientes()
+            if tramos is None:
+                self._preparar_red_vial()
+                tramos = self._tramos_pendientes()
+            self._poblar_red_vial(tramos)
+            self._ejecutar_sql(sql_commands)
+            print("   -> ¡Red vial y topología de ruteo creadas exitosamente!")
+            self._reportar_red_vial(time.perf_counter() - inicio)
             return True
         except psycopg2.Error as e:
             print(f"   -> ERROR de base de datos al crear la topología: {e}")
+            print("   Los tramos ya cargados se conservan y la próxima ejecución continuará desde ahí.")
             return False
 
-    def ejecutar(self):
-        """Orquesta la carga de infraestructura, deteniéndose si un paso falla."""
-        if not os.path.exists(self.pbf_file):
-            print(f"ERROR: El archivo '{self.pbf_file}' no existe. Ejecuta 'extract_infraestructura.py' primero.")
+    def update_pgrouting_topology(self):
+        """
+        Actualiza 'red_vial' solo con las vías tocadas por los diffs: osm2pgsql --append borra y vuelve
+        a insertar cada vía modificada, así que son justamente las filas con 'en_red_vial' NULL.
+        Sus aristas (y las de vías eliminadas) se reemplazan, y pgr_createTopology con 'rows_where'
+        conecta las nuevas a los vértices ya existentes.
+        """
+        print("-> Actualizando la red vial y su topología con las vías modificadas...")
+        sql_commands = [
+            """
+            DELETE FROM red_vial r
+            WHERE r.osm_id IN (SELECT osm_id FROM planet_osm_line WHERE en_red_vial IS NULL)
+               OR NOT EXISTS (SELECT 1 FROM planet_osm_line l WHERE l.osm_id = r.osm_id);
+            """,
+            self._sql_insertar_red_vial("l.en_red_vial IS NULL"),
+            f"SELECT pgr_createTopology('red_vial', {TOLERANCIA_TOPOLOGIA}, 'geom', 'id', rows_where := 'source IS NULL');",
+            'UPDATE planet_osm_line SET en_red_vial = TRUE WHERE en_red_vial IS NULL;',
+            'ANALYZE red_vial;'
+        ]
+        try:
+            self._ejecutar_sql(sql_commands)
+            print("   -> ¡Topología actualizada exitosamente!")
+            return True
+        except psycopg2.Error as e:
+            print(f"   -> ERROR de base de datos al actualizar la topología: {e}")
+            return False
+
+    # --- Estado de la replicación ---
+
+    def _leer_secuencia(self):
+        return leer_secuencia_aplicada(self.estado_file)
+
+    def _guardar_secuencia(self, secuencia):
+        with open(self.estado_file, 'w', encoding='utf-8') as f:
+            f.write(f"{secuencia}\n")
+
+    def _existen_tablas_slim(self):
+        """--append necesita las tablas intermedias que deja una importación con --slim."""
+        try:
+            with psycopg2.connect(**self.db_config, cursor_factory=CursorMedido) as conn:
+                with conn.cursor() as cur:
+                    # Una 'red_vial' de una versión anterior (sin tiempos de viaje) también obliga a reconstruirla
+                    cur.execute("""
+                        SELECT to_regclass('planet_osm_ways') IS NOT NULL AND to_regclass('red_vial_vertices_pgr') IS NOT NULL
+                           AND EXISTS (SELECT 1 FROM information_schema.columns
+                                       WHERE table_name = 'red_vial' AND column_name = 'tiempo_seg');
+                    """)
+                    return cur.fetchone()[0]
+        except psycopg2.Error as e:
+            print(f"   -> ERROR de base de datos al revisar las tablas de OSM: {e}")
+            return False
+
+    def importar_completo(self):
+        """
+        Importa el PBF completo y reconstruye la topología desde cero. Antes se asegura de tener el PBF
+        vigente: extract_infraestructura.py no lo descarga cuando los diffs alcanzan, pero aquí pudieron
+        no alcanzar (base sin las tablas de osm2pgsql, o un diff más publicado entre ambos pasos).
+        """
+        # Si quedó una construcción de 'red_vial' a medias, osm2pgsql ya había terminado: se retoma ahí,
+        # con el PBF (y su estado de replicación) que ya se importó
+        try:
+            construccion_pendiente = self._tramos_pendientes() is not None
+        except psycopg2.Error:
+            construccion_pendiente = False
+        if construccion_pendiente:
+            print("-> Se encontró una construcción de la red vial interrumpida; se omite osm2pgsql.")
+        elif not ExtractorInfraestructura().descargar(forzar=True) or not os.path.exists(self.pbf_file):
+            print(f"ERROR: No se pudo obtener el archivo '{self.pbf_file}' para la importación completa.")
             return False
 
-        if self.run_osm2pgsql():
+        # Secuencia registrada al descargar el PBF: la de ahora podría incluir diffs publicados
+        # después, que nunca se aplicarían
+        try:
+            with open(self.pbf_estado_file, 'r', encoding='utf-8') as f:
+                secuencia = leer_secuencia_estado(f.read())
+        except (IOError, ValueError) as e:
+            print(f"   -> Advertencia: No se pudo leer el estado de replicación del PBF ({e}). La próxima carga será completa.")
+            secuencia = None
+
+        if construccion_pendiente or self.run_osm2pgsql():
             if self.create_pgrouting_topology():
+                if secuencia is not None:
+                    self._guardar_secuencia(secuencia)
+                elif os.path.exists(self.estado_file):
+                    os.remove(self.estado_file)
                 return True
         return False
 
+    def actualizar(self):
+        """
+        Aplica los diffs publicados desde la última secuencia registrada. Retorna None si no se puede
+        actualizar de forma incremental (sin estado previo o demasiados diffs pendientes).
+        """
+        secuencia_local = self._leer_secuencia()
+        if secuencia_local is None or not self._existen_tablas_slim():
+            print("-> No hay una importación previa con estado de replicación: se requiere una carga completa.")
+            return None
+        try:
+            secuencia_remota = self.fuente_diffs.secuencia_actual()
+        except (requests.RequestException, ValueError) as e:
+            print(f"   -> ERROR al consultar el estado de replicación: {e}")
+            return False
+
+        pendientes = secuencia_remota - secuencia_local
+        if pendientes <= 0:
+            print(f"-> La infraestructura ya está al día (secuencia {secuencia_local}).")
+            return True
+        if pendientes > MAX_DIFFS_POR_ACTUALIZACION:
+            print(f"-> Hay {pendientes} diffs pendientes: es más rápido reimportar el PBF completo.")
+            return None
+
+        print(f"-> Aplicando {pendientes} diffs (secuencias {secuencia_local + 1} a {secuencia_remota})...")
+        for secuencia in range(secuencia_local + 1, secuencia_remota + 1):
+            try:
+                archivo = self.fuente_diffs.obtener(secuencia)
+            except (requests.RequestException, ValueError) as e:
+                print(f"   -> ERROR al obtener el diff {secuencia}: {e}")
+                return False
+            aplicado = self.run_osm2pgsql("--append", archivo)
+            self.fuente_diffs.liberar(archivo)
+            if not aplicado:
+                return False
+            # Se registra cada diff aplicado: si uno falla, el siguiente intento continúa desde ahí
+            self._guardar_secuencia(secuencia)
+
+        return self.update_pgrouting_topology()
+
+    def ejecutar(self, modo="auto"):
+        """
+        Orquesta la carga de infraestructura, deteniéndose si un paso falla.
+        'auto' aplica los diffs pendientes si hay una importación previa y, si no, importa el PBF completo.
+        """
+        if modo in ("auto", "actualizar"):
+            resultado = self.actualizar()
+            if resultado is not None or modo == "actualizar":
+                return bool(resultado)
+        return self.importar_completo()
+
 
 if __name__ == "__main__":
-    loader = InfraestructuraLoader()
+    parser = argparse.ArgumentParser(description="Carga la infraestructura vial de OSM en PostgreSQL.")
+    parser.add_argument("--modo", choices=["auto", "completo", "actualizar"], default="auto",
+                        help="'completo' reimporta el PBF; 'actualizar' solo aplica diffs; 'auto' elige.")
+    parser.add_argument("--diffs-dir", help="Directorio con diffs locales (<secuencia>.osc[.gz]) en vez de Geofabrik.")
+    args = parser.parse_args()
+
+    loader = InfraestructuraLoader(FuenteDiffsLocal(args.diffs_dir) if args.diffs_dir else None)
     # --- MEJORA: Salir con código de error si la ejecución falla ---
-    if not loader.ejecutar():
+    if not loader.ejecutar(args.modo):
         # Esto le dice a main.py que algo salió mal.
         sys.exit(1)
\ No newline at end of file
@@ -1,45 +1,771 @@
+import argparse
+import ast
+import cProfile
+import fcntl
+import glob
+import hashlib
+import importlib.util
+import json
+import random
+import resource
 import subprocess
 import sys
 import os
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+import requests
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from comun import metricas
+from comun.db import cerrar_pool, conexion
 
+# Cada paso declara los pasos de los que depende; los que no dependen entre sí corren en paralelo.
+# (nombre, script, descripción, dependencias)
 ETL_PIPELINE = [
     # --- INFRAESTRUCTURA ---
-    ("infraestructura/extract_infraestructura.py", "Descargando mapa de Chile desde Geofabrik"),
-    ("infraestructura/transform_load_infraestructura.py", "Procesando y cargando infraestructura a la BD"),
+    ("extract_infraestructura", "infraestructura/extract_infraestructura.py", "Descargando mapa de Chile desde Geofabrik", []),
+    ("load_infraestructura", "infraestructura/transform_load_infraestructura.py", "Procesando y cargando infraestructura a la BD",
+     ["extract_infraestructura"]),
+    ("grafo_compacto", "infraestructura/grafo_compacto.py", "Exportando el grafo compacto de la red vial",
+     ["load_infraestructura"]),
     # --- METADATA ---
-    ("metadata/vehiculos/scraper-chileautos.py", "Extrayendo datos de vehículos (Scraping)"),
-    ("metadata/vehiculos/transform_vehiculos.py", "Transformando datos de vehículos"),
-    ("metadata/vehiculos/load_vehiculos.py", "Cargando vehículos a la BD"),
-    ("metadata/combustible/extract_combustible.py", "Extrayendo datos crudos de combustibles"),
-    ("metadata/combustible/transform_combustibles.py", "Transformando datos de combustibles"),
-    ("metadata/combustible/load_combustible.py", "Cargando combustibles a la BD"),
-    ("metadata/peajes/transform_peajes.py", "Transformando y mapeando datos de peajes"),
-    ("metadata/peajes/load_peajes.py", "Cargando peajes a la BD"),
+    ("scraper_vehiculos", "metadata/vehiculos/scraper-chileautos.py", "Extrayendo datos de vehículos (Scraping)", []),
+    ("transform_vehiculos", "metadata/vehiculos/transform_vehiculos.py", "Transformando datos de vehículos",
+     ["scraper_vehiculos"]),
+    ("load_vehiculos", "metadata/vehiculos/load_vehiculos.py", "Cargando vehículos a la BD", ["transform_vehiculos"]),
+    ("extract_combustible", "metadata/combustible/extract_combustible.py", "Extrayendo datos crudos de combustibles", []),
+    ("transform_combustible", "metadata/combustible/transform_combustibles.py", "Transformando datos de combustibles",
+     ["extract_combustible"]),
+    ("load_combustible", "metadata/combustible/load_combustible.py", "Cargando combustibles a la BD",
+     ["transform_combustible"]),
+    ("transform_peajes", "metadata/peajes/transform_peajes.py", "Transformando y mapeando datos de peajes", []),
+    ("load_peajes", "metadata/peajes/load_peajes.py", "Cargando peajes a la BD", ["transform_peajes"]),
     # --- AMENAZAS ---
-    ("amenazas/trafico/extract_congestion.py", "Extrayendo datos de congestión"),
-    ("amenazas/trafico/transform_congestion.py", "Transformando datos de congestión"),
-    ("amenazas/sismos/extract_transform_sismos.py", "Extrayendo y transformando datos de sismos"),
-    ("amenazas/inundaciones/extract_transform_inundaciones.py", "Extrayendo y transformando datos de inundaciones"),
-    ("amenazas/incendios/extract_transform_incendios.py", "Extrayendo y transformando datos de incendios"),
+    ("extract_congestion", "amenazas/trafico/extract_congestion.py", "Extrayendo datos de congestión", []),
+    ("transform_congestion", "amenazas/trafico/transform_congestion.py", "Transformando datos de congestión",
+     ["extract_congestion"]),
+    ("sismos", "amenazas/sismos/extract_transform_sismos.py", "Extrayendo y transformando datos de sismos", []),
+    ("inundaciones", "amenazas/inundaciones/extract_transform_inundaciones.py",
+     "Extrayendo y transformando datos de inundaciones", []),
+    ("incendios", "amenazas/incendios/extract_transform_incendios.py", "Extrayendo y transformando datos de incendios", []),
 ]
 
-def run_script(script_path, description):
-    print("-" * 70); print(f"▶️  EJECUTANDO: {description}"); print("-" * 70)
+# Pasos cuyo resultado depende solo de archivos locales: (entradas, salidas), como patrones glob.
+# Se omiten si su script, los módulos del proyecto que importa y sus entradas no cambiaron desde la
+# última ejecución exitosa y sus salidas siguen intactas. De un patrón con varios archivos (ej. con fecha
+# en el nombre) cuenta solo el más reciente, que es el que leen los scripts. Los pasos que no aparecen
+# aquí (descargas) siempre corren.
+CACHE_PASOS = {
+    "transform_vehiculos": (["metadata/vehiculos/chileautos_data.json"], ["metadata/vehiculos/metadata_vehiculos.*"]),
+    "load_vehiculos": (["metadata/vehiculos/metadata_vehiculos.*"], []),
+    "transform_combustible": (["metadata/combustible/raw_combustibles_*.json*"],
+                              ["metadata/combustible/transformed_combustibles_*.*"]),
+    "load_combustible": (["metadata/combustible/transformed_combustibles_*.*"], []),
+    "transform_peajes": (["metadata/peajes/precios.json", "metadata/peajes/peajes_mop.json"],
+                         ["metadata/peajes/transformed_peajes.*"]),
+    "load_peajes": (["metadata/peajes/transformed_peajes.*"], []),
+    "transform_congestion": (["amenazas/trafico/raw_congestion_*.json*"],
+                             ["amenazas/trafico/transformed_congestion_*.*"]),
+}
+# Pasos de CACHE_PASOS que cargan a la BD: fuente de 'versiones_datos' que registran al terminar. Solo se
+# omiten si esa fila sigue igual que tras su última ejecución: en una base recreada o restaurada (sin la
+# fila, o con otra fecha) vuelven a correr aunque sus archivos de entrada no hayan cambiado.
+MARCAS_BD_PASOS = {
+    "load_vehiculos": "vehiculos",
+    "load_combustible": "combustibles",
+    "load_peajes": "peajes",
+}
+
+# Punto de entrada de cada script para el modo en proceso: (clase o función del módulo, método o None).
+# La clase se instancia sin argumentos y se llama el método; una función se llama sin argumentos.
+# Todos retornan su estado: un valor verdadero (True o la ruta del archivo generado) si el paso terminó
+# bien. False, None (un punto de entrada que no informa su estado) o sys.exit con código distinto de 0
+# cuentan como error, igual que en un subproceso, donde los scripts salen con código 1 al fallar.
+PUNTOS_ENTRADA = {
+    "infraestructura/extract_infraestructura.py": ("ExtractorInfraestructura", "descargar"),
+    "infraestructura/transform_load_infraestructura.py": ("InfraestructuraLoader", "ejecutar"),
+    "infraestructura/grafo_compacto.py": ("ConstructorGrafoCompacto", "ejecutar"),
+    "metadata/vehiculos/scraper-chileautos.py": ("ejecutar", None),
+    "metadata/vehiculos/transform_vehiculos.py": ("ejecutar", None),
+    "metadata/vehiculos/load_vehiculos.py": ("ejecutar", None),
+    "metadata/combustible/extract_combustible.py": ("RawExtractorCombustibleCNE", "ejecutar"),
+    "metadata/combustible/transform_combustibles.py": ("TransformadorCombustible", "ejecutar"),
+    "metadata/combustible/load_combustible.py": ("CargadorCombustible", "ejecutar_carga"),
+    "metadata/peajes/transform_peajes.py": ("RobustTransformadorPeajes", "transformar"),
+    "metadata/peajes/load_peajes.py": ("CargadorPeajes", "ejecutar_carga"),
+    "amenazas/trafico/extract_congestion.py": ("ExtractorCongestion", "extraer"),
+    "amenazas/trafico/transform_congestion.py": ("TransformadorCongestion", "transformar"),
+    "amenazas/sismos/extract_transform_sismos.py": ("SismosWebScraperETL", "ejecutar"),
+    "amenazas/inundaciones/extract_transform_inundaciones.py": ("InundacionesETL", "ejecutar"),
+    "amenazas/incendios/extract_transform_incendios.py": ("IncendiosConafETL", "ejecutar"),
+}
+
+# Modo --programador: (grupo, pasos, intervalo en segundos, fuentes de 'versiones_datos' que actualiza).
+# Cada grupo se vuelve a ejecutar en su propio intervalo y, si cargó datos nuevos, el sitio web recarga
+# solo las cachés de esas fuentes.
+PROGRAMACION = [
+    ("amenazas", ["extract_congestion", "transform_congestion", "sismos", "inundaciones", "incendios"], 5 * 60, []),
+    ("combustibles", ["extract_combustible", "transform_combustible", "load_combustible"], 60 * 60, ["combustibles"]),
+    ("peajes", ["transform_peajes", "load_peajes"], 24 * 60 * 60, ["peajes"]),
+    ("infraestructura", ["extract_infraestructura", "load_infraestructura", "grafo_compacto"], 24 * 60 * 60, []),
+    ("vehiculos", ["scraper_vehiculos", "transform_vehiculos", "load_vehiculos"], 7 * 24 * 60 * 60, []),
+]
+JITTER_PROGRAMADOR = 0.1  # Hasta ±10% del intervalo, para no consultar las fuentes siempre al mismo segundo
+REINTENTO_BASE_S = 60  # Tras un fallo se reintenta en 1, 2, 4, 8... minutos (hasta 4 veces el intervalo)
+URL_RECARGA_APP = os.getenv("APP_URL_RECARGA", "http://localhost:5001/api/interno/recargar")
+
+MAX_WORKERS_POR_DEFECTO = 4
+DIRECTORIO_RAIZ = os.path.dirname(os.path.realpath(__file__))
+MANIFIESTO_PATH = os.path.join(DIRECTORIO_RAIZ, ".etl_manifiesto.json")
+DIRECTORIO_INFORMES = os.path.join(DIRECTORIO_RAIZ, "informes_etl")
+
+# Los pasos terminan en cualquier orden: se evita que sus mensajes se mezclen
+_print_lock = threading.Lock()
+
+
+def run_script(script_path, description, medicion=None, perfil=None):
+    """
+    Ejecuta un paso en un intérprete nuevo. Si se pasa 'medicion' (dict), se completa con el CPU y el
+    pico de memoria del subproceso y con los contadores de 'comun.metricas' que este deja al salir.
+    Con 'perfil' el paso corre bajo cProfile y sus estadísticas se guardan en esa ruta.
+    """
+    medicion = {} if medicion is None else medicion
+    with _print_lock:
+        print("-" * 70); print(f"▶️  EJECUTANDO: {description}"); print("-" * 70)
     if not os.path.exists(script_path):
-        print(f"❌ ERROR: El script '{script_path}' no fue encontrado.")
+        with _print_lock:
+            print(f"❌ ERROR: El script '{script_path}' no fue encontrado.")
         return False
+
+    descriptor, archivo_metricas = tempfile.mkstemp(prefix="etl_metricas_", suffix=".json")
+    os.close(descriptor)
+    comando = [sys.executable] + (["-m", "cProfile", "-o", perfil] if perfil else []) + [script_path]
     try:
-        result = subprocess.run([sys.executable, script_path], check=True, capture_output=True, text=True)
-        print("   ✅ Tarea completada con éxito.")
-        return True
-    except subprocess.CalledProcessError as e:
-        print(f"❌ ERROR al ejecutar '{script_path}':\n{e.stderr}")
+        with tempfile.TemporaryFile() as salida, tempfile.TemporaryFile() as errores:
+            proceso = subprocess.Popen(comando, stdout=salida, stderr=errores,
+                                       env=dict(os.environ, ETL_METRICAS_ARCHIVO=archivo_metricas))
+            # wait4 entrega el uso de recursos de este subproceso en particular, aunque corran varios a la vez
+            _, estado, uso = os.wait4(proceso.pid, 0)
+            proceso.returncode = os.waitstatus_to_exitcode(estado)
+            errores.seek(0)
+            stderr = errores.read().decode("utf-8", errors="replace")
+        medicion["cpu_s"] = uso.ru_utime + uso.ru_stime
+        medicion["rss_pico_mb"] = uso.ru_maxrss / 1024  # En Linux ru_maxrss viene en KB
+        try:
+            with open(archivo_metricas, "r", encoding="utf-8") as f:
+                medicion.update(json.load(f))
+        except (IOError, ValueError):
+            pass  # El paso no usó 'comun' o terminó sin pasar por atexit
+    finally:
+        os.remove(archivo_metricas)
+
+    if proceso.returncode != 0:
+        with _print_lock:
+            print(f"❌ ERROR al ejecutar '{script_path}':\n{stderr}")
+        return False
+    with _print_lock:
+        print(f"   ✅ Tarea completada con éxito: {description}")
+    return True
+
+
+_modulos = {}
+_modulos_lock = threading.Lock()
+
+
+def _cargar_modulo(script_path):
+    """
+    Importa un script del pipeline como módulo (sin ejecutar su bloque '__main__'), una sola vez por
+    proceso. Los nombres de archivo con guiones impiden un 'import' normal, por eso se usa su ruta.
+    """
+    with _modulos_lock:
+        if script_path not in _modulos:
+            nombre = "etl_" + os.path.splitext(script_path)[0].replace("/", "_").replace("-", "_")
+            spec = importlib.util.spec_from_file_location(nombre, os.path.join(DIRECTORIO_RAIZ, script_path))
+            modulo = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(modulo)
+            _modulos[script_path] = modulo
+        return _modulos[script_path]
+
+
+def run_in_process(script_path, description, medicion=None, perfil=None):
+    """
+    Ejecuta un paso dentro de este mismo intérprete: sin arrancar Python de nuevo, con los módulos ya
+    importados por otros pasos y con el pool de conexiones de 'comun.db' compartido. La salida del paso
+    se ve en vivo. Los scripts sin punto de entrada declarado corren en un subproceso.
+
+    'medicion' se completa con el CPU del hilo del paso (sin los hilos que este lance), el pico de
+    memoria del proceso y los contadores de 'comun.metricas'. Con 'perfil' se guardan las estadísticas
+    de cProfile en esa ruta y el pico de memoria Python del paso según tracemalloc.
+    """
+    if script_path not in PUNTOS_ENTRADA:
+        return run_script(script_path, description, medicion, perfil)
+    medicion = {} if medicion is None else medicion
+    with _print_lock:
+        print("-" * 70); print(f"▶️  EJECUTANDO (en proceso): {description}"); print("-" * 70)
+    atributo, metodo = PUNTOS_ENTRADA[script_path]
+    perfilador = cProfile.Profile() if perfil else None
+    if perfil:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+    cpu_inicio = time.thread_time()
+    resultado, fallo = None, False
+    try:
+        with metricas.en_paso(script_path):
+            objetivo = getattr(_cargar_modulo(script_path), atributo)
+            if perfilador:
+                perfilador.enable()
+            try:
+                resultado = getattr(objetivo(), metodo)() if metodo else objetivo()
+            finally:
+                if perfilador:
+                    perfilador.disable()
+    except SystemExit as e:
+        resultado = e.code in (None, 0)
+    except Exception as e:
+        with _print_lock:
+            print(f"❌ ERROR al ejecutar '{script_path}': {type(e).__name__}: {e}")
+        fallo = True
+    finally:
+        medicion["cpu_s"] = time.thread_time() - cpu_inicio
+        medicion["rss_pico_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        medicion.update(metricas.contadores(script_path))
+        if perfilador:
+            perfilador.dump_stats(perfil)
+            medicion["memoria_python_pico_mb"] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    if fallo:
+        return False
+    if not resultado:
+        with _print_lock:
+            if resultado is None:
+                print(f"❌ ERROR: El paso '{script_path}' no informó su resultado (retornó None).")
+            else:
+                print(f"❌ ERROR: El paso '{script_path}' terminó con errores.")
         return False
+    with _print_lock:
+        print(f"   ✅ Tarea completada con éxito: {description}")
+    return True
+
+
+def medir_overhead(pipeline):
+    """
+    Compara el costo fijo de cada paso en ambos modos, sin ejecutarlo: arrancar un intérprete nuevo e
+    importar el script (subproceso) contra importarlo en este proceso, donde las dependencias que ya
+    importó un paso anterior (pandas, psycopg2, requests...) no se vuelven a cargar.
+    """
+    codigo = ("import importlib.util, sys; spec = importlib.util.spec_from_file_location('paso', sys.argv[1]); "
+              "spec.loader.exec_module(importlib.util.module_from_spec(spec))")
+    print(f"   {'Paso':<24} {'subproceso':>11} {'en proceso':>11}")
+    total_subproceso = total_en_proceso = 0.0
+    for nombre, script, _, _ in pipeline:
+        inicio = time.perf_counter()
+        subprocess.run([sys.executable, "-c", codigo, os.path.join(DIRECTORIO_RAIZ, script)],
+                       check=True, capture_output=True)
+        subproceso = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        _cargar_modulo(script)
+        en_proceso = time.perf_counter() - inicio
+        total_subproceso += subproceso
+        total_en_proceso += en_proceso
+        print(f"   {nombre:<24} {subproceso * 1000:9.0f} ms {en_proceso * 1000:9.0f} ms")
+    print(f"   {'TOTAL':<24} {total_subproceso * 1000:9.0f} ms {total_en_proceso * 1000:9.0f} ms")
+
+
+def _hash_archivos(patrones):
+    """
+    SHA-256 del contenido del archivo más reciente de cada patrón (el nombre no cuenta, así un archivo
+    con otra fecha pero el mismo contenido da el mismo hash). None si algún patrón no tiene archivos.
+    """
+    huella = hashlib.sha256()
+    for patron in patrones:
+        archivos = glob.glob(os.path.join(DIRECTORIO_RAIZ, patron))
+        if not archivos:
+            return None
+        huella.update(patron.encode("utf-8"))
+        with open(max(archivos, key=os.path.getmtime), "rb") as f:
+            for bloque in iter(lambda: f.read(1024 * 1024), b""):
+                huella.update(bloque)
+    return huella.hexdigest()
+
+
+def _modulos_locales(script):
+    """
+    Módulos del proyecto que 'script' importa directa o indirectamente: los de 'comun' y los de su misma
+    carpeta (ej. emparejar_peajes.py y enriquecer_peajes.py para transform_peajes.py). Rutas relativas
+    a DIRECTORIO_RAIZ, ordenadas.
+    """
+    encontrados = set()
+    pendientes = [script]
+    while pendientes:
+        actual = pendientes.pop()
+        try:
+            with open(os.path.join(DIRECTORIO_RAIZ, actual), "r", encoding="utf-8") as f:
+                arbol = ast.parse(f.read())
+        except (OSError, SyntaxError, ValueError):
+            continue
+        for nodo in ast.walk(arbol):
+            if isinstance(nodo, ast.Import):
+                nombres = [alias.name for alias in nodo.names]
+            elif isinstance(nodo, ast.ImportFrom) and nodo.module and not nodo.level:
+                # 'from comun import metricas' importa el módulo comun/metricas.py
+                nombres = [nodo.module] + [f"{nodo.module}.{alias.name}" for alias in nodo.names]
+            else:
+                continue
+            for nombre in nombres:
+                # Primero la carpeta del módulo (así los importan los scripts), luego la raíz del proyecto
+                for base in (os.path.dirname(actual), ""):
+                    ruta = os.path.normpath(os.path.join(base, *nombre.split("."))) + ".py"
+                    if os.path.isfile(os.path.join(DIRECTORIO_RAIZ, ruta)):
+                        if ruta not in encontrados and ruta != script:
+                            encontrados.add(ruta)
+                            pendientes.append(ruta)
+                        break
+    return sorted(encontrados)
+
+
+def _marca_bd(fuente):
+    """
+    'actualizado_en' de 'fuente' en 'versiones_datos', como texto. None si la fila no existe o no se
+    pudo consultar la base (el paso se vuelve a ejecutar).
+    """
+    try:
+        with conexion() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT actualizado_en FROM versiones_datos WHERE fuente = %s;", (fuente,))
+                fila = cur.fetchone()
+    except Exception as e:
+        with _print_lock:
+            print(f"   ⚠️  No se pudo leer la versión de '{fuente}' en la BD ({type(e).__name__}: {e}).")
+        return None
+    return fila[0].isoformat() if fila else None
+
+
+class ManifiestoETL:
+    """
+    Registro en disco ('.etl_manifiesto.json') de la huella de cada paso cacheable en su última
+    ejecución exitosa: hash de su script, de los módulos del proyecto que importa y de sus entradas;
+    hash de sus salidas y, en los pasos que cargan a la BD, su fila de 'versiones_datos'.
+    """
+
+    def __init__(self, path=MANIFIESTO_PATH, pasos_cacheables=CACHE_PASOS, marcas_bd=MARCAS_BD_PASOS):
+        self.path = path
+        self.pasos_cacheables = pasos_cacheables
+        self.marcas_bd = marcas_bd
+        self.lock = threading.Lock()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.registros = json.load(f)
+        except (IOError, ValueError):
+            self.registros = {}
+
+    def huella(self, nombre, script):
+        """
+        Hash del script, los módulos del proyecto que importa y las entradas del paso; None si el paso
+        no es cacheable o falta una entrada.
+        """
+        if nombre not in self.pasos_cacheables:
+            return None
+        entradas, _ = self.pasos_cacheables[nombre]
+        return _hash_archivos([script] + _modulos_locales(script) + entradas)
+
+    def vigente(self, nombre, huella):
+        """
+        True si el paso ya se ejecutó con esta misma huella y sus salidas no cambiaron desde entonces
+        (incluida su fila de 'versiones_datos', si carga a la BD).
+        """
+        registro = self.registros.get(nombre)
+        if huella is None or not registro or registro["huella"] != huella:
+            return False
+        _, salidas = self.pasos_cacheables[nombre]
+        if _hash_archivos(salidas) != registro["salidas"]:
+            return False
+        if nombre in self.marcas_bd:
+            marca = _marca_bd(self.marcas_bd[nombre])
+            return marca is not None and marca == registro.get("marca_bd")
+        return True
+
+    def registrar(self, nombre, huella):
+        _, salidas = self.pasos_cacheables[nombre]
+        # Se lee después de correr el paso: es la fila que dejó su carga
+        marca = _marca_bd(self.marcas_bd[nombre]) if nombre in self.marcas_bd else None
+        with self.lock:
+            self.registros[nombre] = {"huella": huella, "salidas": _hash_archivos(salidas), "marca_bd": marca}
+            temporal = f"{self.path}.tmp"
+            with open(temporal, "w", encoding="utf-8") as f:
+                json.dump(self.registros, f, indent=2, sort_keys=True)
+            os.replace(temporal, self.path)
+
+
+def validar_pipeline(pipeline):
+    """Verifica que las dependencias existan y que no haya ciclos. Lanza ValueError si hay un problema."""
+    pasos = {nombre: dependencias for nombre, _, _, dependencias in pipeline}
+    if len(pasos) != len(pipeline):
+        raise ValueError("Hay pasos con el mismo nombre en el pipeline.")
+    for nombre, dependencias in pasos.items():
+        for dependencia in dependencias:
+            if dependencia not in pasos:
+                raise ValueError(f"El paso '{nombre}' depende de '{dependencia}', que no existe.")
+
+    visitados, en_curso = set(), set()
+
+    def visitar(nombre):
+        if nombre in en_curso:
+            raise ValueError(f"Hay un ciclo de dependencias que pasa por '{nombre}'.")
+        if nombre in visitados:
+            return
+        en_curso.add(nombre)
+        for dependencia in pasos[nombre]:
+            visitar(dependencia)
+        en_curso.discard(nombre)
+        visitados.add(nombre)
+
+    for nombre in pasos:
+        visitar(nombre)
+
+
+def ejecutar_pipeline(pipeline, max_workers=MAX_WORKERS_POR_DEFECTO, ejecutar_paso=run_script,
+                      manifiesto=None, forzar=False, mediciones=None, directorio_perfiles=None):
+    """
+    Ejecuta los pasos en cuanto sus dependencias terminan bien, con a lo más 'max_workers' a la vez.
+    Si un paso falla, solo se omiten los pasos que dependen de él (directa o indirectamente).
+    Con un 'manifiesto', los pasos cacheables sin cambios no se vuelven a ejecutar, salvo con 'forzar'.
+
+    'mediciones' (dict) se llena con los recursos de cada paso ejecutado (ver 'run_script') y el hilo
+    en que corrió. Con 'directorio_perfiles' se guarda ahí un perfil cProfile por paso.
+
+    Retorna un diccionario nombre -> (estado, inicio, fin), con estado 'ok', 'cache', 'error' u
+    'omitido' y tiempos relativos al inicio del pipeline (None en los omitidos).
+    """
+    validar_pipeline(pipeline)
+    pasos = {nombre: (script, descripcion, dependencias) for nombre, script, descripcion, dependencias in pipeline}
+    resultados = {}
+    pendientes = dict(pasos)
+    en_curso = {}
+    inicio_pipeline = time.perf_counter()
+
+    def ejecutar_medido(nombre, script, descripcion):
+        # El inicio se toma al empezar a correr, no al encolar: la espera por un worker libre no cuenta
+        inicio = time.perf_counter() - inicio_pipeline
+        # La huella se calcula antes de correr: son las entradas que el paso efectivamente leyó
+        huella = manifiesto.huella(nombre, script) if manifiesto else None
+        if not forzar and manifiesto and manifiesto.vigente(nombre, huella):
+            with _print_lock:
+                print(f"   💾 Sin cambios desde la última ejecución, se omite: {descripcion}")
+            return inicio, "cache"
+        medicion = {"hilo": threading.get_ident()}
+        if mediciones is not None:
+            mediciones[nombre] = medicion
+        perfil = os.path.join(directorio_perfiles, f"{nombre}.prof") if directorio_perfiles else None
+        if perfil:
+            medicion["perfil"] = perfil
+        if not ejecutar_paso(script, descripcion, medicion, perfil):
+            return inicio, "error"
+        if huella is not None:
+            manifiesto.registrar(nombre, huella)
+        return inicio, "ok"
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pendientes or en_curso:
+            # Se omiten los pasos con alguna dependencia fallida u omitida, y se lanzan los que ya pueden correr
+            for nombre, (script, descripcion, dependencias) in list(pendientes.items()):
+                estados = [resultados[d][0] if d in resultados else None for d in dependencias]
+                if any(estado in ("error", "omitido") for estado in estados):
+                    resultados[nombre] = ("omitido", None, None)
+                    del pendientes[nombre]
+                elif all(estado in ("ok", "cache") for estado in estados):
+                    en_curso[executor.submit(ejecutar_medido, nombre, script, descripcion)] = nombre
+                    del pendientes[nombre]
+
+            if not en_curso:
+                continue
+            terminados, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+            for futuro in terminados:
+                nombre = en_curso.pop(futuro)
+                fin = time.perf_counter() - inicio_pipeline
+                try:
+                    inicio, estado = futuro.result()
+                except Exception as e:
+                    with _print_lock:
+                        print(f"❌ ERROR inesperado en '{nombre}': {e}")
+                    inicio, estado = fin, "error"
+                resultados[nombre] = (estado, inicio, fin)
+
+    return resultados
+
+
+def _duracion(resultado):
+    _, inicio, fin = resultado
+    return fin - inicio if fin is not None else None
+
+
+def escribir_informe(pipeline, resultados, mediciones, directorio, parametros):
+    """
+    Escribe el informe de la ejecución en 'directorio': 'ejecucion_<fecha>.json' con los tiempos y
+    recursos de cada paso, y 'ejecucion_<fecha>.trace.json' con la línea de tiempo en el formato de
+    Chrome Trace (se abre en chrome://tracing o ui.perfetto.dev), una fila por worker.
+    Retorna la ruta del informe anterior, si existe, y la del nuevo.
+    """
+    os.makedirs(directorio, exist_ok=True)
+    anteriores = sorted(glob.glob(os.path.join(directorio, "ejecucion_*[0-9].json")))
+    marca = datetime.now().strftime("%Y%m%d_%H%M%S")
+    ruta_informe = os.path.join(directorio, f"ejecucion_{marca}.json")
+
+    pasos = []
+    for nombre, script, _, dependencias in pipeline:
+        estado, inicio, fin = resultados[nombre]
+        medicion = {k: v for k, v in mediciones.get(nombre, {}).items() if k != "hilo"}
+        pasos.append({"nombre": nombre, "script": script, "dependencias": dependencias, "estado": estado,
+                      "inicio_s": inicio, "fin_s": fin, "duracion_s": _duracion(resultados[nombre]), **medicion})
+    informe = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "parametros": parametros,
+        "duracion_total_s": max((fin for _, _, fin in resultados.values() if fin is not None), default=0.0),
+        "ruta_critica": ruta_critica(pipeline, resultados),
+        "pasos": pasos,
+    }
+    with open(ruta_informe, "w", encoding="utf-8") as f:
+        json.dump(informe, f, indent=2, ensure_ascii=False)
+
+    # Cada worker es una fila de la línea de tiempo; los pasos desde caché también aparecen (duran ~0)
+    filas = {}
+    eventos = []
+    for paso in pasos:
+        if paso["fin_s"] is None:
+            continue
+        hilo = mediciones.get(paso["nombre"], {}).get("hilo", 0)
+        fila = filas.setdefault(hilo, len(filas) + 1)
+        argumentos = {k: v for k, v in paso.items() if k not in ("nombre", "inicio_s", "fin_s", "dependencias")}
+        eventos.append({"name": paso["nombre"], "cat": paso["estado"], "ph": "X", "pid": 1, "tid": fila,
+                        "ts": round(paso["inicio_s"] * 1e6), "dur": round(paso["duracion_s"] * 1e6),
+                        "args": argumentos})
+    eventos += [{"name": "thread_name", "ph": "M", "pid": 1, "tid": fila, "args": {"name": f"worker {fila}"}}
+                for fila in filas.values()]
+    eventos.append({"name": "process_name", "ph": "M", "pid": 1, "args": {"name": "pipeline ETL"}})
+    with open(os.path.join(directorio, f"ejecucion_{marca}.trace.json"), "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": eventos, "displayTimeUnit": "ms"}, f)
+
+    return (anteriores[-1] if anteriores else None), ruta_informe
+
+
+def comparar_con_anterior(ruta_anterior, ruta_actual, umbral=0.25, minimo_s=1.0):
+    """Muestra los pasos cuya duración cambió más de 'umbral' (y más de 'minimo_s') respecto del informe anterior."""
+    try:
+        with open(ruta_anterior, "r", encoding="utf-8") as f:
+            anterior = {paso["nombre"]: paso for paso in json.load(f)["pasos"]}
+        with open(ruta_actual, "r", encoding="utf-8") as f:
+            actual = json.load(f)["pasos"]
+    except (IOError, ValueError, KeyError):
+        return
+    cambios = []
+    for paso in actual:
+        previo = anterior.get(paso["nombre"])
+        if not previo or paso["estado"] != "ok" or previo["estado"] != "ok":
+            continue
+        diferencia = paso["duracion_s"] - previo["duracion_s"]
+        if abs(diferencia) >= minimo_s and abs(diferencia) >= umbral * previo["duracion_s"]:
+            cambios.append((paso["nombre"], previo["duracion_s"], paso["duracion_s"]))
+    if cambios:
+        print(f"\n   Cambios respecto de {os.path.basename(ruta_anterior)}:")
+        for nombre, antes, ahora in cambios:
+            print(f"   {'🔺' if ahora > antes else '🔻'} {nombre:<24} {antes:7.1f} s → {ahora:7.1f} s")
+
+
+def ruta_critica(pipeline, resultados):
+    """
+    Cadena de pasos que determinó el tiempo total: parte del último paso en terminar y retrocede
+    por la dependencia que terminó más tarde.
+    """
+    dependencias = {nombre: deps for nombre, _, _, deps in pipeline}
+    ejecutados = {nombre: r for nombre, r in resultados.items() if r[2] is not None}
+    if not ejecutados:
+        return []
+    actual = max(ejecutados, key=lambda nombre: ejecutados[nombre][2])
+    ruta = [actual]
+    while True:
+        previas = [d for d in dependencias[actual] if d in ejecutados]
+        if not previas:
+            break
+        actual = max(previas, key=lambda nombre: ejecutados[nombre][2])
+        ruta.append(actual)
+    return list(reversed(ruta))
+
+
+def imprimir_resumen(pipeline, resultados, mediciones=None):
+    iconos = {"ok": "✅", "cache": "💾", "error": "❌", "omitido": "⏭️ "}
+    print("\n" + "=" * 70); print("📋 RESUMEN DEL PIPELINE"); print("=" * 70)
+    for nombre, _, _, _ in pipeline:
+        estado, inicio, fin = resultados[nombre]
+        tiempos = f"{fin - inicio:7.1f} s  (de {inicio:.1f} a {fin:.1f} s)" if fin is not None else ""
+        print(f"   {iconos[estado]} {nombre:<24} {estado:<8} {tiempos}")
+
+    if mediciones:
+        print(f"\n   {'Recursos':<27} {'CPU':>8} {'RSS pico':>9} {'filas leídas':>13} {'escritas':>10} {'descargado':>11}")
+        for nombre, _, _, _ in pipeline:
+            medicion = mediciones.get(nombre)
+            if not medicion or "cpu_s" not in medicion:
+                continue
+            print(f"   {nombre:<27} {medicion['cpu_s']:6.1f} s {medicion['rss_pico_mb']:6.0f} MB "
+                  f"{medicion.get('filas_leidas', 0):13} {medicion.get('filas_escritas', 0):10} "
+                  f"{medicion.get('bytes_descargados', 0) / 1024 / 1024:8.1f} MB")
+
+    duraciones = [fin - inicio for _, inicio, fin in resultados.values() if fin is not None]
+    total = max((fin for _, _, fin in resultados.values() if fin is not None), default=0.0)
+    ruta = ruta_critica(pipeline, resultados)
+    print(f"\n   Tiempo total: {total:.1f} s (suma de los pasos: {sum(duraciones):.1f} s)")
+    if ruta:
+        detalle = " → ".join(f"{nombre} ({resultados[nombre][2] - resultados[nombre][1]:.1f} s)" for nombre in ruta)
+        print(f"   Ruta crítica: {detalle}")
+
+
+class Programador:
+    """
+    Vuelve a ejecutar cada grupo de PROGRAMACION en su intervalo, en paralelo con el sitio web:
+
+    - Cada grupo corre en su propio hilo; un grupo que sigue en curso no se vuelve a lanzar, y un
+      archivo de bloqueo por grupo evita que lo ejecute a la vez otro proceso (ej. un 'main.py' manual).
+    - Tras un fallo se reintenta con espera exponencial; al volver a funcionar se retoma el intervalo.
+    - Si el grupo cargó datos nuevos, se avisa al sitio web qué fuentes recargar. El aviso es
+      best-effort: si el sitio no responde, sus cachés igual detectan la nueva versión por su cuenta.
+    """
+
+    def __init__(self, programacion=PROGRAMACION, ejecutar_paso=run_in_process, workers=MAX_WORKERS_POR_DEFECTO,
+                 manifiesto=None, url_recarga=URL_RECARGA_APP):
+        self.programacion = programacion
+        self.ejecutar_paso = ejecutar_paso
+        self.workers = workers
+        self.manifiesto = manifiesto
+        self.url_recarga = url_recarga
+        # Al iniciar, main.py recién ejecutó todo: la primera vuelta de cada grupo es tras un intervalo
+        ahora = time.monotonic()
+        self.estado = {grupo: {"proxima": ahora + self._con_jitter(intervalo), "fallos": 0, "hilo": None}
+                       for grupo, _, intervalo, _ in programacion}
+
+    @staticmethod
+    def _con_jitter(segundos):
+        return segundos * random.uniform(1 - JITTER_PROGRAMADOR, 1 + JITTER_PROGRAMADOR)
+
+    @staticmethod
+    def _subpipeline(pasos):
+        """Los pasos del grupo, con sus dependencias restringidas al grupo."""
+        return [(nombre, script, descripcion, [d for d in dependencias if d in pasos])
+                for nombre, script, descripcion, dependencias in ETL_PIPELINE if nombre in pasos]
+
+    def _notificar_app(self, fuentes):
+        cabeceras = {"X-Token-Recarga": os.getenv("APP_TOKEN_RECARGA", "")}
+        try:
+            respuesta = requests.post(self.url_recarga, json={"fuentes": fuentes}, headers=cabeceras, timeout=5)
+            respuesta.raise_for_status()
+            print(f"   -> [programador] El sitio web recargará: {', '.join(fuentes)}.")
+        except requests.RequestException as e:
+            print(f"   -> [programador] Advertencia: No se pudo avisar al sitio web ({e}).")
+
+    def _ejecutar_grupo(self, grupo, pasos, intervalo, fuentes):
+        estado = self.estado[grupo]
+        with open(os.path.join(tempfile.gettempdir(), f"etl_programador_{grupo}.lock"), "w") as bloqueo:
+            try:
+                fcntl.flock(bloqueo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                print(f"⏭️  [programador] '{grupo}' ya se está ejecutando en otro proceso; se reintentará.")
+                estado["proxima"] = time.monotonic() + self._con_jitter(REINTENTO_BASE_S)
+                return
+
+            print(f"🔄 [programador] Ejecutando '{grupo}'...")
+            inicio = time.perf_counter()
+            resultados = ejecutar_pipeline(self._subpipeline(pasos), self.workers, self.ejecutar_paso,
+                                           manifiesto=self.manifiesto)
+        exito = all(r[0] in ("ok", "cache") for r in resultados.values())
+        datos_nuevos = any(r[0] == "ok" for r in resultados.values())
+        if exito:
+            estado["fallos"] = 0
+            espera = self._con_jitter(intervalo)
+            print(f"✅ [programador] '{grupo}' terminó en {time.perf_counter() - inicio:.1f} s; "
+                  f"próxima en {espera / 60:.0f} min.")
+            if datos_nuevos and fuentes:
+                self._notificar_app(fuentes)
+        else:
+            estado["fallos"] += 1
+            espera = self._con_jitter(min(REINTENTO_BASE_S * 2 ** (estado["fallos"] - 1), 4 * intervalo))
+            print(f"❌ [programador] '{grupo}' falló (fallos seguidos: {estado['fallos']}); reintento en {espera / 60:.1f} min.")
+        estado["proxima"] = time.monotonic() + espera
+
+    def ejecutar(self):
+        print("⏰ PROGRAMADOR DE ACTUALIZACIONES INICIADO ⏰")
+        for grupo, _, intervalo, _ in self.programacion:
+            print(f"   -> '{grupo}' cada {intervalo / 60:.0f} min.")
+        try:
+            while True:
+                ahora = time.monotonic()
+                for grupo, pasos, intervalo, fuentes in self.programacion:
+                    estado = self.estado[grupo]
+                    en_curso = estado["hilo"] is not None and estado["hilo"].is_alive()
+                    if not en_curso and ahora >= estado["proxima"]:
+                        estado["hilo"] = threading.Thread(target=self._ejecutar_grupo, name=f"programador-{grupo}",
+                                                          args=(grupo, pasos, intervalo, fuentes), daemon=True)
+                        estado["hilo"].start()
+                proxima = min(estado["proxima"] for estado in self.estado.values())
+                time.sleep(min(max(proxima - time.monotonic(), 1), 30))
+        except KeyboardInterrupt:
+            print("\n⏹️  Programador detenido.")
+        finally:
+            cerrar_pool()
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ejecuta el pipeline ETL completo.")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS_POR_DEFECTO,
+                        help=f"Pasos que pueden correr a la vez (por defecto {MAX_WORKERS_POR_DEFECTO}; 1 = secuencial).")
+    parser.add_argument("--modo-ejecucion", choices=["proceso", "subproceso"], default="proceso",
+                        help="'proceso' corre los pasos en este intérprete; 'subproceso' aísla cada uno en un Python nuevo.")
+    parser.add_argument("--medir-overhead", action="store_true",
+                        help="Solo mide el costo fijo de cada paso en ambos modos, sin ejecutar el pipeline.")
+    parser.add_argument("--programador", action="store_true",
+                        help="Queda corriendo y vuelve a ejecutar cada grupo de fuentes según PROGRAMACION.")
+    parser.add_argument("--force", action="store_true",
+                        help="Ejecuta todos los pasos aunque sus entradas no hayan cambiado.")
+    parser.add_argument("--perfilar", action="store_true",
+                        help="Guarda un perfil cProfile por paso (y, en proceso, su pico de memoria según tracemalloc).")
+    parser.add_argument("--informes-dir", default=DIRECTORIO_INFORMES,
+                        help="Directorio del informe JSON y la línea de tiempo (Chrome Trace) de cada ejecución.")
+    args = parser.parse_args()
+
+    if args.medir_overhead:
+        print("⏱️  COSTO FIJO POR PASO (arranque del intérprete e imports)")
+        medir_overhead(ETL_PIPELINE)
+        sys.exit(0)
+
+    ejecutar_paso = run_in_process if args.modo_ejecucion == "proceso" else run_script
+    if args.programador:
+        Programador(ejecutar_paso=ejecutar_paso, workers=max(1, args.workers), manifiesto=ManifiestoETL()).ejecutar()
+        sys.exit(0)
+
     print("🚀 INICIANDO PIPELINE DE EXTRACCIÓN Y CARGA DE DATOS 🚀")
-    for path, desc in ETL_PIPELINE:
-        if not run_script(path, desc):
-            print("\n🛑 El pipeline se detuvo debido a un error.")
-            sys.exit(1)
-    print("\n🎉 ¡TODOS LOS PROCESOS ETL SE COMPLETARON EXITOSAMENTE! 🎉")
\ No newline at end of file
+    workers = max(1, args.workers)
+    directorio_perfiles = None
+    if args.perfilar:
+        directorio_perfiles = os.path.join(args.informes_dir, "perfiles_" + datetime.now().strftime("%Y%m%d_%H%M%S"))
+        os.makedirs(directorio_perfiles, exist_ok=True)
+        if args.modo_ejecucion == "proceso" and workers > 1:
+            # tracemalloc mide todo el proceso: su pico solo es atribuible a un paso si corren de a uno
+            print("   -> Con --perfilar en proceso los pasos corren de a uno.")
+            workers = 1
+    mediciones = {}
+    try:
+        resultados = ejecutar_pipeline(ETL_PIPELINE, workers, ejecutar_paso, manifiesto=ManifiestoETL(),
+                                       forzar=args.force, mediciones=mediciones,
+                                       directorio_perfiles=directorio_perfiles)
+    finally:
+        cerrar_pool()
+    imprimir_resumen(ETL_PIPELINE, resultados, mediciones)
+    anterior, informe = escribir_informe(ETL_PIPELINE, resultados, mediciones, args.informes_dir, {
+        "modo_ejecucion": args.modo_ejecucion, "workers": workers, "force": args.force, "perfilar": args.perfilar})
+    print(f"\n   Informe: {informe} (línea de tiempo en '.trace.json')")
+    if directorio_perfiles:
+        print(f"   Perfiles: {directorio_perfiles}")
+    if anterior:
+        comparar_con_anterior(anterior, informe)
+    if any(estado not in ("ok", "cache") for estado, _, _ in resultados.values()):
+        print("\n🛑 El pipeline terminó con errores; los pasos que dependían de un paso fallido se omitieron.")
+        sys.exit(1)
+    print("\n🎉 ¡TODOS LOS PROCESOS ETL SE COMPLETARON EXITOSAMENTE! 🎉")
@@ -1,9 +1,12 @@
 import requests
 import json
-from datetime import datetime
 import os
+import sys
 from dotenv import load_dotenv
 
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..'))
+from comun.artefactos import AlmacenArtefactos
+
 
 class RawExtractorCombustibleCNE:
     """
@@ -26,6 +29,7 @@ class RawExtractorCombustibleCNE:
 
         self.token = None
         self.output_dir = os.path.dirname(os.path.realpath(__file__))
+        self.almacen_crudos = AlmacenArtefactos(self.output_dir, "raw_combustibles")
         self.url_login = "https://api.cne.cl/api/login"
         self.url_estaciones_base = "https://api.cne.cl/api/v4/estaciones"
         self.headers = {'Accept': 'application/json', 'User-Agent': 'RuteoEconomico-Extractor/1.0'}
@@ -82,14 +86,11 @@ class RawExtractorCombustibleCNE:
 
     def guardar_datos_crudos(self, datos_crudos):
         """
-        Guarda la lista de datos crudos directamente en un archivo JSON.
+        Guarda la lista de datos crudos como JSON comprimido ('raw_combustibles_<fecha>.json.gz')
+        y la deja como la versión más reciente para la transformación.
         """
-        timestamp_str = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        filename_json = f"raw_combustibles_{timestamp_str}.json"
-        filepath_json = os.path.join(self.output_dir, filename_json)
         try:
-            with open(filepath_json, 'w', encoding='utf-8') as f:
-                json.dump(datos_crudos, f, ensure_ascii=False, indent=2)
+            filepath_json = self.almacen_crudos.guardar_crudo(datos_crudos)
             print(f"Archivo JSON con datos crudos generado exitosamente en: {filepath_json}")
             return filepath_json
         except IOError as e:
@@ -99,13 +100,14 @@ class RawExtractorCombustibleCNE:
     def ejecutar(self):
         """
         Orquesta el proceso de extracción y guardado de datos crudos.
+        Retorna la ruta del archivo crudo guardado, o False si algún paso falló.
         """
         if not self.obtener_token_cne():
-            return None
+            return False
         datos_crudos = self.extraer_datos_crudos()
         if datos_crudos:
-            return self.guardar_datos_crudos(datos_crudos)
-        return None
+            return self.guardar_datos_crudos(datos_crudos) or False
+        return False
 
 
 if __name__ == "__main__":
@@ -116,6 +118,8 @@ if __name__ == "__main__":
             print("\nProceso de extracción finalizado con éxito.")
         else:
             print("\nEl proceso de extracción falló.")
+            sys.exit(1)
     except Exception as e:
         # Captura errores de inicialización (ej. si faltan las variables en .env)
-        print(f"Ha ocurrido un error inesperado durante la ejecución: {e}")
\ No newline at end of file
+        print(f"Ha ocurrido un error inesperado durante la ejecución: {e}")
+        sys.exit(1)
\ No newline at end of file
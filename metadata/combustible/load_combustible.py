@@ -1,13 +1,16 @@
-import json
 import os
-import glob
+import sys
 import psycopg2
 from dotenv import load_dotenv
 
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..'))
+from comun.artefactos import AlmacenArtefactos, leer_artefacto
+from comun.db import conexion
+
 
 class CargadorCombustible:
     """
-    Carga los datos transformados de combustibles desde un archivo JSON
+    Carga los datos transformados de combustibles desde un artefacto (JSON, NDJSON o NPZ)
     a las tablas 'estaciones_servicio' y 'precios_combustibles' en PostgreSQL.
     """
 
@@ -28,41 +31,53 @@ class CargadorCombustible:
 
     def encontrar_ultimo_json_transformado(self):
         """
-        Encuentra el archivo transformed_combustibles_*.json más reciente.
+        Encuentra el archivo transformed_combustibles_* más reciente, en cualquier formato.
         """
         try:
-            lista_de_archivos = glob.glob(os.path.join(self.script_dir, 'transformed_combustibles_*.json'))
-            if not lista_de_archivos:
-                return None
-            return max(lista_de_archivos, key=os.path.getctime)
+            return AlmacenArtefactos(self.script_dir, "transformed_combustibles").ultima()
         except Exception as e:
             print(f"Error al buscar el archivo JSON transformado: {e}")
             return None
 
+    def refrescar_agregados(self, cur):
+        """
+        Refresca la vista materializada 'precios_combustibles_region' y registra la nueva
+        versión de los datos en 'versiones_datos', para que el sitio web recargue su caché.
+        Se usa CONCURRENTLY para que la vista se pueda seguir consultando durante el refresco.
+        """
+        print("Refrescando agregados regionales de precios (precios_combustibles_region)...")
+        cur.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY precios_combustibles_region;")
+        cur.execute(
+            """
+            INSERT INTO versiones_datos (fuente, actualizado_en)
+            VALUES ('combustibles', NOW())
+            ON CONFLICT (fuente) DO UPDATE SET actualizado_en = EXCLUDED.actualizado_en;
+            """
+        )
+
     def ejecutar_carga(self):
         """
-        Orquesta el proceso completo de carga a la base de datos.
+        Orquesta el proceso completo de carga a la base de datos. Retorna False si la carga falló.
         """
         print("--- Iniciando Proceso de Carga de Datos de Combustibles ---")
 
         json_path = self.encontrar_ultimo_json_transformado()
         if not json_path:
-            print(f"Error: No se encontró ningún archivo 'transformed_combustibles_*.json' en '{self.script_dir}'.")
-            return
+            print(f"Error: No se encontró ningún archivo 'transformed_combustibles_*' en '{self.script_dir}'.")
+            return False
 
         print(f"Cargando datos desde: {os.path.basename(json_path)}")
 
         try:
-            with open(json_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-        except (json.JSONDecodeError, IOError) as e:
-            print(f"Error al leer el archivo JSON: {e}")
-            return
+            # Las estaciones se leen a medida que se insertan
+            _, estaciones = leer_artefacto(json_path, clave_registros="estaciones")
+        except (ValueError, OSError) as e:
+            print(f"Error al leer el archivo de datos: {e}")
+            return False
 
-        conn = None
         try:
-            # Establecer conexión
-            with psycopg2.connect(**self.db_config) as conn:
+            # Conexión del pool compartido (se revierte sola si hay un error)
+            with conexion() as conn:
                 with conn.cursor() as cur:
                     print("Conexión a la base de datos establecida exitosamente.")
 
@@ -73,8 +88,8 @@ class CargadorCombustible:
                     estaciones_insertadas = 0
                     precios_insertados = 0
 
-                    # Iterar sobre las estaciones del JSON
-                    for estacion in data.get('estaciones', []):
+                    # Iterar sobre las estaciones del artefacto
+                    for estacion in estaciones:
                         # Insertar en la tabla 'estaciones_servicio'
                         cur.execute(
                             """
@@ -109,22 +124,21 @@ class CargadorCombustible:
                             )
                             precios_insertados += 1
 
+                    self.refrescar_agregados(cur)
+
                     print(f"\n¡Carga completada!")
                     print(f"  -> Se insertaron {estaciones_insertadas} estaciones.")
                     print(f"  -> Se insertaron {precios_insertados} precios.")
+            return True
 
         except psycopg2.Error as e:
             print(f"\nError de base de datos durante la carga: {e}")
-            if conn:
-                conn.rollback()  # Revertir cambios si hay un error
         except Exception as e:
             print(f"\nOcurrió un error inesperado: {e}")
-        finally:
-            if conn:
-                conn.close()
-                print("Conexión a la base de datos cerrada.")
+        return False
 
 
 if __name__ == "__main__":
     cargador = CargadorCombustible()
-    cargador.ejecutar_carga()
\ No newline at end of file
+    if not cargador.ejecutar_carga():
+        sys.exit(1)
\ No newline at end of file
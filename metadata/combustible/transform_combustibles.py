@@ -1,12 +1,16 @@
-import json
 import os
-import glob
+import sys
 from datetime import datetime
 
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..'))
+from comun.artefactos import AlmacenArtefactos, leer_crudo
+
 
 class TransformadorCombustible:
     def __init__(self):
         self.script_dir = os.path.dirname(os.path.realpath(__file__))
+        self.almacen_crudos = AlmacenArtefactos(self.script_dir, "raw_combustibles")
+        self.almacen_transformados = AlmacenArtefactos(self.script_dir, "transformed_combustibles")
         self.COMBUSTIBLE_KEY_MAP = {
             "93": "gasolina_93", "A93": "gasolina_93",
             "95": "gasolina_95", "A95": "gasolina_95",
@@ -18,9 +22,7 @@ class TransformadorCombustible:
 
     def encontrar_ultimo_json_crudo(self):
         try:
-            lista_de_archivos = glob.glob(os.path.join(self.script_dir, 'raw_combustibles_*.json'))
-            if not lista_de_archivos: return None
-            return max(lista_de_archivos, key=os.path.getctime)
+            return self.almacen_crudos.ultima()
         except Exception as e:
             print(f"Error al buscar el archivo JSON crudo: {e}")
             return None
@@ -106,52 +108,49 @@ class TransformadorCombustible:
         return estaciones_finales
 
     def guardar_json_transformado(self, datos_transformados):
-        timestamp_str = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        filename_json = f"transformed_combustibles_{timestamp_str}.json"
-        filepath_json = os.path.join(self.script_dir, filename_json)
-
-        final_data = {
-            "metadata": {
-                "fuente": "Transformación de datos crudos CNE",
-                "fecha_transformacion": datetime.now().isoformat(),
-                "total_estaciones_procesadas": len(datos_transformados)
-            },
-            "estaciones": datos_transformados
+        metadata = {
+            "fuente": "Transformación de datos crudos CNE",
+            "fecha_transformacion": datetime.now().isoformat(),
+            "total_estaciones_procesadas": len(datos_transformados)
         }
 
         try:
-            with open(filepath_json, 'w', encoding='utf-8') as f:
-                json.dump(final_data, f, ensure_ascii=False, indent=2)
-            print(f"Archivo JSON transformado guardado exitosamente en: {filepath_json}")
+            # Formato según ETL_FORMATO_ARTEFACTOS; en JSON se mantiene {"metadata": ..., "estaciones": [...]}
+            filepath_json, _ = self.almacen_transformados.guardar(datos_transformados, metadata,
+                                                                 clave_registros="estaciones")
+            print(f"Archivo transformado guardado exitosamente en: {filepath_json}")
             return filepath_json
         except IOError as e:
             print(f"Error al guardar el archivo JSON transformado: {e}")
             return None
 
     def ejecutar(self):
+        """Transforma el crudo más reciente. Retorna True si se guardó el archivo transformado, False si no."""
         print("--- Iniciando proceso de Transformación de Datos de Combustibles ---")
         archivo_crudo = self.encontrar_ultimo_json_crudo()
         if not archivo_crudo:
-            print("Error: No se encontró ningún archivo 'raw_combustibles_*.json' para procesar.")
-            return
+            print("Error: No se encontró ningún archivo 'raw_combustibles_*' para procesar.")
+            return False
 
         print(f"Procesando archivo: {os.path.basename(archivo_crudo)}")
         try:
-            with open(archivo_crudo, 'r', encoding='utf-8') as f:
-                datos_crudos = json.load(f)
-        except (json.JSONDecodeError, IOError) as e:
+            datos_crudos = leer_crudo(archivo_crudo)
+        except (ValueError, IOError) as e:
             print(f"Error al leer o decodificar el archivo JSON crudo: {e}")
-            return
+            return False
 
         datos_transformados = self.transformar_datos(datos_crudos)
 
-        if datos_transformados:
-            self.guardar_json_transformado(datos_transformados)
-            print("\nProceso de transformación finalizado con éxito.")
-        else:
+        if not datos_transformados:
             print("\nNo se generaron datos transformados. Revisa las advertencias anteriores.")
+            return False
+        if not self.guardar_json_transformado(datos_transformados):
+            return False
+        print("\nProceso de transformación finalizado con éxito.")
+        return True
 
 
 if __name__ == "__main__":
     transformador = TransformadorCombustible()
-    transformador.ejecutar()
\ No newline at end of file
+    if not transformador.ejecutar():
+        sys.exit(1)
\ No newline at end of file
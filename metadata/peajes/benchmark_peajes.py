@@ -0,0 +1,98 @@
+import json
+import os
+import shutil
+import tempfile
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..'))
+from comun.artefactos import buscar_artefacto, leer_artefacto
+from emparejar_peajes import EmparejadorPeajes, similitud
+from transform_peajes import RobustTransformadorPeajes
+
+
+class EmparejadorLineal(EmparejadorPeajes):
+    """
+    Bloqueo por contrato sin índice invertido, usado solo como referencia: compara cada contrato
+    con todas las autopistas de precios.json.
+    """
+
+    def _mejor_autopista(self, texto_contrato, tokens_contrato):
+        mejor = None
+        for pos_ap, autopista in enumerate(self.autopistas):
+            peso = self.peso_autopistas[pos_ap]
+            cobertura = (sum(self.idf[t] for t in autopista["tokens"] & tokens_contrato) / peso) if peso else 0.0
+            puntaje = (cobertura + similitud(texto_contrato, autopista["texto_norm"])) / 2
+            if mejor is None or puntaje > mejor[1]:
+                mejor = (pos_ap, puntaje)
+        return mejor
+
+
+class TransformadorLineal(RobustTransformadorPeajes):
+    clase_emparejador = EmparejadorLineal
+
+
+class BenchmarkPeajes:
+    """
+    Compara el tiempo de 'transformar()' con el bloqueo por contrato lineal y con el índice invertido,
+    usando 'precios.json' y 'peajes_mop.json' replicados N veces en un directorio temporal.
+    """
+
+    def __init__(self, replicas=100):
+        self.script_dir = os.path.dirname(os.path.realpath(__file__))
+        self.replicas = replicas
+
+    def _preparar_directorio(self, destino):
+        with open(os.path.join(self.script_dir, 'precios.json'), 'r', encoding='utf-8') as f:
+            precios = json.load(f)
+        with open(os.path.join(self.script_dir, 'peajes_mop.json'), 'r', encoding='utf-8') as f:
+            peajes = json.load(f)
+
+        # Las réplicas conservan nombres, contratos y ubicaciones (en los empates gana la primera
+        # autopista, así que el resultado no cambia); solo cambia el OBJECTID de los peajes
+        precios['autopistas'] = precios.get('autopistas', []) * self.replicas
+        replicados = []
+        for i in range(self.replicas):
+            for peaje in peajes:
+                replicados.append({**peaje, 'OBJECTID': i * len(peajes) + peaje['OBJECTID']})
+
+        for nombre, data in (('precios.json', precios), ('peajes_mop.json', replicados)):
+            with open(os.path.join(destino, nombre), 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+        return len(precios['autopistas']), len(replicados)
+
+    def _medir(self, clase, directorio):
+        inicio = time.perf_counter()
+        if not clase(directorio=directorio).transformar():
+            return None
+        segundos = time.perf_counter() - inicio
+        _, registros = leer_artefacto(buscar_artefacto(os.path.join(directorio, 'transformed_peajes')))
+        return segundos, list(registros)
+
+    def ejecutar(self):
+        print(f"--- Benchmark de emparejamiento de peajes ({self.replicas}x) ---")
+        directorio = tempfile.mkdtemp(prefix='benchmark_peajes_')
+        try:
+            total_autopistas, total_peajes = self._preparar_directorio(directorio)
+            print(f"Datos replicados: {total_autopistas} autopistas, {total_peajes} peajes georreferenciados.")
+
+            resultados = {}
+            for nombre, clase in (("lineal", TransformadorLineal), ("indice invertido", RobustTransformadorPeajes)):
+                medicion = self._medir(clase, directorio)
+                if medicion is None:
+                    print("Error: la transformación falló; se detiene el benchmark.")
+                    return
+                resultados[nombre] = medicion
+
+            print("\nResultados:")
+            for nombre, (segundos, _) in resultados.items():
+                print(f"  -> {nombre:<17} {segundos:8.2f} s")
+            print(f"  -> Aceleración: {resultados['lineal'][0] / resultados['indice invertido'][0]:.1f}x")
+            iguales = resultados['lineal'][1] == resultados['indice invertido'][1]
+            print(f"  -> Mismo resultado: {'sí' if iguales else 'NO'}")
+        finally:
+            shutil.rmtree(directorio, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    BenchmarkPeajes().ejecutar()
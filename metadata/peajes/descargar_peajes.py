@@ -1,31 +1,27 @@
-import requests
 import json
 import os
+import sys
 
-# URL base del servicio ArcGIS
-url = "https://rest-sit.mop.gob.cl/arcgis/rest/services/VIALIDAD/Infraestructura_Vial/MapServer/1/query"
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..'))
+from comun.arcgis import ClienteArcGIS
 
-# Parámetros: pedimos todo en una sola consulta
-params = {
-    "where": "1=1",          # condición: todos los registros
-    "outFields": "*",        # todos los campos
-    "f": "json",             # formato de salida
-    "returnGeometry": "true" # incluir coordenadas
-}
+# Capa de peajes del servicio ArcGIS de Vialidad
+url = "https://rest-sit.mop.gob.cl/arcgis/rest/services/VIALIDAD/Infraestructura_Vial/MapServer/1"
 
-print("Consultando datos de peajes...")
-response = requests.get(url, params=params)
-data = response.json()
+# Solo los campos que usan enriquecer_peajes.py y emparejar_peajes.py
+campos = ["OBJECTID", "GlobalID", "Nombre", "Posicion", "Contrato", "Tramo", "ROL"]
 
-features = data.get("features", [])
+print("Consultando datos de peajes...")
+# Todas las páginas de la capa (una sola consulta se corta en el maxRecordCount del servidor)
+features = ClienteArcGIS(url, campos).consultar()
 
 # Extraer atributos + geometría
 rows = []
 for f in features:
-    attrs = f.get("attributes", {})
-    geom = f.get("geometry", {})
-    attrs["latitude"] = geom.get("y")
-    attrs["longitude"] = geom.get("x")
+    attrs = dict(f.get("properties") or {})
+    longitud, latitud = ((f.get("geometry") or {}).get("coordinates") or [None, None])[:2]
+    attrs["latitude"] = latitud
+    attrs["longitude"] = longitud
     rows.append(attrs)
 
 # Guardar en JSON
@@ -34,4 +30,4 @@ with open(output_file, "w", encoding="utf-8") as f:
     json.dump(rows, f, indent=2, ensure_ascii=False)
 
 print(f"✅ Datos guardados en {output_file}")
-print(f"Total registros: {len(rows)}")
\ No newline at end of file
+print(f"Total registros: {len(rows)}")
@@ -0,0 +1,583 @@
+#!/usr/bin/env python3
+"""
+emparejar_peajes.py
+
+Objetivo:
+  - Asignar a cada peaje georreferenciado de peajes_mop.json el pórtico (o bloque de tarifas)
+    de precios.json que le corresponde, sin depender solo de palabras sueltas del nombre.
+  - Guardar peajes_emparejados.json y un reporte de cobertura y precisión.
+
+Estrategia (en tiempo casi lineal):
+  1) Bloqueo por contrato: cada contrato/tramo/rol distinto del MOP se compara una sola vez con las
+     autopistas/tramos de precios.json que comparten alguna palabra con él (índice invertido
+     token -> autopistas, ponderado por IDF) y se queda con la mejor si supera UMBRAL_CONTRATO.
+  2) Bloqueo espacial: los peajes cuyo contrato no se pudo asignar toman como candidatas las
+     autopistas de sus vecinos a menos de RADIO_VECINDAD_KM (grilla sobre las coordenadas MOP).
+  3) Dentro del bloque, los pórticos se puntúan por similitud de nombre (tokens + difflib)
+     y por coincidencia de tipo (Troncal/Lateral).
+
+transform_peajes.py usa EmparejadorPeajes para armar 'transformed_peajes', que carga load_peajes.py.
+Este script guarda además el detalle de cada emparejamiento y mide su precisión.
+
+Cómo usar:
+  1) Deja peajes_mop.json (descargar_peajes.py) y precios.json en esta carpeta. No hace falta
+     ejecutar enriquecer_peajes.py: solo se importan sus funciones de normalización e índices.
+  2) Ejecuta: python emparejar_peajes.py
+  3) Salidas:
+     - peajes_emparejados.json
+     - peajes_emparejados_report.txt (cobertura, precisión por autopista/tramo contra
+       referencia_contratos.json, precisión por pórtico contra referencia_porticos.json
+       y listado de peajes sin match)
+"""
+import math
+import os
+import json
+import time
+from collections import defaultdict
+from difflib import SequenceMatcher
+from enriquecer_peajes import (
+    normalizar, cargar_json_ruta, extraer_precios_lista, indexar_precios, indexar_porticos
+)
+
+# ---------- Configuración ----------
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+GEO_FILE = os.path.join(SCRIPT_DIR, "peajes_mop.json")
+PRECIOS_FILE = os.path.join(SCRIPT_DIR, "precios.json")
+REFERENCIA_FILE = os.path.join(SCRIPT_DIR, "referencia_contratos.json")
+REFERENCIA_PORTICOS_FILE = os.path.join(SCRIPT_DIR, "referencia_porticos.json")
+OUTPUT_FILE = os.path.join(SCRIPT_DIR, "peajes_emparejados.json")
+REPORT_FILE = os.path.join(SCRIPT_DIR, "peajes_emparejados_report.txt")
+
+UMBRAL_CONTRATO = 0.4        # Puntaje mínimo para asignar un contrato MOP a una autopista de precios.json
+UMBRAL_NOMBRE = 0.7          # Similitud mínima entre el nombre del peaje y el de un pórtico
+PUNTAJE_POR_TIPO = 0.6       # Puntaje informado cuando el pórtico se asigna solo por tipo (genérico)
+BONO_TIPO = 0.1              # Se suma si el tipo Troncal/Lateral del peaje y del pórtico coincide
+PENALIZACION_TIPO = 0.25     # Se resta si no coincide: solo un nombre casi idéntico supera el umbral
+FACTOR_CONTENIDO = 0.9       # Peso de "el nombre del peaje está contenido en el del pórtico"
+RADIO_VECINDAD_KM = 40       # Radio para tomar autopistas candidatas de los peajes vecinos
+LARGO_MINIMO_DIFFLIB = 4     # Largo mínimo (sin espacios) para comparar nombres con difflib
+TAMANO_CELDA_GRADOS = 0.5    # ~55 km: con el radio anterior basta revisar las celdas contiguas
+
+# Palabras que describen el tipo de pórtico y no su ubicación
+PALABRAS_TIPO = {
+    "troncal": "troncal", "troncales": "troncal", "lateral": "lateral", "laterales": "lateral",
+    "acceso": None, "accesos": None
+}
+# Puntos cardinales: por sí solos no identifican un pórtico ("Troncales (Norte y Sur)")
+PALABRAS_DEBILES = {"norte", "sur", "oriente", "poniente", "centro"}
+
+KM_POR_GRADO = 111.195
+
+
+# ---------- Índice espacial ----------
+class GrillaPeajes:
+    """Grilla de celdas cuadradas sobre las coordenadas de los peajes MOP."""
+
+    def __init__(self, peajes, tamano_celda=TAMANO_CELDA_GRADOS):
+        self.tamano_celda = tamano_celda
+        self.celdas = defaultdict(list)
+        for posicion, peaje in enumerate(peajes):
+            if peaje.get("latitude") is None or peaje.get("longitude") is None:
+                continue
+            self.celdas[self._celda(peaje["latitude"], peaje["longitude"])].append(
+                (peaje["latitude"], peaje["longitude"], posicion)
+            )
+
+    def _celda(self, lat, lon):
+        return int(math.floor(lat / self.tamano_celda)), int(math.floor(lon / self.tamano_celda))
+
+    def vecinos(self, lat, lon, radio_km):
+        """Posiciones de los peajes a menos de 'radio_km' (aprox. equirectangular), ordenadas por distancia."""
+        fila, columna = self._celda(lat, lon)
+        anillos = int(math.ceil(radio_km / (KM_POR_GRADO * self.tamano_celda)))
+        kx = KM_POR_GRADO * math.cos(math.radians(lat))
+        encontrados = []
+        for df in range(-anillos, anillos + 1):
+            for dc in range(-anillos, anillos + 1):
+                for lat_p, lon_p, posicion in self.celdas.get((fila + df, columna + dc), ()):
+                    distancia = math.hypot((lat_p - lat) * KM_POR_GRADO, (lon_p - lon) * kx)
+                    if distancia <= radio_km:
+                        encontrados.append((distancia, posicion))
+        return [posicion for _, posicion in sorted(encontrados)]
+
+
+# ---------- Similitud de textos ----------
+def similitud(texto_a, texto_b):
+    """Similitud difflib entre dos textos normalizados, ignorando espacios ("Nor-Oriente" ~ "Nororiente")."""
+    a, b = texto_a.replace(" ", ""), texto_b.replace(" ", "")
+    # En nombres muy cortos ("1" vs "16") difflib no discrimina: ahí solo cuentan los tokens
+    if min(len(a), len(b)) < LARGO_MINIMO_DIFFLIB:
+        return 0.0
+    comparador = SequenceMatcher(None, a, b, autojunk=False)
+    return comparador.ratio()
+
+def separar_nombre_y_tipo(texto):
+    """Devuelve (tokens del nombre sin palabras de tipo, texto normalizado de esos tokens, tipo inferido)."""
+    texto_norm, _ = normalizar(texto)
+    tokens, tipo = [], None
+    for token in texto_norm.split():
+        if token in PALABRAS_TIPO:
+            tipo = tipo or PALABRAS_TIPO[token]
+        else:
+            tokens.append(token)
+    return set(tokens), " ".join(tokens), tipo
+
+def normalizar_tipo(texto):
+    texto_norm, _ = normalizar(texto)
+    return PALABRAS_TIPO.get(texto_norm) if texto_norm else None
+
+
+class EmparejadorPeajes:
+    """
+    Empareja los peajes de peajes_mop.json con los pórticos y bloques de tarifas de precios.json,
+    bloqueando los candidatos por contrato y por cercanía antes de comparar nombres.
+    """
+
+    def __init__(self, peajes_geo, precios_list):
+        self.peajes_geo = peajes_geo
+        self.precios_list = precios_list
+        indexar_precios(self.precios_list)
+        indexar_porticos(self.precios_list)
+        self.grilla = GrillaPeajes(self.peajes_geo)
+        self._preparar_autopistas()
+
+    def _preparar_autopistas(self):
+        """Normaliza una sola vez los textos de cada autopista y el nombre/tipo de sus pórticos."""
+        self.autopistas = []
+        frecuencia = defaultdict(int)
+        for ap in self.precios_list:
+            texto = f"{ap.get('nombre_autopista') or ''} {ap.get('tramo_descripcion') or ''}"
+            texto_norm, tokens = normalizar(texto)
+            for token in tokens:
+                frecuencia[token] += 1
+
+            porticos, bloques = [], []
+            for entrada in ap.get("_entradas", []):
+                if entrada["es_bloque"]:
+                    bloques.append(entrada)
+                    continue
+                tokens_nombre, nombre_norm, tipo_nombre = separar_nombre_y_tipo(entrada["nombre"])
+                porticos.append({
+                    "entrada": entrada,
+                    "tokens": tokens_nombre,
+                    "nombre_norm": nombre_norm,
+                    "tipo": normalizar_tipo(entrada["tipo"]) or tipo_nombre
+                })
+            self.autopistas.append({
+                "ap": ap, "texto_norm": texto_norm, "tokens": tokens,
+                "porticos": porticos, "bloques": bloques
+            })
+
+        total = len(self.autopistas)
+        self.idf = {token: math.log((total + 1) / (n + 0.5)) for token, n in frecuencia.items()}
+
+        # Índice invertido token -> autopistas y peso (IDF) total del texto de cada una, para que cada
+        # contrato se compare solo con las autopistas que comparten alguna palabra con él
+        self.indice_autopistas = defaultdict(list)
+        self.peso_autopistas = []
+        for pos_ap, autopista in enumerate(self.autopistas):
+            for token in autopista["tokens"]:
+                self.indice_autopistas[token].append(pos_ap)
+            self.peso_autopistas.append(sum(self.idf[t] for t in autopista["tokens"]))
+
+    # ---------- Bloqueo por contrato ----------
+    def _candidatas_contrato(self, tokens_contrato):
+        """
+        Autopistas que comparten alguna palabra con el contrato/tramo/rol, con la fracción (IDF) de su
+        texto presente en él. Salen del índice invertido, sin recorrer las demás autopistas.
+        """
+        pesos = defaultdict(float)
+        for token in tokens_contrato:
+            for pos_ap in self.indice_autopistas.get(token, ()):
+                pesos[pos_ap] += self.idf[token]
+        return {pos_ap: peso / self.peso_autopistas[pos_ap] for pos_ap, peso in pesos.items()}
+
+    def _mejor_autopista(self, texto_contrato, tokens_contrato):
+        """
+        Devuelve (posición de la autopista, puntaje) con el mayor puntaje para el contrato, o None.
+        El puntaje es el promedio entre la fracción (IDF) de la autopista presente en el contrato/tramo/rol
+        y la similitud difflib de los nombres. La primera reconoce "Ruta 78" en el rol; la segunda,
+        nombres escritos distinto ("Acceso Nor-Oriente" vs "Acceso Nororiente").
+        """
+        mejor = None
+        # De mayor a menor cobertura: como difflib aporta a lo más 1, se deja de comparar cuando
+        # (cobertura + 1) / 2 ya no alcanza al mejor puntaje. Empates: gana la primera en precios.json
+        candidatas = sorted(self._candidatas_contrato(tokens_contrato).items(), key=lambda c: (-c[1], c[0]))
+        for pos_ap, cobertura in candidatas:
+            if mejor is not None and (cobertura + 1) / 2 < mejor[1]:
+                break
+            puntaje = (cobertura + similitud(texto_contrato, self.autopistas[pos_ap]["texto_norm"])) / 2
+            if mejor is None or (puntaje, -pos_ap) > (mejor[1], -mejor[0]):
+                mejor = (pos_ap, puntaje)
+        return mejor
+
+    def asignar_contratos(self):
+        """
+        Asigna cada combinación (Contrato, Tramo, ROL) distinta a la autopista con mayor puntaje.
+        Devuelve {posición del peaje: (posición de la autopista, puntaje)} para los que superan el umbral.
+        """
+        por_contrato = {}
+        asignaciones = {}
+        for posicion, peaje in enumerate(self.peajes_geo):
+            clave = (peaje.get("Contrato") or "", peaje.get("Tramo") or "", peaje.get("ROL") or "")
+            if clave not in por_contrato:
+                contrato_norm, _ = normalizar(clave[0])
+                _, tokens = normalizar(" ".join(clave))
+                mejor = self._mejor_autopista(contrato_norm, tokens)
+                por_contrato[clave] = mejor if mejor and mejor[1] >= UMBRAL_CONTRATO else None
+            if por_contrato[clave] is not None:
+                asignaciones[posicion] = por_contrato[clave]
+        return asignaciones
+
+    # ---------- Puntaje de pórticos ----------
+    def _mejor_portico(self, autopista, peaje, solo_por_nombre):
+        """
+        Devuelve (portico, puntaje, metodo) con el mejor pórtico de la autopista para el peaje, o None.
+        Los pórticos genéricos ("Troncal", "Laterales", "Troncal Ruta 5") se asignan por tipo.
+        """
+        tokens_peaje, nombre_peaje, tipo_nombre = separar_nombre_y_tipo(peaje.get("Nombre"))
+        tipo_peaje = normalizar_tipo(peaje.get("Posicion")) or tipo_nombre
+        _, tokens_rol = normalizar(peaje.get("ROL"))
+        tokens_tramo, _, _ = separar_nombre_y_tipo(peaje.get("Tramo"))
+        genericas = PALABRAS_DEBILES | tokens_rol
+        # Los puntos cardinales y el número de ruta no cuentan como coincidencia, salvo que el nombre no tenga otra cosa
+        distintivos_peaje = (tokens_peaje - genericas) or tokens_peaje
+
+        mejor_nombre, mejor_generico = None, None
+        for orden, portico in enumerate(autopista["porticos"]):
+            ajuste_tipo = 0.0
+            if tipo_peaje and portico["tipo"]:
+                ajuste_tipo = BONO_TIPO if tipo_peaje == portico["tipo"] else -PENALIZACION_TIPO
+
+            if portico["tokens"] and distintivos_peaje:
+                comunes = len(distintivos_peaje & portico["tokens"])
+                dice = 2 * comunes / (len(distintivos_peaje) + len(portico["tokens"]))
+                contenido = comunes / len(distintivos_peaje)
+                puntaje = max(dice, FACTOR_CONTENIDO * contenido, similitud(nombre_peaje, portico["nombre_norm"]))
+                puntaje += ajuste_tipo
+                if puntaje >= UMBRAL_NOMBRE and (mejor_nombre is None or (puntaje, -orden) > mejor_nombre[0]):
+                    mejor_nombre = ((puntaje, -orden), portico)
+
+            # Genérico: sin nombre propio (o solo puntos cardinales/número de ruta) y del mismo tipo.
+            # Entre varios se prefiere el que comparte palabras con el tramo MOP ("Laterales Acceso Sur"
+            # para el tramo "Acceso sur a Santiago") y luego el de nombre más corto ("Troncal" antes
+            # que "Accesos y Troncal Sur").
+            if not solo_por_nombre and ajuste_tipo > 0 and portico["tokens"] <= genericas:
+                clave = (-len(portico["tokens"] & tokens_tramo), len(portico["tokens"]), orden)
+                if mejor_generico is None or clave < mejor_generico[0]:
+                    mejor_generico = (clave, portico)
+
+        if mejor_nombre:
+            return mejor_nombre[1], round(min(mejor_nombre[0][0], 1.0), 3), "nombre"
+        if mejor_generico:
+            return mejor_generico[1], PUNTAJE_POR_TIPO, "tipo"
+        return None
+
+    def emparejar(self):
+        """Devuelve una lista con un resultado por peaje MOP (con 'match' None si no se encontró)."""
+        asignaciones = self.asignar_contratos()
+        resultados = []
+        for posicion, peaje in enumerate(self.peajes_geo):
+            match = None
+            if posicion in asignaciones:
+                pos_ap, puntaje_contrato = asignaciones[posicion]
+                autopista = self.autopistas[pos_ap]
+                encontrado = self._mejor_portico(autopista, peaje, solo_por_nombre=False)
+                if encontrado:
+                    portico, puntaje, metodo = encontrado
+                    match = self._armar_match(autopista, portico["entrada"], puntaje, f"contrato+{metodo}")
+                elif autopista["bloques"] and not autopista["porticos"]:
+                    # Autopistas con tarifa única por bloque (ej. Túnel El Melón)
+                    bloques, metodo = self._bloques_del_peaje(pos_ap, posicion, peaje, asignaciones)
+                    if bloques:
+                        match = self._armar_match(autopista, None, round(puntaje_contrato, 3),
+                                                  f"contrato+{metodo}", bloques=bloques)
+            else:
+                match = self._emparejar_por_vecindad(posicion, peaje, asignaciones)
+            resultados.append({"peaje": peaje, "match": match})
+        return resultados
+
+    def _emparejar_por_vecindad(self, posicion, peaje, asignaciones):
+        """Busca solo por nombre en las autopistas asignadas a los peajes cercanos."""
+        if peaje.get("latitude") is None or peaje.get("longitude") is None:
+            return None
+        candidatas = []
+        for vecino in self.grilla.vecinos(peaje["latitude"], peaje["longitude"], RADIO_VECINDAD_KM):
+            if vecino != posicion and vecino in asignaciones and asignaciones[vecino][0] not in candidatas:
+                candidatas.append(asignaciones[vecino][0])
+
+        mejor = None
+        for pos_ap in candidatas:
+            autopista = self.autopistas[pos_ap]
+            encontrado = self._mejor_portico(autopista, peaje, solo_por_nombre=True)
+            if encontrado and (mejor is None or encontrado[1] > mejor[1][1]):
+                mejor = (autopista, encontrado)
+        if mejor is None:
+            return None
+        autopista, (portico, puntaje, _) = mejor
+        return self._armar_match(autopista, portico["entrada"], puntaje, "vecindad+nombre")
+
+    def _sectores(self, pos_ap):
+        """Bloques de la autopista agrupados por sector ("SECTOR ORIENTE"), en el orden de precios.json."""
+        sectores = {}
+        for bloque in self.autopistas[pos_ap]["bloques"]:
+            sectores.setdefault(bloque["eje"], []).append(bloque)
+        return sectores
+
+    def _sector_por_nombre(self, sectores, peaje):
+        """Sector cuyo nombre comparte palabras con el del peaje ("Oriente" -> "SECTOR ORIENTE"), o None."""
+        _, tokens_peaje = normalizar(peaje.get("Nombre"))
+        propios = [eje for eje in sectores if normalizar(eje)[1] & tokens_peaje]
+        return propios[0] if len(propios) == 1 else None
+
+    def _bloques_del_peaje(self, pos_ap, posicion, peaje, asignaciones):
+        """
+        Devuelve (bloques de tarifas que aplican al peaje, método). Si la autopista cobra distinto por sector
+        (dos ejes con tarifas para la misma categoría y tipo), se usan solo los bloques de un sector: el que se nombra como el peaje ("bloque") o, si el nombre no
+        indica ninguno ("El Llano 1"), el del peaje más cercano de la misma autopista que sí lo indica
+        ("bloque_cercania"). Si no se puede decidir, no se asignan tarifas en vez de mezclar sectores.
+        """
+        sectores = self._sectores(pos_ap)
+        # Ejes que no repiten categoría y tipo de tarifa se complementan ("TARIFA POR PASADA" y "TARIFA
+        # PASE DIARIO"): aplican todos
+        claves = [(t["categoria_vehiculo"], t["tipo_tarifa"])
+                  for bloques in sectores.values() for bloque in bloques for t in bloque["tarifas"]]
+        if len(sectores) == 1 or len(claves) == len(set(claves)):
+            return self.autopistas[pos_ap]["bloques"], "bloque"
+        eje = self._sector_por_nombre(sectores, peaje)
+        if eje is not None:
+            return sectores[eje], "bloque"
+
+        if peaje.get("latitude") is None or peaje.get("longitude") is None:
+            return [], None
+        for vecino in self.grilla.vecinos(peaje["latitude"], peaje["longitude"], RADIO_VECINDAD_KM):
+            if vecino == posicion or asignaciones.get(vecino, (None,))[0] != pos_ap:
+                continue
+            eje = self._sector_por_nombre(sectores, self.peajes_geo[vecino])
+            if eje is not None:
+                return sectores[eje], "bloque_cercania"
+        return [], None
+
+    @staticmethod
+    def _armar_match(autopista, entrada, puntaje, metodo, bloques=()):
+        ap = autopista["ap"]
+        if entrada is not None:
+            tarifas = list(entrada["tarifas"])
+        else:
+            tarifas = [t for bloque in bloques for t in bloque["tarifas"]]
+        return {
+            "autopista": ap.get("nombre_autopista"),
+            "tramo_tarifas": ap.get("tramo_descripcion"),
+            "portico": entrada["nombre"] if entrada is not None else None,
+            # Sector de los bloques de tarifas (ej. "SECTOR ORIENTE"), si se eligió uno de varios
+            "sector": (bloques[0]["eje"] if entrada is None and len({b["eje"] for b in bloques}) == 1
+                       else None),
+            "puntaje": puntaje,
+            "metodo": metodo,
+            "tarifas": tarifas,
+            "horarios": entrada["horarios"] if entrada is not None else None
+        }
+
+
+# ---------- Evaluación ----------
+def evaluar(resultados, referencia):
+    """Cobertura y precisión a nivel de autopista/tramo contra referencia_contratos.json."""
+    esperado = {}
+    for fila in referencia.get("contratos", []):
+        esperado[normalizar(fila["contrato"])[0]] = (fila["autopista"], fila["tramo"])
+
+    metricas = defaultdict(int)
+    for resultado in resultados:
+        peaje, match = resultado["peaje"], resultado["match"]
+        clave = normalizar(peaje.get("Contrato"))[0]
+        if clave not in esperado:
+            metricas["sin_referencia"] += 1
+            continue
+        autopista_esperada = esperado[clave]
+        if autopista_esperada[0] is not None:
+            metricas["emparejables"] += 1
+        if match is None:
+            continue
+        metricas["evaluados"] += 1
+        if (match["autopista"], match["tramo_tarifas"]) == autopista_esperada:
+            metricas["correctos"] += 1
+        else:
+            metricas["incorrectos"] += 1
+            resultado["incorrecto"] = autopista_esperada
+    return metricas
+
+
+# Métodos que asignan tarifas sin comparar el nombre del peaje con el del pórtico o el sector: el pórtico
+# genérico por tipo ("Troncal", "Laterales") y el sector del peaje vecino. Se informan como no verificados.
+METODOS_SIN_VERIFICAR = ("tipo", "bloque_cercania")
+
+
+def evaluar_porticos(resultados, referencia):
+    """
+    Precisión por pórtico contra referencia_porticos.json, en total y por método, solo para los
+    emparejamientos que comparan nombres. Un emparejamiento es correcto si su autopista/tramo lo es
+    (ver evaluar(), que debe correr antes) y el pórtico asignado está entre los aceptados, o si es un
+    bloque y la referencia indica tarifa por bloque (del mismo sector, si la referencia lo indica).
+    Los de METODOS_SIN_VERIFICAR no se cuentan en la precisión: se marcan 'sin_verificar' en el resultado.
+    """
+    esperado = {fila["OBJECTID"]: fila for fila in referencia.get("peajes", [])}
+
+    metricas = defaultdict(lambda: defaultdict(int))
+    for resultado in resultados:
+        peaje, match = resultado["peaje"], resultado["match"]
+        fila = esperado.get(peaje.get("OBJECTID"))
+        if fila is None:
+            metricas["total"]["sin_referencia"] += 1
+            continue
+        if match is None or not match["tarifas"]:
+            if fila.get("bloque") or fila.get("porticos"):
+                metricas["total"]["omitidos"] += 1
+            continue
+
+        metodo = match["metodo"].split("+")[-1]
+        if metodo in METODOS_SIN_VERIFICAR:
+            metricas["total"]["sin_verificar"] += 1
+            metricas[metodo]["sin_verificar"] += 1
+            resultado["sin_verificar"] = True
+            continue
+        if match["portico"] is None:
+            # 'bloque' es true o el sector esperado ("SECTOR ORIENTE") cuando la autopista cobra por sector
+            correcto = fila.get("bloque") is True or (bool(fila.get("bloque")) and fila["bloque"] == match["sector"])
+        else:
+            correcto = match["portico"] in fila.get("porticos", [])
+        correcto = correcto and "incorrecto" not in resultado
+        for grupo in ("total", metodo):
+            metricas[grupo]["evaluados"] += 1
+            metricas[grupo]["correctos" if correcto else "incorrectos"] += 1
+        if not correcto:
+            resultado["portico_incorrecto"] = fila.get("bloque") or fila.get("porticos", [])
+    return metricas
+
+
+# ---------- Proceso principal ----------
+def main():
+    print("--- Iniciando emparejamiento de peajes (bloqueo por contrato y cercanía) ---")
+
+    for ruta in (GEO_FILE, PRECIOS_FILE):
+        if not os.path.exists(ruta):
+            print(f"Error: no se encuentra {ruta}")
+            return
+
+    peajes_geo = cargar_json_ruta(GEO_FILE)
+    precios_list = extraer_precios_lista(cargar_json_ruta(PRECIOS_FILE))
+
+    inicio = time.perf_counter()
+    emparejador = EmparejadorPeajes(peajes_geo, precios_list)
+    resultados = emparejador.emparejar()
+    duracion_ms = (time.perf_counter() - inicio) * 1000
+
+    referencia = cargar_json_ruta(REFERENCIA_FILE) if os.path.exists(REFERENCIA_FILE) else {}
+    metricas = evaluar(resultados, referencia)
+    referencia_porticos = (cargar_json_ruta(REFERENCIA_PORTICOS_FILE)
+                           if os.path.exists(REFERENCIA_PORTICOS_FILE) else {})
+    metricas_porticos = evaluar_porticos(resultados, referencia_porticos)
+
+    peajes_emparejados = []
+    sin_match = []
+    por_metodo = defaultdict(int)
+    for resultado in resultados:
+        peaje, match = resultado["peaje"], resultado["match"]
+        base = {
+            "OBJECTID": peaje.get("OBJECTID"),
+            "nombre": peaje.get("Nombre"),
+            "tipo": peaje.get("Posicion"),
+            "concesionaria": peaje.get("Contrato"),
+            "tramo": peaje.get("Tramo"),
+            "latitud": peaje.get("latitude"),
+            "longitud": peaje.get("longitude")
+        }
+        if match and match["tarifas"]:
+            por_metodo[match["metodo"]] += 1
+            peajes_emparejados.append({**base, "globalid": peaje.get("GlobalID"), **match})
+        else:
+            sin_match.append(base)
+
+    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
+        json.dump(peajes_emparejados, f, indent=2, ensure_ascii=False)
+
+    total_geo = len(peajes_geo)
+    total_emp = len(peajes_emparejados)
+    cobertura = (total_emp / total_geo * 100) if total_geo else 0.0
+    precision = (metricas["correctos"] / metricas["evaluados"] * 100) if metricas["evaluados"] else 0.0
+    exhaustividad = (metricas["correctos"] / metricas["emparejables"] * 100) if metricas["emparejables"] else 0.0
+    total_porticos = metricas_porticos["total"]
+    precision_porticos = ((total_porticos["correctos"] / total_porticos["evaluados"] * 100)
+                          if total_porticos["evaluados"] else 0.0)
+
+    with open(REPORT_FILE, "w", encoding="utf-8") as rf:
+        rf.write("Reporte de Emparejamiento de Peajes (bloqueo por contrato y cercanía)\n")
+        rf.write("=====================================================================\n")
+        rf.write(f"Total peajes georreferenciados: {total_geo}\n")
+        rf.write(f"Peajes con tarifas asignadas: {total_emp}\n")
+        rf.write(f"Peajes sin match: {len(sin_match)}\n")
+        rf.write(f"Cobertura (geo -> precios): {cobertura:.2f}%\n\n")
+        rf.write("Precisión contra referencia_contratos.json (autopista/tramo asignado):\n")
+        rf.write(f"  Emparejamientos evaluados: {metricas['evaluados']}\n")
+        rf.write(f"  Correctos: {metricas['correctos']} | Incorrectos: {metricas['incorrectos']}\n")
+        rf.write(f"  Precisión: {precision:.2f}%\n")
+        rf.write(f"  Exhaustividad (peajes con tarifas en precios.json): {exhaustividad:.2f}%\n")
+        rf.write(f"  Peajes sin contrato en la referencia: {metricas['sin_referencia']}\n\n")
+        rf.write("Precisión por pórtico contra referencia_porticos.json (solo pórticos y bloques asignados "
+                 "comparando nombres):\n")
+        rf.write(f"  Emparejamientos evaluados: {total_porticos['evaluados']}\n")
+        rf.write(f"  Correctos: {total_porticos['correctos']} | Incorrectos: {total_porticos['incorrectos']}\n")
+        rf.write(f"  Precisión: {precision_porticos:.2f}%\n")
+        rf.write(f"  Peajes con pórtico en la referencia que quedaron sin match: {total_porticos['omitidos']}\n")
+        rf.write(f"  Peajes que no están en la referencia: {total_porticos['sin_referencia']}\n")
+        rf.write("  Por método:\n")
+        for metodo in ("nombre", "bloque"):
+            grupo = metricas_porticos[metodo]
+            precision_metodo = (grupo["correctos"] / grupo["evaluados"] * 100) if grupo["evaluados"] else 0.0
+            rf.write(f"    {metodo}: {grupo['correctos']}/{grupo['evaluados']} ({precision_metodo:.2f}%)\n")
+        rf.write(f"  Sin verificar (tarifas asignadas sin comparar nombres, fuera de la precisión): "
+                 f"{total_porticos['sin_verificar']}\n")
+        rf.write(f"    tipo (pórtico genérico \"Troncal\"/\"Laterales\" de la autopista): "
+                 f"{metricas_porticos['tipo']['sin_verificar']}\n")
+        rf.write(f"    bloque_cercania (sector del peaje vecino de la misma autopista): "
+                 f"{metricas_porticos['bloque_cercania']['sin_verificar']}\n")
+        rf.write("\n")
+        rf.write("Emparejamientos por método:\n")
+        for metodo, cantidad in sorted(por_metodo.items()):
+            rf.write(f"  {metodo}: {cantidad}\n")
+        rf.write("\nEmparejamientos incorrectos (OBJECTID, nombre, asignado -> esperado):\n")
+        for resultado in resultados:
+            if "incorrecto" in resultado:
+                match = resultado["match"]
+                rf.write(f"- {resultado['peaje'].get('OBJECTID')} | {resultado['peaje'].get('Nombre')} | "
+                         f"{match['autopista']} ({match['tramo_tarifas']}) -> {resultado['incorrecto'][0]} "
+                         f"({resultado['incorrecto'][1]})\n")
+        rf.write("\nPórticos incorrectos (OBJECTID, nombre, pórtico asignado -> aceptados):\n")
+        for resultado in resultados:
+            if "portico_incorrecto" in resultado:
+                esperado = resultado["portico_incorrecto"]
+                asignado = resultado["match"]["portico"] or f"bloque {resultado['match']['sector'] or ''}".strip()
+                if esperado is True:
+                    esperado = "bloque"
+                elif isinstance(esperado, str):
+                    esperado = f"bloque {esperado}"
+                else:
+                    esperado = " / ".join(esperado) or "ninguno"
+                rf.write(f"- {resultado['peaje'].get('OBJECTID')} | {resultado['peaje'].get('Nombre')} | "
+                         f"{asignado} -> {esperado}\n")
+        rf.write("\nAsignaciones sin verificar (OBJECTID, nombre, método, pórtico o sector asignado):\n")
+        for resultado in resultados:
+            if "sin_verificar" in resultado:
+                match = resultado["match"]
+                rf.write(f"- {resultado['peaje'].get('OBJECTID')} | {resultado['peaje'].get('Nombre')} | "
+                         f"{match['metodo']} | {match['portico'] or match['sector']}\n")
+        rf.write("\nListado de peajes sin match (OBJECTID, nombre, tipo, concesionaria, tramo):\n")
+        for p in sin_match:
+            rf.write(f"- {p.get('OBJECTID')} | {p.get('nombre')} | {p.get('tipo')} | {p.get('concesionaria')} | {p.get('tramo')}\n")
+
+    print(f"✅ Guardado: {OUTPUT_FILE} ({total_emp} peajes emparejados)")
+    print(f"✅ Reporte: {REPORT_FILE} (cobertura: {cobertura:.2f}%, precisión: {precision:.2f}%, "
+          f"precisión por pórtico: {precision_porticos:.2f}%)")
+    print(f"⏱️ Emparejamiento: {duracion_ms:.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -17,6 +17,7 @@ Cómo usar:
 import json
 import os
 import re
+import time
 from collections import defaultdict
 from unidecode import unidecode
 
@@ -81,14 +82,153 @@ def indexar_precios(precios_list):
         index_by_tramo[tramo_norm].append(ap)
     return index_by_autopista, index_by_tramo
 
-def buscar_matches_para_peaje(peaje, precios_list, idx_autopista, idx_tramo):
+def _tarifas_de_bloque(peajes_obj, tipo):
+    """Tarifas de un bloque 'tarifas' de un eje. 'tipo' se usa cuando el bloque no separa por tipo."""
+    tarifas = []
+    # peajes_obj puede ser dict de categorías -> precio, o estructura anidada
+    # (ej: {"normal": {...}, "punta": {...}})
+    if all(isinstance(v, (int, float)) or v is None for v in peajes_obj.values()):
+        for cat, val in peajes_obj.items():
+            tarifas.append({
+                "categoria_vehiculo": cat,
+                "tipo_tarifa": tipo,
+                "precio": val
+            })
+    else:
+        for tipo_tar, precios_map in peajes_obj.items():
+            for cat, val in precios_map.items():
+                tarifas.append({
+                    "categoria_vehiculo": cat,
+                    "tipo_tarifa": tipo_tar.upper(),
+                    "precio": val
+                })
+    return tarifas
+
+def _tipo_de_cobro(tipo_cobro):
+    """
+    Tipo de tarifa de un bloque que distingue la forma de pago ("PÓRTICO (TAG)" o "MANUAL") en vez del
+    horario: cada forma de pago es su propio tipo ('TAG', 'MANUAL'), porque sus precios son distintos.
+    Sin forma de pago, el bloque es la tarifa 'NORMAL'.
+    """
+    if not tipo_cobro:
+        return "NORMAL"
+    return "TAG" if "TAG" in tipo_cobro.upper() else tipo_cobro
+
+def _tarifas_de_portico(portico):
+    """Todas las tarifas declaradas en un pórtico (se asignan solo si el pórtico hace match)."""
+    tarifas = []
+    # Estructura 1: portico.get("peajes") -> dict categories -> value or dict of types
+    if "peajes" in portico and isinstance(portico["peajes"], dict):
+        for cat_key, precios in portico["peajes"].items():
+            if isinstance(precios, dict):
+                # ejemplos: {"TBFP": 839.5, "TBP": null}
+                for tipo_tarifa, precio_val in precios.items():
+                    tarifas.append({
+                        "categoria_vehiculo": cat_key,
+                        "tipo_tarifa": tipo_tarifa,
+                        "precio": precio_val
+                    })
+            else:
+                tarifas.append({
+                    "categoria_vehiculo": cat_key,
+                    "tipo_tarifa": "NORMAL",
+                    "precio": precios
+                })
+    # Estructura 2: portico tiene "tarifas" -> {"normal": {...}, "punta": {...}}
+    if "tarifas" in portico and isinstance(portico["tarifas"], dict):
+        for tipo_tarifa, precios_map in portico["tarifas"].items():
+            for cat_key, precio_val in precios_map.items():
+                tarifas.append({
+                    "categoria_vehiculo": cat_key,
+                    "tipo_tarifa": tipo_tarifa.upper(),
+                    "precio": precio_val
+                })
+    # Estructura 3: portico directamente anidado (ej. en algunos JSON)
+    # (si no hay peajes explícitos, no agregamos nada)
+    return tarifas
+
+def _entradas_de_eje(eje):
+    """
+    Aplana un eje en la lista de entradas (pórticos y bloques de tarifas) en el mismo orden
+    en que se recorren al extraer tarifas: pórticos por dirección, pórticos directos y bloques.
+    """
+    porticos = []
+    # casos: eje["direcciones"] -> each direction has "porticos"
+    if "direcciones" in eje and isinstance(eje["direcciones"], list):
+        for d in eje["direcciones"]:
+            porticos.extend(d.get("porticos", []) or [])
+    # caso: eje tiene "porticos"
+    porticos.extend(eje.get("porticos", []) or [])
+
+    entradas = []
+    for portico in porticos:
+        p_nombre_norm, p_nombre_tokens = normalizar(portico.get("nombre") or portico.get("nombre_portico") or "")
+        p_tipo_norm, _ = normalizar(portico.get("tipo") or "")
+        entradas.append({
+            "es_bloque": False,
+            "nombre": portico.get("nombre") or portico.get("nombre_portico") or portico.get("referencia_tramo"),
+            "tipo": portico.get("tipo"),
+            "nombre_norm": p_nombre_norm,
+            "nombre_tokens": p_nombre_tokens,
+            "tipo_norm": p_tipo_norm,
+            # La búsqueda amplia solo mira "nombre" (no "nombre_portico")
+            "tokens_busqueda": normalizar(portico.get("nombre") or "")[1],
+            "tarifas": _tarifas_de_portico(portico),
+            "tarifas_busqueda": None,
+            # Rangos horarios de punta/saturación (solo autopistas urbanas)
+            "horarios": portico.get("horarios")
+        })
+
+    # caso: eje tiene "tarifas" con bloques que contienen "peajes"
+    for tarifa_block in eje.get("tarifas", []) or []:
+        peajes_obj = tarifa_block.get("peajes")
+        if not isinstance(peajes_obj, dict):
+            continue
+        tipo = tarifa_block.get("tipo") or tarifa_block.get("nombre") or _tipo_de_cobro(tarifa_block.get("tipo_cobro"))
+        entradas.append({
+            "es_bloque": True,
+            "nombre": tarifa_block.get("nombre") or tarifa_block.get("tipo") or tarifa_block.get("tipo_cobro"),
+            "tipo": None,
+            "tokens_busqueda": normalizar(tarifa_block.get("nombre") or tarifa_block.get("tipo") or "")[1],
+            # Al extraer por autopista el bloque usa su tipo; en la búsqueda amplia se asigna "NORMAL"
+            "tarifas": _tarifas_de_bloque(peajes_obj, tipo.upper()),
+            "tarifas_busqueda": _tarifas_de_bloque(peajes_obj, "NORMAL"),
+            "horarios": None,
+            # Sector al que aplica el bloque (ej. "SECTOR ORIENTE")
+            "eje": eje.get("nombre_eje")
+        })
+    return entradas
+
+def indexar_porticos(precios_list):
+    """
+    Pre-procesa una sola vez todos los pórticos y bloques de tarifas de precios_list:
+      - ap["_entradas"]: entradas aplanadas de la autopista, con nombres normalizados,
+        tokens y tarifas ya extraídas
+      - index_by_token_autopista: token de nombre_autopista -> set(posición de la autopista)
+      - index_by_token_portico: token de pórtico/bloque -> list((posición autopista, posición entrada))
+    Requiere que indexar_precios() ya haya normalizado los nombres de las autopistas.
+    """
+    index_by_token_autopista = defaultdict(set)
+    index_by_token_portico = defaultdict(list)
+    for pos_ap, ap in enumerate(precios_list):
+        ap["_entradas"] = []
+        for eje in ap.get("ejes", []) or []:
+            ap["_entradas"].extend(_entradas_de_eje(eje))
+        for token in ap.get("_nombre_tokens") or ():
+            index_by_token_autopista[token].add(pos_ap)
+        for pos_entrada, entrada in enumerate(ap["_entradas"]):
+            for token in entrada["tokens_busqueda"]:
+                index_by_token_portico[token].append((pos_ap, pos_entrada))
+    return index_by_token_autopista, index_by_token_portico
+
+def buscar_matches_para_peaje(peaje, precios_list, idx_autopista, idx_tramo, idx_token_autopista, idx_token_portico):
     """
     Devuelve lista de tarifas encontradas (puede ser vacía).
     Estrategia (jerárquica y tolerante):
       1) Coincidencia estricta por contrato/autopista o tramo (nombre exacto normalizado)
       2) Coincidencia por tokens entre nombre del peaje y portico.nombre o tipo
       3) Coincidencia por tipo (troncal/lateral)
-      4) Fallback: buscar en todos los porticos por tokens (más costoso)
+      4) Fallback: buscar en todos los porticos por tokens, usando los índices de indexar_porticos()
     """
     resultados = []
 
@@ -115,158 +255,52 @@ def buscar_matches_para_peaje(peaje, precios_list, idx_autopista, idx_tramo):
     # 2) Dentro de candidatos, buscar porticos por coincidencia de nombre o tipo
     def extraer_tarifas_desde_autopista(ap):
         tarifas_encontradas = []
-        # Normalizar la estructura de ejes
-        for eje in ap.get("ejes", []) or []:
-            # porticos o porticos dentro de "direcciones"
-            # casos: eje["direcciones"] -> each direction has "porticos"
-            if "direcciones" in eje and isinstance(eje["direcciones"], list):
-                directions = eje["direcciones"]
-                for d in directions:
-                    for portico in d.get("porticos", []) or []:
-                        tarifas_encontradas.extend(extraer_tarifas_de_portico(portico))
-            # caso: eje tiene "porticos"
-            for portico in eje.get("porticos", []) or []:
-                tarifas_encontradas.extend(extraer_tarifas_de_portico(portico))
-            # caso: eje tiene "tarifas" con estructura alternativa
-            for tarifa_block in eje.get("tarifas", []) or []:
-                # "tarifas" puede contener bloques con "peajes" o "porticos"
-                if "peajes" in tarifa_block and isinstance(tarifa_block["peajes"], dict):
-                    # tarifas por tipo dentro de este bloque
-                    # e.g. tarifa_block might be {"tipo": "NORMAL", "peajes": {...}}
-                    tipo = tarifa_block.get("tipo") or tarifa_block.get("nombre") or "NORMAL"
-                    peajes_obj = tarifa_block.get("peajes", {})
-                    # here peajes_obj might be dict of categories -> prices
-                    if all(isinstance(v, (int, float)) or v is None for v in peajes_obj.values()):
-                        for cat, val in peajes_obj.items():
-                            tarifas_encontradas.append({
-                                "categoria_vehiculo": cat,
-                                "tipo_tarifa": tipo.upper(),
-                                "precio": val
-                            })
-                    else:
-                        # nested structure (ej: {"normal": {...}, "punta": {...}})
-                        for tipo_tar, precios_map in peajes_obj.items():
-                            for cat, val in precios_map.items():
-                                tarifas_encontradas.append({
-                                    "categoria_vehiculo": cat,
-                                    "tipo_tarifa": tipo_tar.upper(),
-                                    "precio": val
-                                })
+        for entrada in ap["_entradas"]:
+            # Los bloques de tarifas del eje se asignan siempre
+            if entrada["es_bloque"] or portico_coincide(entrada):
+                tarifas_encontradas.extend(entrada["tarifas"])
         return tarifas_encontradas
 
-    def extraer_tarifas_de_portico(portico):
-        tarifas = []
-        # Portico puede tener "peajes" o "tarifas"
-        # Normalizar nombre y tipo
-        p_nombre = portico.get("nombre") or portico.get("nombre_portico") or ""
-        p_tipo = portico.get("tipo") or ""
-        p_nombre_norm, p_nombre_tokens = normalizar(p_nombre)
-        p_tipo_norm, p_tipo_tokens = normalizar(p_tipo)
-
-        match_by_name = False
-        match_by_type = False
-
+    def portico_coincide(entrada):
         # si tokens comparten intersección significativa -> match
-        if nombre_geo_tokens and p_nombre_tokens:
-            inter = nombre_geo_tokens.intersection(p_nombre_tokens)
-            if len(inter) >= 1:
-                match_by_name = True
-
+        if nombre_geo_tokens and not nombre_geo_tokens.isdisjoint(entrada["nombre_tokens"]):
+            return True
         # match por igualdad de nombres normalizados (incluye "Lateral"/"Troncal")
+        p_nombre_norm = entrada["nombre_norm"]
         if p_nombre_norm and (p_nombre_norm in nombre_geo_norm or nombre_geo_norm in p_nombre_norm):
-            match_by_name = True
-        if p_tipo_norm and p_tipo_norm == tipo_geo_norm and tipo_geo_norm:
-            match_by_type = True
-
-        # Si hay match por name o type, extraer sus peajes
-        if match_by_name or match_by_type:
-            # Estructura 1: portico.get("peajes") -> dict categories -> value or dict of types
-            if "peajes" in portico and isinstance(portico["peajes"], dict):
-                for cat_key, precios in portico["peajes"].items():
-                    if isinstance(precios, dict):
-                        # ejemplos: {"TBFP": 839.5, "TBP": null}
-                        for tipo_tarifa, precio_val in precios.items():
-                            tarifas.append({
-                                "categoria_vehiculo": cat_key,
-                                "tipo_tarifa": tipo_tarifa,
-                                "precio": precio_val
-                            })
-                    else:
-                        tarifas.append({
-                            "categoria_vehiculo": cat_key,
-                            "tipo_tarifa": "NORMAL",
-                            "precio": precios
-                        })
-            # Estructura 2: portico tiene "tarifas" o "tarifas" está en bloque de eje
-            if "tarifas" in portico and isinstance(portico["tarifas"], dict):
-                # {"normal": {...}, "punta": {...}}
-                for tipo_tarifa, precios_map in portico["tarifas"].items():
-                    for cat_key, precio_val in precios_map.items():
-                        tarifas.append({
-                            "categoria_vehiculo": cat_key,
-                            "tipo_tarifa": tipo_tarifa.upper(),
-                            "precio": precio_val
-                        })
-            # Estructura 3: portico directamente anidado (ej. en algunos JSON)
-            # (si no hay peajes explícitos, no agregamos nada)
-        return tarifas
+            return True
+        return bool(tipo_geo_norm) and entrada["tipo_norm"] == tipo_geo_norm
 
     # Primero, extraer de candidatos por contrato/tramo
     for ap in cand_aps:
         tarifas = extraer_tarifas_desde_autopista(ap)
         resultados.extend(tarifas)
 
-    # Si no se encontró nada aún, intentar búsqueda amplia por tokens entre nombre_geo y todo precios_list
+    # Si no se encontró nada aún, búsqueda amplia por tokens entre nombre_geo y todo precios_list.
+    # En vez de recorrer todos los pórticos, se consultan los índices y se respeta el orden original.
     if not resultados:
-        for ap in precios_list:
-            # sólo explorar si hay alguna intersección de tokens entre autopista/tramo y contrato/nombre del peaje
-            # chequeo rápido: si tokens intersectan (contrato-autopista)
-            if contrato_geo_tokens and ap.get("_nombre_tokens") and contrato_geo_tokens.intersection(ap.get("_nombre_tokens")):
+        aps_por_contrato = set()
+        for token in contrato_geo_tokens:
+            aps_por_contrato.update(idx_token_autopista.get(token, ()))
+
+        entradas_por_ap = defaultdict(set)
+        for token in nombre_geo_tokens:
+            for pos_ap, pos_entrada in idx_token_portico.get(token, ()):
+                entradas_por_ap[pos_ap].add(pos_entrada)
+
+        for pos_ap in sorted(aps_por_contrato.union(entradas_por_ap)):
+            ap = precios_list[pos_ap]
+            # si tokens intersectan (contrato-autopista) se extrae la autopista completa
+            if pos_ap in aps_por_contrato:
                 resultados.extend(extraer_tarifas_desde_autopista(ap))
                 continue
-            # búsqueda por portico names/tokens
-            for eje in ap.get("ejes", []) or []:
-                # check porticos in directions
-                if "direcciones" in eje and isinstance(eje["direcciones"], list):
-                    for d in eje["direcciones"]:
-                        for portico in d.get("porticos", []) or []:
-                            p_nombre = portico.get("nombre") or ""
-                            _, p_tokens = normalizar(p_nombre)
-                            if nombre_geo_tokens and p_tokens and nombre_geo_tokens.intersection(p_tokens):
-                                resultados.extend(extraer_tarifas_de_portico(portico))
-                # porticos directos
-                for portico in eje.get("porticos", []) or []:
-                    p_nombre = portico.get("nombre") or ""
-                    _, p_tokens = normalizar(p_nombre)
-                    if nombre_geo_tokens and p_tokens and nombre_geo_tokens.intersection(p_tokens):
-                        resultados.extend(extraer_tarifas_de_portico(portico))
-                # tarifas bloque
-                for tarifa_block in eje.get("tarifas", []) or []:
-                    # si el bloque tiene "peajes" y el nombre del bloque coincide con tramo/nombre_geo, extraer
-                    block_name = tarifa_block.get("nombre") or tarifa_block.get("tipo") or ""
-                    block_norm, block_tokens = normalizar(block_name)
-                    if block_tokens and nombre_geo_tokens and block_tokens.intersection(nombre_geo_tokens):
-                        # extraer precios del bloque
-                        if "peajes" in tarifa_block:
-                            # estructura similar a antes
-                            peajes_obj = tarifa_block["peajes"]
-                            if isinstance(peajes_obj, dict):
-                                # puede ser nested
-                                if all(isinstance(v, (int, float)) or v is None for v in peajes_obj.values()):
-                                    for cat, val in peajes_obj.items():
-                                        resultados.append({
-                                            "categoria_vehiculo": cat,
-                                            "tipo_tarifa": "NORMAL",
-                                            "precio": val
-                                        })
-                                else:
-                                    for tipo_tar, precios_map in peajes_obj.items():
-                                        for cat, val in precios_map.items():
-                                            resultados.append({
-                                                "categoria_vehiculo": cat,
-                                                "tipo_tarifa": tipo_tar.upper(),
-                                                "precio": val
-                                            })
+            for pos_entrada in sorted(entradas_por_ap[pos_ap]):
+                entrada = ap["_entradas"][pos_entrada]
+                if entrada["es_bloque"]:
+                    resultados.extend(entrada["tarifas_busqueda"])
+                else:
+                    resultados.extend(entrada["tarifas"])
+
     # Deduplicate resultados por (categoria, tipo_tarifa, precio)
     seen = set()
     deduped = []
@@ -293,14 +327,17 @@ def main():
     precios_list = extraer_precios_lista(precios_raw)
 
     # Indexar precios para búsquedas rápidas
+    inicio = time.perf_counter()
     idx_autopista, idx_tramo = indexar_precios(precios_list)
+    idx_token_autopista, idx_token_portico = indexar_porticos(precios_list)
 
     peajes_enriquecidos = []
     sin_match = []
     usado_georef_ids = set()
 
     for peaje in peajes_geo:
-        tarifas = buscar_matches_para_peaje(peaje, precios_list, idx_autopista, idx_tramo)
+        tarifas = buscar_matches_para_peaje(peaje, precios_list, idx_autopista, idx_tramo,
+                                            idx_token_autopista, idx_token_portico)
         if tarifas:
             peaje_out = {
                 "OBJECTID": peaje.get("OBJECTID"),
@@ -325,6 +362,7 @@ def main():
                 "latitud": peaje.get("latitude"),
                 "longitud": peaje.get("longitude")
             })
+    duracion_ms = (time.perf_counter() - inicio) * 1000
 
     # Guardar resultado
     with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
@@ -350,6 +388,7 @@ def main():
     # Mensajes finales
     print(f"✅ Guardado: {OUTPUT_FILE} ({total_enriq} peajes enriquecidos)")
     print(f"✅ Reporte: {REPORT_FILE} (total georef: {total_geo}, cobertura: {coverage:.2f}%)")
+    print(f"⏱️ Matching de tarifas: {duracion_ms:.1f} ms")
     if total_sin:
         print(f"⚠️ Peajes sin match: {total_sin} — revisa {REPORT_FILE} para detalles")
 
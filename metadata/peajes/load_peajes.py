@@ -1,12 +1,17 @@
-import json
 import os
+import sys
 import psycopg2
+from psycopg2.extras import Json, execute_values
 from dotenv import load_dotenv
 
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..'))
+from comun.artefactos import buscar_artefacto, leer_artefacto
+from comun.db import conexion
+
 
 class CargadorPeajes:
     """
-    Carga los datos transformados de peajes desde el JSON limpio
+    Carga los datos transformados de peajes desde el artefacto limpio (JSON, NDJSON o NPZ)
     a las tablas 'peajes' y 'tarifas_peaje' en PostgreSQL.
     """
 
@@ -24,26 +29,59 @@ class CargadorPeajes:
         if not all(self.db_config.values()):
             raise ValueError("Faltan variables de BD en el archivo .env.")
 
+    def _obtener_id_catalogo(self, cur, tabla, columna, valor, cache):
+        """
+        Retorna el ID de 'valor' en un catálogo ('categorias_vehiculo' o 'tipos_tarifa'),
+        insertándolo si aún no existe. 'cache' evita repetir la consulta para el mismo valor.
+        """
+        if valor not in cache:
+            cur.execute(
+                f"""
+                INSERT INTO {tabla} ({columna}) VALUES (%s)
+                ON CONFLICT ({columna}) DO UPDATE SET {columna} = EXCLUDED.{columna}
+                RETURNING id;
+                """,
+                (valor,)
+            )
+            cache[valor] = cur.fetchone()[0]
+        return cache[valor]
+
+    def _vacuum_tarifas(self):
+        """
+        Marca las páginas recién cargadas de 'tarifas_peaje' como visibles para que los
+        'Index Only Scan' sobre su llave primaria no tengan que revisar la tabla.
+        VACUUM no puede correr dentro de una transacción, por eso usa su propia conexión.
+        """
+        conn = psycopg2.connect(**self.db_config)
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute("VACUUM (ANALYZE) tarifas_peaje;")
+        finally:
+            conn.close()
+
     def ejecutar_carga(self):
+        """Carga los peajes y sus tarifas. Retorna False si la carga falló."""
         print("--- Iniciando Proceso de Carga de Datos de Peajes ---")
 
-        json_path = os.path.join(self.script_dir, 'transformed_peajes.json')
-        if not os.path.exists(json_path):
+        json_path = buscar_artefacto(os.path.join(self.script_dir, 'transformed_peajes'))
+        if not json_path:
             print(
-                f"Error: No se encontró el archivo 'transformed_peajes.json'. Ejecuta el script de transformación primero.")
-            return
+                f"Error: No se encontró el archivo 'transformed_peajes'. Ejecuta el script de transformación primero.")
+            return False
 
         print(f"Cargando datos desde: {os.path.basename(json_path)}")
 
         try:
-            with open(json_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-        except (json.JSONDecodeError, IOError) as e:
-            print(f"Error al leer el archivo JSON: {e}")
-            return
+            # Los peajes se leen a medida que se insertan
+            _, data = leer_artefacto(json_path)
+        except (ValueError, OSError) as e:
+            print(f"Error al leer el archivo de datos: {e}")
+            return False
 
         try:
-            with psycopg2.connect(**self.db_config) as conn:
+            # Conexión del pool compartido (se revierte sola si hay un error)
+            with conexion() as conn:
                 with conn.cursor() as cur:
                     print("Conexión a la base de datos establecida exitosamente.")
 
@@ -51,50 +89,94 @@ class CargadorPeajes:
                     cur.execute("TRUNCATE TABLE tarifas_peaje, peajes RESTART IDENTITY CASCADE;")
 
                     peajes_insertados = 0
-                    tarifas_insertadas = 0
+                    ids_categorias = {}
+                    ids_tipos_tarifa = {}
+                    # (peaje, categoría, tipo de tarifa) -> precio: la llave primaria de 'tarifas_peaje'
+                    precios_tarifas = {}
+                    conflictos = []
+                    repetidas = 0
 
                     for peaje in data:
                         # Insertar en la tabla 'peajes'
                         cur.execute(
                             """
-                            INSERT INTO peajes (nombre, concesionaria, tipo, ubicacion)
-                            VALUES (%s, %s, %s, ST_SetSRID(ST_MakePoint(%s, %s), 4326)) RETURNING id;
+                            INSERT INTO peajes (nombre, concesionaria, tipo, horarios, ubicacion)
+                            VALUES (%s, %s, %s, %s, ST_SetSRID(ST_MakePoint(%s, %s), 4326)) RETURNING id;
                             """,
                             (
                                 peaje.get('nombre'), peaje.get('concesionaria'), peaje.get('tipo'),
+                                Json(peaje['horarios']) if peaje.get('horarios') else None,
                                 peaje.get('longitud'), peaje.get('latitud')
                             )
                         )
                         peaje_id_db = cur.fetchone()[0]
                         peajes_insertados += 1
 
-                        # Insertar tarifas asociadas
+                        # Tarifas asociadas, con la categoría y el tipo de tarifa como IDs de sus catálogos
                         for tarifa in peaje.get('tarifas', []):
-                            cur.execute(
-                                """
-                                INSERT INTO tarifas_peaje (peaje_id, categoria_vehiculo, tipo_tarifa, precio)
-                                VALUES (%s, %s, %s, %s);
-                                """,
-                                (
-                                    peaje_id_db,
-                                    tarifa.get('categoria_vehiculo'),
-                                    tarifa.get('tipo_tarifa'),
-                                    tarifa.get('precio')
-                                )
+                            llave = (
+                                peaje_id_db,
+                                self._obtener_id_catalogo(cur, 'categorias_vehiculo', 'nombre',
+                                                          tarifa.get('categoria_vehiculo'), ids_categorias),
+                                self._obtener_id_catalogo(cur, 'tipos_tarifa', 'codigo',
+                                                          tarifa.get('tipo_tarifa'), ids_tipos_tarifa)
                             )
-                            tarifas_insertadas += 1
+                            # Una tarifa repetida con el mismo precio se carga una vez. Con otro precio es un
+                            # dato que el tipo de tarifa no distingue (ej. pago con TAG o manual): se revierte
+                            # la carga en vez de quedarse con uno de los dos precios
+                            if llave not in precios_tarifas:
+                                precios_tarifas[llave] = tarifa.get('precio')
+                            elif precios_tarifas[llave] != tarifa.get('precio'):
+                                conflictos.append((peaje, tarifa, precios_tarifas[llave]))
+                            else:
+                                repetidas += 1
+
+                    if conflictos:
+                        print(f"Error: {len(conflictos)} tarifas con la misma categoría y tipo que otra del mismo "
+                              f"peaje, pero con otro precio. Se revierte la carga:")
+                        for peaje, tarifa, precio_anterior in conflictos:
+                            print(f"  -> {peaje.get('concesionaria')} / {peaje.get('nombre')}: "
+                                  f"{tarifa.get('categoria_vehiculo')} {tarifa.get('tipo_tarifa')} = "
+                                  f"{tarifa.get('precio')} (antes {precio_anterior})")
+                        conn.rollback()
+                        return False
+
+                    # Ya no hay llaves repetidas: un conflicto aquí sería un error y revierte la carga
+                    tarifas_insertadas = len(execute_values(
+                        cur,
+                        """
+                        INSERT INTO tarifas_peaje (peaje_id, categoria_id, tipo_tarifa_id, precio)
+                        VALUES %s RETURNING 1;
+                        """,
+                        [(*llave, precio) for llave, precio in precios_tarifas.items()],
+                        fetch=True
+                    ))
+
+                    # Nueva versión de los datos: el motor de tarifas del sitio web se recarga solo
+                    cur.execute(
+                        """
+                        INSERT INTO versiones_datos (fuente, actualizado_en)
+                        VALUES ('peajes', NOW())
+                        ON CONFLICT (fuente) DO UPDATE SET actualizado_en = EXCLUDED.actualizado_en;
+                        """
+                    )
 
                     print(f"\n¡Carga completada!")
                     print(f"  -> Se insertaron {peajes_insertados} peajes.")
-                    print(f"  -> Se insertaron {tarifas_insertadas} tarifas.")
+                    print(f"  -> Se insertaron {tarifas_insertadas} tarifas ({repetidas} repetidas descartadas).")
+                    print(f"  -> {len(ids_categorias)} categorías de vehículo y {len(ids_tipos_tarifa)} tipos de tarifa.")
+
+            self._vacuum_tarifas()
+            return True
 
         except psycopg2.Error as e:
             print(f"\nError de base de datos durante la carga: {e}")
-            if conn: conn.rollback()
         except Exception as e:
             print(f"\nOcurrió un error inesperado: {e}")
+        return False
 
 
 if __name__ == "__main__":
     cargador = CargadorPeajes()
-    cargador.ejecutar_carga()
\ No newline at end of file
+    if not cargador.ejecutar_carga():
+        sys.exit(1)
\ No newline at end of file
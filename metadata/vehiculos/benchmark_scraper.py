@@ -0,0 +1,150 @@
+import html
+import importlib.util
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, unquote
+
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+ORIGEN_REAL = "https://www.chileautos.cl"
+
+
+def cargar_scraper():
+    """Importa 'scraper-chileautos.py' (el guion en el nombre impide un import normal)."""
+    spec = importlib.util.spec_from_file_location(
+        "scraper_chileautos", os.path.join(SCRIPT_DIR, "scraper-chileautos.py"))
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+class PaginasGrabadas:
+    """
+    Reconstruye las páginas del catálogo y de cada vehículo a partir de 'chileautos_data.json',
+    con el mismo HTML que lee el scraper, para servirlas desde un servidor local.
+    """
+
+    def __init__(self, versiones, vehiculos_por_pagina=12):
+        self.versiones_por_ruta = {}
+        for version in versiones:
+            ruta = urlsplit(version['fuente_url']).path
+            self.versiones_por_ruta.setdefault(ruta, []).append(version)
+        rutas = list(self.versiones_por_ruta)
+        self.paginas = [rutas[i:i + vehiculos_por_pagina] for i in range(0, len(rutas), vehiculos_por_pagina)]
+
+    def catalogo(self, numero_pagina):
+        rutas = self.paginas[numero_pagina - 1] if 1 <= numero_pagina <= len(self.paginas) else []
+        tarjetas = "".join(
+            f'<div class="col-12 col-sm-6 col-md-4 col-lg-4 col-xxl-3"><a href="{html.escape(ruta)}">ver</a></div>'
+            for ruta in rutas)
+        return f"<html><body>{tarjetas}</body></html>"
+
+    def vehiculo(self, ruta):
+        if ruta not in self.versiones_por_ruta:
+            return None
+        tarjetas = []
+        for version in self.versiones_por_ruta[ruta]:
+            precio = ""
+            if version.get('precio_referencia') is not None:
+                precio = f'<h5 class="card-title">${version["precio_referencia"]:,}</h5>'.replace(',', '.')
+            especificaciones = "".join(
+                f'<li class="list-group-item"><span>{html.escape(clave)}:</span>'
+                f'<span class="right-span">{html.escape(valor)}</span></li>'
+                for clave, valor in version.get('especificaciones', {}).items())
+            tarjetas.append(
+                '<div class="card margin-card">'
+                f'<div class="title-container"><h6 class="card-title">{html.escape(version["modelo_base"])}</h6>'
+                f'<h5 class="card-title">{html.escape(version["version"])}</h5></div>'
+                f'<img src="{html.escape(version["imagen_url"])}">{precio}'
+                f'<ul class="card-specifications">{especificaciones}</ul></div>')
+        return f"<html><body>{''.join(tarjetas)}</body></html>"
+
+
+def iniciar_servidor(paginas, latencia):
+    """Levanta el servidor local en un puerto libre; cada respuesta tarda 'latencia' segundos."""
+
+    class Manejador(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, igual que el sitio real
+
+        def do_GET(self):
+            time.sleep(latencia)
+            url = urlsplit(self.path)
+            if url.path == "/catalogo/":
+                cuerpo = paginas.catalogo(int(parse_qs(url.query).get('Page', ['1'])[0]))
+            else:
+                cuerpo = paginas.vehiculo(unquote(url.path))
+            if cuerpo is None:
+                self.send_error(404)
+                return
+            datos = cuerpo.encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(datos)))
+            self.end_headers()
+            self.wfile.write(datos)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), Manejador)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+class BenchmarkScraper:
+    """
+    Compara el scraper con una sola conexión (como el recorrido secuencial original, sin las pausas
+    de 1 s) y con varias peticiones concurrentes, contra un servidor local con las páginas grabadas.
+    Verifica además que ambos generen exactamente el mismo 'chileautos_data.json'.
+    """
+
+    def __init__(self, latencia=0.1, concurrencia=8, tasa=50.0):
+        self.latencia = latencia
+        self.concurrencia = concurrencia
+        self.tasa = tasa
+
+    def _medir(self, scraper, base_url, concurrencia, origen_local):
+        inicio = time.perf_counter()
+        datos = scraper.scrape_catalog(base_url, concurrency=concurrencia, rate=self.tasa)
+        segundos = time.perf_counter() - inicio
+        for version in datos:
+            version['fuente_url'] = version['fuente_url'].replace(origen_local, ORIGEN_REAL)
+        return segundos, datos
+
+    def ejecutar(self):
+        # Caché HTTP temporal, para no mezclar las páginas del servidor local con las reales
+        directorio_cache = tempfile.mkdtemp(prefix='benchmark_scraper_cache_')
+        os.environ['HTTP_CACHE_DIR'] = directorio_cache
+        with open(os.path.join(SCRIPT_DIR, 'chileautos_data.json'), 'r', encoding='utf-8') as f:
+            esperado = json.load(f)
+        paginas = PaginasGrabadas(esperado)
+        servidor = iniciar_servidor(paginas, self.latencia)
+        origen_local = f"http://127.0.0.1:{servidor.server_address[1]}"
+        scraper = cargar_scraper()
+
+        print(f"--- Benchmark del scraper de Chileautos (latencia {self.latencia} s, tasa {self.tasa} pet/s) ---")
+        try:
+            resultados = {}
+            for nombre, concurrencia in (("secuencial", 1), (f"concurrente x{self.concurrencia}", self.concurrencia)):
+                resultados[nombre] = self._medir(scraper, f"{origen_local}/catalogo/", concurrencia, origen_local)
+        finally:
+            servidor.shutdown()
+            shutil.rmtree(directorio_cache, ignore_errors=True)
+
+        peticiones = len(paginas.versiones_por_ruta) + scraper.MAX_PAGES_TO_SCRAPE
+        print("\nResultados:")
+        print(f"  -> {'original (estimado)':<18} {peticiones * (self.latencia + 1):8.1f} s   (pausa de 1 s por petición)")
+        for nombre, (segundos, datos) in resultados.items():
+            identico = "idéntico" if datos == esperado else "DISTINTO"
+            print(f"  -> {nombre:<18} {segundos:8.1f} s   ({len(datos)} versiones, {identico} a chileautos_data.json)")
+        tiempos = [segundos for segundos, _ in resultados.values()]
+        print(f"  -> Aceleración: {tiempos[0] / tiempos[1]:.1f}x")
+
+
+if __name__ == '__main__':
+    BenchmarkScraper().ejecutar()
@@ -1,13 +1,17 @@
 # Archivo: metadata/vehiculos/load_vehiculos.py
-import json
 import os
+import sys
 import psycopg2
 from dotenv import load_dotenv
 
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..'))
+from comun.artefactos import buscar_artefacto, leer_artefacto
+from comun.db import conexion
+
 def load_data_to_db(json_file_path):
     """
-    Lee datos de un archivo JSON y los carga en las tablas normalizadas
-    marcas, modelos y versiones de la base de datos PostgreSQL.
+    Lee datos de un artefacto (JSON, NDJSON o NPZ) y los carga en las tablas normalizadas
+    marcas, modelos y versiones de la base de datos PostgreSQL. Retorna False si la carga falló.
     """
     load_dotenv()
 
@@ -21,24 +25,30 @@ def load_data_to_db(json_file_path):
 
     if not all(db_config.values()):
         print("Error: Faltan variables de entorno para la base de datos en el archivo .env.")
-        return
+        return False
 
-    try:
-        with open(json_file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-    except FileNotFoundError:
+    if not json_file_path or not os.path.exists(json_file_path):
         print(f"Error: No se encontró el archivo de entrada {json_file_path}")
-        return
+        return False
+
+    try:
+        # Los registros se leen a medida que se cargan
+        _, data = leer_artefacto(json_file_path)
+    except (ValueError, OSError) as e:
+        print(f"Error al leer el archivo de entrada: {e}")
+        return False
 
-    conn = None
     try:
-        with psycopg2.connect(**db_config) as conn:
+        # Conexión del pool compartido (se revierte sola si hay un error)
+        with conexion() as conn:
             with conn.cursor() as cur:
                 print("Conexión a la base de datos establecida exitosamente.")
                 print("Limpiando tablas antiguas...")
                 cur.execute("TRUNCATE TABLE versiones, modelos, marcas RESTART IDENTITY CASCADE;")
 
+                total = 0
                 for vehiculo in data:
+                    total += 1
                     modelo_base = vehiculo.get('modelo_base', '').strip()
                     if not modelo_base:
                         continue
@@ -118,18 +128,31 @@ def load_data_to_db(json_file_path):
                         )
                     )
 
-                print(f"¡Carga completada! Se procesaron {len(data)} registros de vehículos.")
+                # Nueva versión de los datos: main.py la usa para saber si la carga sigue en la base
+                cur.execute(
+                    """
+                    INSERT INTO versiones_datos (fuente, actualizado_en)
+                    VALUES ('vehiculos', NOW())
+                    ON CONFLICT (fuente) DO UPDATE SET actualizado_en = EXCLUDED.actualizado_en;
+                    """
+                )
+
+                print(f"¡Carga completada! Se procesaron {total} registros de vehículos.")
+        return True
 
     except psycopg2.Error as e:
         print(f"Error de base de datos: {e}")
     except Exception as e:
         print(f"Ocurrió un error inesperado: {e}")
-    finally:
-        if conn:
-            conn.close()
-            print("Conexión a la base de datos cerrada.")
+    return False
+
+
+def ejecutar():
+    """Punto de entrada del paso: carga el 'metadata_vehiculos' más reciente de esta carpeta, en cualquier formato."""
+    script_dir = os.path.dirname(os.path.realpath(__file__))
+    return load_data_to_db(buscar_artefacto(os.path.join(script_dir, 'metadata_vehiculos')))
+
 
 if __name__ == "__main__":
-    SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
-    json_input_file = os.path.join(SCRIPT_DIR, 'metadata_vehiculos.json')
-    load_data_to_db(json_input_file)
\ No newline at end of file
+    if not ejecutar():
+        sys.exit(1)
\ No newline at end of file
@@ -1,48 +1,125 @@
 from urllib.parse import urljoin
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import threading
 import time
 import json
 from typing import List, Dict, Any
 import os
+import sys
 
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..'))
+from comun import metricas
+from comun.http_cache import ClienteHTTP
 
-def extract_all_car_urls(base_url):
-    # Definimos la lista para guardar todos los links encontrados y un numero maximo de paginas a scrapear
-    all_car_links = []
-    MAX_PAGES_TO_SCRAPE = 20
+MAX_PAGES_TO_SCRAPE = 20
+DEFAULT_CONCURRENCY = 8      # Peticiones simultáneas (y conexiones keep-alive en el pool)
+DEFAULT_RATE = 4.0           # Peticiones por segundo permitidas hacia chileautos
+DEFAULT_RETRIES = 3          # Reintentos ante errores de red, 429 y 5xx (con backoff exponencial)
+
+
+class RateLimiter:
+    """
+    Token bucket compartido por todos los hilos: se recargan 'rate' tokens por segundo hasta
+    un máximo de 'burst', y cada petición consume uno (esperando si no hay disponibles).
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.tokens = self.burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class HttpClient:
+    """
+    Sesión HTTP compartida (conexiones keep-alive reutilizadas) con reintentos y límite de tasa.
+    requests.Session es segura para hacer GETs concurrentes si el pool tiene una conexión por hilo.
+    Las páginas pasan por la caché en disco de ClienteHTTP; las que se sirven desde la caché no
+    consumen cupo del límite de tasa.
+    """
 
-    # Bucle para generar páginas y extraer links de vehiculos
-    for page_number in range(1, MAX_PAGES_TO_SCRAPE + 1):
-        current_page_url = f'{base_url}?Page={page_number}'
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE, retries=DEFAULT_RETRIES):
+        self.limiter = RateLimiter(rate)
+        self.session = requests.Session()
+        retry = Retry(total=retries, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods=["GET"], respect_retry_after_header=True)
+        adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.cache = ClienteHTTP(session=_LimitedSession(self.session, self.limiter))
 
-        print(f'Analizando pagina {page_number}')
+    def get(self, url):
+        return self.cache.get(url, timeout=10)
 
-        links_from_page = extract_car_urls_from_page(current_page_url)
 
-        if not links_from_page:
-            print(f'No se encontraron más vehículos en la página {page_number}. Terminando el proceso.')
-            break
+class _LimitedSession:
+    """Envuelve la sesión para que solo las peticiones que salen a la red esperen al limitador."""
+
+    def __init__(self, session, limiter):
+        self.session = session
+        self.limiter = limiter
+
+    def get(self, url, **kwargs):
+        self.limiter.acquire()
+        return self.session.get(url, **kwargs)
+
+
+def extract_all_car_urls(base_url, client, executor, window=DEFAULT_CONCURRENCY):
+    """
+    Descarga las páginas del catálogo (hasta MAX_PAGES_TO_SCRAPE) en ventanas de 'window' páginas en
+    paralelo y junta los links en orden de página, deteniéndose en la primera página sin vehículos, igual
+    que el recorrido secuencial. Una ventana se pide solo si la anterior no tuvo páginas vacías, así que
+    a lo más se descargan 'window' - 1 páginas de más.
+    """
+    all_car_links = []
+    extract = metricas.propagar(lambda url: extract_car_urls_from_page(url, client))
+
+    for first_page in range(1, MAX_PAGES_TO_SCRAPE + 1, window):
+        page_numbers = range(first_page, min(first_page + window, MAX_PAGES_TO_SCRAPE + 1))
+        # map() entrega los resultados en el orden de las páginas aunque se descarguen en paralelo
+        results = executor.map(extract, [f'{base_url}?Page={page_number}' for page_number in page_numbers])
+        for page_number, links_from_page in zip(page_numbers, results):
+            print(f'Analizando pagina {page_number}')
 
-        # Agregamos los links encontrados a la lista general
-        all_car_links.extend(links_from_page)
+            if not links_from_page:
+                print(f'No se encontraron más vehículos en la página {page_number}. Terminando el proceso.')
+                return all_car_links
 
-        # Pausa para evitar saturar el servidor y evitar bloqueos
-        time.sleep(1)
+            # Agregamos los links encontrados a la lista general
+            all_car_links.extend(links_from_page)
 
     return all_car_links
 
-def extract_car_urls_from_page(page_url):
+def extract_car_urls_from_page(page_url, client):
     """
     Recorre una página del catálogo de vehículos y devuelve una lista de URLs de los vehículos.
 
     :param page_url: La URL de la página del catálogo que se va a analizar.
+    :param client: El HttpClient compartido con el que se hace la petición.
     :return: Una lista de URLs absolutas para cada vehículo encontrado en la página.
              Retorna una lista vacía si ocurre un error.
     """
     try:
         # Realizamos la petición HTTP GET con un tiempo de espera para evitar que se quede colgada
-        response = requests.get(page_url, timeout=10)
+        response = client.get(page_url)
         # Lanza una excepción si el codigo de estadi es un error
         response.raise_for_status()
     except requests.RequestException as e:
@@ -71,17 +148,18 @@ def extract_car_urls_from_page(page_url):
     return vehicles_urls
 
 
-def extract_car_data(car_url: str) -> List[Dict[str, Any]]:
+def extract_car_data(car_url: str, client: HttpClient) -> List[Dict[str, Any]]:
     """
     Extrae los datos de todas las versiones de un vehículo desde su URL específica.
     Una URL puede contener múltiples versiones (ej. manual, automático).
 
     :param car_url: La URL de la página del detalle del vehículo.
+    :param client: El HttpClient compartido con el que se hace la petición.
     :return: Una lista de diccionarios, donde cada diccionario es una versión del vehículo.
     """
     # ... (código de la petición requests y la creación del objeto soup) ...
     try:
-        response = requests.get(car_url, timeout=10)
+        response = client.get(car_url)
         response.raise_for_status()
     except requests.RequestException as e:
         print(f'Error al obtener la URL del vehículo {car_url}: {e}')
@@ -150,44 +228,78 @@ def extract_car_data(car_url: str) -> List[Dict[str, Any]]:
     return vehicle_versions_data
 
 
+def scrape_catalog(base_url, concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE, retries=DEFAULT_RETRIES):
+    """
+    Recorre el catálogo completo con 'concurrency' peticiones simultáneas como máximo y a lo más
+    'rate' peticiones por segundo. Retorna las versiones en el mismo orden que el recorrido secuencial.
+    """
+    client = HttpClient(concurrency, rate, retries)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # --- PASO 1: Obtener todos los links de los vehículos ---
+        print("--- INICIANDO PASO 1: Extracción de URLs de vehículos ---")
+        car_links = extract_all_car_urls(base_url, client, executor, window=concurrency)
+        print(f"\nSe encontraron {len(car_links)} links de modelos de vehículos.")
+
+        # --- PASO 2: Recorrer cada link y extraer los datos de sus versiones ---
+        print("\n--- INICIANDO PASO 2: Extracción de datos de cada vehículo ---")
+        all_vehicles_data = []
+
+        results = executor.map(metricas.propagar(lambda url: extract_car_data(url, client)), car_links)
+        for i, (car_link, versions_on_page) in enumerate(zip(car_links, results)):
+            print(f"Procesando link {i + 1}/{len(car_links)}: {car_link}")
+            if versions_on_page:
+                print(f"  -> Se encontraron {len(versions_on_page)} versiones en esta página.")
+                all_vehicles_data.extend(versions_on_page)
+            else:
+                print(f"  -> No se encontraron datos de versiones en esta página.")
+
+    client.session.close()
+    return all_vehicles_data
+
+
 # ==============================================================================
-# SCRIPT PRINCIPAL (CORREGIDO)
+# SCRIPT PRINCIPAL
 # ==============================================================================
-if __name__ == "__main__":
+def ejecutar(argv=()):
+    """
+    Punto de entrada del paso. 'argv' son los argumentos de línea de comandos (por defecto, ninguno).
+    Retorna True si se guardaron los datos, False si no.
+    """
     # --- OBTENER LA RUTA DEL DIRECTORIO DEL SCRIPT ---
     # Esto asegura que los archivos se guarden en la misma carpeta que este script (.py)
     SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
 
-    BASE_CATALOG_URL = "https://www.chileautos.cl/catalogo/"
-
-    # --- PASO 1: Obtener todos los links de los vehículos ---
-    print("--- INICIANDO PASO 1: Extracción de URLs de vehículos ---")
-    car_links = extract_all_car_urls(BASE_CATALOG_URL)
-    print(f"\nSe encontraron {len(car_links)} links de modelos de vehículos.")
-
-    # --- PASO 2: Recorrer cada link y extraer los datos de sus versiones ---
-    print("\n--- INICIANDO PASO 2: Extracción de datos de cada vehículo ---")
-    all_vehicles_data = []
-
-    for i, car_link in enumerate(car_links):
-        print(f"Procesando link {i + 1}/{len(car_links)}: {car_link}")
-        versions_on_page = extract_car_data(car_link)
-        if versions_on_page:
-            print(f"  -> Se encontraron {len(versions_on_page)} versiones en esta página.")
-            all_vehicles_data.extend(versions_on_page)
-        else:
-            print(f"  -> No se encontraron datos de versiones en esta página.")
-        time.sleep(1)
+    parser = argparse.ArgumentParser(description="Scraper concurrente del catálogo de Chileautos.")
+    parser.add_argument("--base-url", default="https://www.chileautos.cl/catalogo/",
+                        help="URL del catálogo (ej. un servidor local con páginas grabadas).")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="Peticiones simultáneas como máximo.")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="Peticiones por segundo como máximo.")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES, help="Reintentos por petición fallida.")
+    parser.add_argument("--output", default=os.path.join(SCRIPT_DIR, 'chileautos_data.json'),
+                        help="Ruta del archivo JSON de salida.")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    all_vehicles_data = scrape_catalog(args.base_url, args.concurrency, args.rate, args.retries)
+    print(f"\nScraping completado en {time.perf_counter() - start:.1f} s.")
 
     # --- PASO 3: Guardar todos los datos en un archivo JSON en la carpeta correcta ---
     print("\n--- INICIANDO PASO 3: Guardando datos en archivo JSON ---")
 
     # Construir la ruta de salida completa
-    output_path = os.path.join(SCRIPT_DIR, 'chileautos_data.json')
+    output_path = args.output
 
     try:
         with open(output_path, 'w', encoding='utf-8') as f:
             json.dump(all_vehicles_data, f, indent=4, ensure_ascii=False)
         print(f"\n¡Éxito! Se guardaron los datos de {len(all_vehicles_data)} vehículos/versiones en el archivo '{output_path}'")
+        return True
     except Exception as e:
-        print(f"\nOcurrió un error al guardar el archivo JSON: {e}")
\ No newline at end of file
+        print(f"\nOcurrió un error al guardar el archivo JSON: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    if not ejecutar(sys.argv[1:]):
+        sys.exit(1)
@@ -1,10 +1,18 @@
 # Archivo: Metadata/vehiculos/transform_vehiculos.py
 import json
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..'))
+from comun.artefactos import escribir_artefacto
 
 
 # --- Lógica de la función limpiar_y_filtrar_datos (sin cambios) ---
-def limpiar_y_filtrar_datos(archivo_entrada: str, archivo_salida: str):
+def limpiar_y_filtrar_datos(archivo_entrada: str, archivo_salida_base: str):
+    """
+    Filtra las especificaciones clave y las guarda como artefacto en '<archivo_salida_base>.<formato>'.
+    Retorna True si se guardó el artefacto, False si no.
+    """
     # ... (El código de esta función es idéntico al que ya tenías) ...
     # ... (Lo he omitido aquí por brevedad, solo cópialo y pégalo)
     try:
@@ -12,7 +20,7 @@ def limpiar_y_filtrar_datos(archivo_entrada: str, archivo_salida: str):
             datos_completos = json.load(f)
     except FileNotFoundError:
         print(f"Error: El archivo de entrada '{archivo_entrada}' no fue encontrado.")
-        return
+        return False
 
     mapa_especificaciones_clave = {
         "Consumo combustible - mixto (km/l)": "consumo_mixto_kml",
@@ -55,19 +63,26 @@ def limpiar_y_filtrar_datos(archivo_entrada: str, archivo_salida: str):
         data_filtrada.append(vehiculo_filtrado)
 
     try:
-        with open(archivo_salida, 'w', encoding='utf-8') as f:
-            json.dump(data_filtrada, f, indent=4, ensure_ascii=False)
+        archivo_salida, _ = escribir_artefacto(archivo_salida_base, data_filtrada)
         print(
             f"\n¡Proceso completado! Se han guardado {len(data_filtrada)} vehículos con datos limpios en '{archivo_salida}'.")
+        return True
     except Exception as e:
         print(f"\nOcurrió un error al guardar el archivo JSON: {e}")
+        return False
 
 
-if __name__ == "__main__":
+def ejecutar():
+    """Punto de entrada del paso: transforma 'chileautos_data.json' de esta carpeta."""
     # Usar rutas relativas al script para que funcione desde cualquier lugar
-    SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
-    archivo_original = os.path.join(SCRIPT_DIR, 'chileautos_data.json')
-    archivo_final = os.path.join(SCRIPT_DIR, 'metadata_vehiculos.json')
+    script_dir = os.path.dirname(os.path.realpath(__file__))
+    archivo_original = os.path.join(script_dir, 'chileautos_data.json')
+    archivo_final = os.path.join(script_dir, 'metadata_vehiculos')
 
     print("Iniciando la transformación de datos de vehículos...")
-    limpiar_y_filtrar_datos(archivo_original, archivo_final)
\ No newline at end of file
+    return limpiar_y_filtrar_datos(archivo_original, archivo_final)
+
+
+if __name__ == "__main__":
+    if not ejecutar():
+        sys.exit(1)
\ No newline at end of file
@@ -1,8 +1,13 @@
-from flask import Flask, render_template, jsonify
+from flask import Flask, render_template, jsonify, request
 import psycopg2
 import os
 import json  # Asegúrate de importar json
+import threading
+from datetime import datetime
 from dotenv import load_dotenv
+from cache_datos import CachePreciosRegionales
+from indice_estaciones import IndiceEstaciones
+from tarifas_peajes import MotorTarifasPeajes
 
 # Cargar variables de entorno desde el archivo .env
 load_dotenv()
@@ -25,6 +30,31 @@ def get_db_connection():
     return conn
 
 
+# Cachés en memoria (se recargan solas cuando el ETL registra una nueva carga en 'versiones_datos')
+cache_precios_regionales = CachePreciosRegionales(get_db_connection)
+indice_estaciones = IndiceEstaciones(get_db_connection)
+motor_tarifas_peajes = MotorTarifasPeajes(get_db_connection)
+
+# Cachés por fuente de 'versiones_datos', para que el programador del ETL recargue solo las afectadas
+CACHES_POR_FUENTE = {}
+for _cache in (cache_precios_regionales, indice_estaciones, motor_tarifas_peajes):
+    CACHES_POR_FUENTE.setdefault(_cache.fuente, []).append(_cache)
+
+# Si está definido, '/api/interno/recargar' exige este valor en la cabecera 'X-Token-Recarga';
+# si no, solo acepta avisos desde la misma máquina.
+TOKEN_RECARGA = os.getenv("APP_TOKEN_RECARGA")
+
+MAX_ESTACIONES_CERCANAS = 50
+
+# Rango de INTEGER en PostgreSQL ('peajes.id' es SERIAL): ids y segundos fuera de él no caben en el
+# motor de tarifas (int64) o no pueden existir en la base
+MAX_ENTERO_BD = 2 ** 31 - 1
+
+# Columnas de 'red_vial' usadas como costo en cada sentido según el criterio de ruteo
+# (el costo inverso es -1 en las vías de sentido único, que pgr_dijkstra no recorre al revés)
+COSTOS_RUTEO = {"distancia": ("cost", "reverse_cost"), "tiempo": ("tiempo_seg", "reverse_tiempo_seg")}
+
+
 @app.route('/')
 def index():
     """Renderiza la página principal del mapa."""
@@ -35,31 +65,35 @@ def index():
 def get_ruta_ejemplo():
     """
     Calcula una ruta de ejemplo usando pgr_dijkstra y la devuelve como GeoJSON.
+    Con '?criterio=tiempo' minimiza el tiempo de viaje en vez de la distancia.
     """
-    # Nodos de ejemplo (puedes cambiarlos por cualquier ID de la tabla planet_osm_line_vertices_pgr)
+    criterio = request.args.get('criterio', 'distancia')
+    if criterio not in COSTOS_RUTEO:
+        return jsonify({"error": f"Criterio inválido. Valores posibles: {', '.join(COSTOS_RUTEO)}."}), 400
+
+    # Nodos de ejemplo (puedes cambiarlos por cualquier ID de la tabla red_vial_vertices_pgr)
     # Por ejemplo, un recorrido por la Alameda en Santiago.
     nodo_inicio = 115254
     nodo_fin = 103233
 
-    # --- CORRECCIONES AQUÍ ---
-    # 1. La tabla principal ahora es 'planet_osm_line'.
-    # 2. La columna de geometría es 'way', no 'the_geom'.
-    # 3. La columna de ID es 'osm_id', no 'id'.
+    # Se rutea sobre 'red_vial', que solo contiene las vías ruteables con sus costos precalculados,
+    # como grafo dirigido para respetar el sentido de tránsito.
     query = """
             SELECT ST_AsGeoJSON(ST_Collect(geom)) AS route
-            FROM (SELECT ways.way as geom \
+            FROM (SELECT red_vial.geom \
                   FROM pgr_dijkstra( \
-                               'SELECT osm_id AS id, source, target, cost FROM planet_osm_line WHERE highway IS NOT NULL', \
-                               %s, %s, directed := false \
+                               %s, %s, %s, directed := true \
                        ) AS di \
-                           JOIN planet_osm_line AS ways ON di.edge = ways.osm_id) AS route_geom; \
+                           JOIN red_vial ON di.edge = red_vial.id) AS route_geom; \
             """
 
     conn = None
     try:
         conn = get_db_connection()
         cur = conn.cursor()
-        cur.execute(query, (nodo_inicio, nodo_fin))
+        costo, costo_inverso = COSTOS_RUTEO[criterio]
+        cur.execute(query, (f"SELECT id, source, target, {costo} AS cost, {costo_inverso} AS reverse_cost "
+                            f"FROM red_vial", nodo_inicio, nodo_fin))
         result = cur.fetchone()
 
         if result and result[0]:
@@ -76,5 +110,167 @@ def get_ruta_ejemplo():
             conn.close()
 
 
+@app.route('/api/combustibles/precio_tipico')
+def get_precio_tipico():
+    """
+    Devuelve el precio típico (mediana, p10, p90) de un combustible en una comuna o región.
+    Parámetros: tipo (ej. 'gasolina_93'), region y comuna (opcionales).
+    """
+    tipo = request.args.get('tipo')
+    if not tipo:
+        return jsonify({"error": "El parámetro 'tipo' es obligatorio."}), 400
+
+    precio = cache_precios_regionales.precio_tipico(
+        tipo, region=request.args.get('region'), comuna=request.args.get('comuna')
+    )
+    if precio is None:
+        return jsonify({"error": f"No hay precios disponibles para '{tipo}'."}), 404
+    return jsonify(precio)
+
+
+def buscar_estaciones_cercanas_bd(lat, lon, tipo, k):
+    """
+    Respaldo del índice en memoria: búsqueda KNN en PostGIS con el operador '<->',
+    que usa el índice GIST de 'estaciones_servicio.ubicacion'.
+    """
+    query = """
+            SELECT e.id, e.nombre, e.marca, e.direccion, e.comuna, e.region,
+                   ST_Y(e.ubicacion), ST_X(e.ubicacion), p.precio, p.fecha_actualizacion,
+                   ST_DistanceSphere(e.ubicacion, ST_SetSRID(ST_MakePoint(%s, %s), 4326)) / 1000.0
+            FROM estaciones_servicio e
+            JOIN precios_combustibles p ON p.estacion_id = e.id AND p.tipo_combustible = %s
+            ORDER BY e.ubicacion <-> ST_SetSRID(ST_MakePoint(%s, %s), 4326)
+            LIMIT %s;
+            """
+    conn = None
+    try:
+        conn = get_db_connection()
+        with conn.cursor() as cur:
+            cur.execute(query, (lon, lat, tipo, lon, lat, k))
+            estaciones = []
+            for (est_id, nombre, marca, direccion, comuna, region, est_lat, est_lon,
+                 precio, fecha, distancia) in cur.fetchall():
+                fecha_iso = fecha.isoformat() if fecha else None
+                estaciones.append({
+                    "id": est_id, "nombre": nombre, "marca": marca, "direccion": direccion,
+                    "comuna": comuna, "region": region, "latitud": est_lat, "longitud": est_lon,
+                    "precios": {tipo: {"precio": precio, "fecha_actualizacion": fecha_iso}},
+                    "distancia_km": round(distancia, 3),
+                    "precio": precio
+                })
+            return estaciones
+    finally:
+        if conn:
+            conn.close()
+
+
+@app.route('/api/estaciones/cercanas')
+def get_estaciones_cercanas():
+    """
+    Devuelve las k estaciones más cercanas a (lat, lon) que venden el combustible 'tipo',
+    con sus precios actuales. Se responde desde el índice en memoria y solo se consulta
+    la base de datos si el índice no está disponible.
+    """
+    try:
+        lat = float(request.args['lat'])
+        lon = float(request.args['lon'])
+        k = int(request.args.get('k', 5))
+    except (KeyError, ValueError):
+        return jsonify({"error": "Los parámetros 'lat' y 'lon' son obligatorios y deben ser numéricos."}), 400
+    tipo = request.args.get('tipo')
+    if not tipo:
+        return jsonify({"error": "El parámetro 'tipo' es obligatorio."}), 400
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return jsonify({"error": "Coordenadas fuera de rango."}), 400
+    k = max(1, min(k, MAX_ESTACIONES_CERCANAS))
+
+    estaciones = indice_estaciones.cercanas(lat, lon, tipo, k)
+    if estaciones is None:
+        try:
+            estaciones = buscar_estaciones_cercanas_bd(lat, lon, tipo, k)
+        except psycopg2.Error as e:
+            print(f"Error de base de datos: {e}")
+            return jsonify({"error": "Error de conexión con la base de datos."}), 500
+
+    return jsonify({"tipo_combustible": tipo, "estaciones": estaciones})
+
+
+@app.route('/api/peajes/costo_ruta')
+def get_costo_ruta_peajes():
+    """
+    Calcula el costo de los peajes de una ruta según la hora de salida y la categoría del vehículo.
+    Parámetros: peajes (ids separados por coma, en orden), categoria (ej. 'autos_y_camionetas'),
+    salida (fecha ISO, por defecto ahora), segundos (opcional, segundos desde la salida hasta
+    cada peaje, separados por coma) y festivo ('1' para usar los horarios de festivos).
+    """
+    try:
+        peaje_ids = [int(valor) for valor in request.args['peajes'].split(',') if valor.strip()]
+        salida = datetime.fromisoformat(request.args['salida']) if request.args.get('salida') else datetime.now()
+        segundos = request.args.get('segundos')
+        segundos = [int(valor) for valor in segundos.split(',')] if segundos else None
+    except (KeyError, ValueError):
+        return jsonify({"error": "El parámetro 'peajes' es obligatorio y debe ser una lista de ids numéricos."}), 400
+    if any(abs(peaje_id) > MAX_ENTERO_BD for peaje_id in peaje_ids):
+        return jsonify({"error": f"Los ids de 'peajes' deben estar entre -{MAX_ENTERO_BD} y {MAX_ENTERO_BD}."}), 400
+    if segundos is not None and any(not 0 <= valor <= MAX_ENTERO_BD for valor in segundos):
+        return jsonify({"error": f"Los valores de 'segundos' deben estar entre 0 y {MAX_ENTERO_BD}."}), 400
+    categoria = request.args.get('categoria')
+    if not categoria:
+        return jsonify({"error": "El parámetro 'categoria' es obligatorio."}), 400
+    if segundos is not None and len(segundos) != len(peaje_ids):
+        return jsonify({"error": "'segundos' debe tener un valor por cada peaje."}), 400
+    festivo = request.args.get('festivo', '0').lower() in ('1', 'true', 'si')
+
+    try:
+        costo = motor_tarifas_peajes.costo_ruta(peaje_ids, salida, categoria, segundos, festivo)
+    except KeyError:
+        return jsonify({
+            "error": f"Categoría '{categoria}' desconocida.",
+            "categorias": motor_tarifas_peajes.categorias()
+        }), 404
+    if costo is None:
+        return jsonify({"error": "Las tarifas de peajes no están disponibles."}), 503
+
+    return jsonify({
+        "categoria": categoria,
+        "salida": salida.isoformat(),
+        "total": costo["total"],
+        "peajes": [
+            {"id": peaje_id, "precio": None if precio != precio else precio, "periodo": int(periodo)}
+            for peaje_id, precio, periodo in zip(peaje_ids, costo["precios"].tolist(), costo["periodos"])
+        ],
+        "sin_tarifa": costo["sin_tarifa"]
+    })
+
+
+@app.route('/api/interno/recargar', methods=['POST'])
+def post_recargar_caches():
+    """
+    Aviso del programador del ETL ('main.py --programador') de que cargó datos nuevos.
+    Cuerpo: {"fuentes": ["combustibles", ...]}. Las cachés de esas fuentes se recargan en segundo
+    plano; las consultas siguen respondiendo con los datos anteriores hasta que termina la recarga.
+    """
+    if TOKEN_RECARGA:
+        if request.headers.get('X-Token-Recarga') != TOKEN_RECARGA:
+            return jsonify({"error": "Token de recarga inválido."}), 403
+    elif request.remote_addr not in ('127.0.0.1', '::1'):
+        return jsonify({"error": "Sin APP_TOKEN_RECARGA solo se aceptan avisos locales."}), 403
+
+    fuentes = (request.get_json(silent=True) or {}).get('fuentes')
+    if not isinstance(fuentes, list) or not fuentes:
+        return jsonify({"error": "El cuerpo debe incluir 'fuentes', una lista no vacía."}), 400
+
+    recargadas, desconocidas = [], []
+    for fuente in fuentes:
+        if fuente not in CACHES_POR_FUENTE:
+            desconocidas.append(fuente)
+            continue
+        for cache in CACHES_POR_FUENTE[fuente]:
+            cache.invalidar()
+            threading.Thread(target=cache.obtener, daemon=True).start()
+        recargadas.append(fuente)
+    return jsonify({"recargadas": recargadas, "desconocidas": desconocidas}), 202
+
+
 if __name__ == '__main__':
     app.run(debug=True, port=5001, host='0.0.0.0')
\ No newline at end of file
@@ -0,0 +1,136 @@
+import threading
+import time
+import psycopg2
+
+
+class CacheVersionada:
+    """
+    Caché en memoria de datos de la BD que se recarga solo cuando cambia la versión
+    de su fuente en la tabla 'versiones_datos' (la actualizan los cargadores del ETL).
+
+    La versión se consulta como máximo una vez cada 'intervalo_verificacion' segundos,
+    así que las lecturas normales no tocan la base de datos. Las subclases implementan
+    '_cargar(cur)', que debe devolver la estructura de datos completa ya construida.
+    """
+
+    def __init__(self, fuente, obtener_conexion, intervalo_verificacion=60):
+        self.fuente = fuente
+        self.obtener_conexion = obtener_conexion
+        self.intervalo_verificacion = intervalo_verificacion
+
+        self._datos = None
+        self._version = None
+        self._forzar_recarga = False
+        self._ultima_verificacion = 0.0
+        self._lock = threading.Lock()
+
+    def _cargar(self, cur):
+        raise NotImplementedError
+
+    def _vigente(self):
+        return (
+            self._datos is not None
+            and not self._forzar_recarga
+            and time.monotonic() - self._ultima_verificacion < self.intervalo_verificacion
+        )
+
+    def invalidar(self):
+        """Fuerza a que la próxima lectura recargue los datos desde la BD."""
+        self._forzar_recarga = True
+
+    def obtener(self):
+        """
+        Devuelve los datos cacheados, recargándolos si su versión cambió.
+        Retorna None si nunca se pudieron cargar (ej. la BD no está disponible).
+        """
+        if self._vigente():
+            return self._datos
+
+        with self._lock:
+            # Otro hilo pudo haber recargado mientras esperábamos el lock
+            if self._vigente():
+                return self._datos
+
+            conn = None
+            try:
+                conn = self.obtener_conexion()
+                with conn.cursor() as cur:
+                    cur.execute("SELECT actualizado_en FROM versiones_datos WHERE fuente = %s;", (self.fuente,))
+                    fila = cur.fetchone()
+                    version = fila[0] if fila else None
+
+                    if self._datos is None or self._forzar_recarga or version != self._version:
+                        inicio = time.perf_counter()
+                        self._datos = self._cargar(cur)
+                        self._version = version
+                        print(f"Caché '{self.fuente}' ({type(self).__name__}) recargada en "
+                              f"{(time.perf_counter() - inicio) * 1000:.1f} ms.")
+                self._forzar_recarga = False
+            except psycopg2.Error as e:
+                # Se mantienen los datos anteriores (si existen) y se reintenta en el próximo intervalo
+                print(f"Advertencia: No se pudo actualizar la caché '{self.fuente}': {e}")
+            finally:
+                self._ultima_verificacion = time.monotonic()
+                if conn:
+                    conn.close()
+
+            return self._datos
+
+
+class CachePreciosRegionales(CacheVersionada):
+    """
+    Caché de la vista materializada 'precios_combustibles_region'. Permite obtener el
+    precio típico (mediana, p10, p90) de un combustible en una comuna o región sin
+    consultar la base de datos, por ejemplo para estimar el costo de combustible de cada arco.
+    """
+
+    def __init__(self, obtener_conexion, intervalo_verificacion=60):
+        super().__init__("combustibles", obtener_conexion, intervalo_verificacion)
+
+    @staticmethod
+    def _normalizar(texto):
+        return texto.strip().lower() if texto else None
+
+    def _cargar(self, cur):
+        cur.execute(
+            """
+            SELECT nivel, region, comuna, tipo_combustible,
+                   precio_mediana, precio_p10, precio_p90, total_estaciones
+            FROM precios_combustibles_region;
+            """
+        )
+        agregados = {}
+        for nivel, region, comuna, tipo, mediana, p10, p90, total in cur.fetchall():
+            clave = (nivel, tipo, self._normalizar(region), self._normalizar(comuna))
+            agregados[clave] = {
+                "nivel": nivel,
+                "region": region,
+                "comuna": comuna,
+                "tipo_combustible": tipo,
+                "precio_mediana": mediana,
+                "precio_p10": p10,
+                "precio_p90": p90,
+                "total_estaciones": total
+            }
+        return agregados
+
+    def precio_tipico(self, tipo_combustible, region=None, comuna=None):
+        """
+        Devuelve las estadísticas de precio del nivel más específico disponible:
+        primero la comuna, luego la región y finalmente el país. None si no hay datos.
+        """
+        agregados = self.obtener()
+        if not agregados:
+            return None
+
+        region_norm = self._normalizar(region)
+        comuna_norm = self._normalizar(comuna)
+        claves = (
+            ("comuna", tipo_combustible, region_norm, comuna_norm),
+            ("region", tipo_combustible, region_norm, None),
+            ("pais", tipo_combustible, None, None)
+        )
+        for clave in claves:
+            if clave in agregados:
+                return agregados[clave]
+        return None
@@ -0,0 +1,213 @@
+import heapq
+import math
+from collections import defaultdict
+import numpy as np
+from cache_datos import CacheVersionada
+
+RADIO_TIERRA_KM = 6371.0088
+KM_POR_GRADO = 2 * math.pi * RADIO_TIERRA_KM / 360
+
+
+def _haversine_km(lat, lon, lats, lons):
+    """Distancia en km desde (lat, lon) a cada punto de los arrays 'lats' y 'lons'."""
+    lat_r, lon_r = math.radians(lat), math.radians(lon)
+    lats_r, lons_r = np.radians(lats), np.radians(lons)
+    a = (np.sin((lats_r - lat_r) / 2) ** 2
+         + math.cos(lat_r) * np.cos(lats_r) * np.sin((lons_r - lon_r) / 2) ** 2)
+    return 2 * RADIO_TIERRA_KM * np.arcsin(np.sqrt(a))
+
+
+def _haversine_punto_km(lat1, lon1, lat2, lon2):
+    lat1_r, lat2_r = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((lat2_r - lat1_r) / 2) ** 2
+         + math.cos(lat1_r) * math.cos(lat2_r) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * RADIO_TIERRA_KM * math.asin(math.sqrt(min(1.0, a)))
+
+
+class _Grilla:
+    """Grilla espacial de un nivel, con celdas cuadradas de 'tamano_celda' grados."""
+
+    def __init__(self, puntos, tamano_celda):
+        self.tamano_celda = tamano_celda
+
+        # Cada celda guarda tuplas (lat, lon, índice). Las distancias de los candidatos se calculan en
+        # Python puro: con pocas decenas de puntos es más rápido que el overhead de crear arrays numpy.
+        celdas = defaultdict(list)
+        for lat, lon, indice in puntos:
+            celdas[self._celda(lat, lon)].append((lat, lon, indice))
+        self.celdas = dict(celdas)
+
+        filas = [c[0] for c in self.celdas] or [0]
+        columnas = [c[1] for c in self.celdas] or [0]
+        self.limites = (min(filas), max(filas), min(columnas), max(columnas))
+
+    def _celda(self, lat, lon):
+        return int(math.floor(lat / self.tamano_celda)), int(math.floor(lon / self.tamano_celda))
+
+    def _celdas_anillo(self, fila, columna, r):
+        """Celdas no vacías a distancia (Chebyshev) exactamente 'r' de la celda dada."""
+        if r == 0:
+            celda = self.celdas.get((fila, columna))
+            return [celda] if celda is not None else []
+        encontradas = []
+        for df in range(-r, r + 1):
+            pasos = (-r, r) if abs(df) != r else range(-r, r + 1)
+            for dc in pasos:
+                celda = self.celdas.get((fila + df, columna + dc))
+                if celda is not None:
+                    encontradas.append(celda)
+        return encontradas
+
+    def _distancia_borde_km(self, lat, lon, fila, columna, r, kx):
+        """
+        Distancia (en la proyección local, km) desde (lat, lon) al borde del bloque de celdas
+        revisado hasta el anillo 'r': ningún punto fuera del bloque puede estar más cerca.
+        """
+        c = self.tamano_celda
+        dist_lat = min(lat - (fila - r) * c, (fila + r + 1) * c - lat) * KM_POR_GRADO
+        dist_lon = min(lon - (columna - r) * c, (columna + r + 1) * c - lon) * kx
+        return min(dist_lat, dist_lon)
+
+    def buscar(self, lat, lon, k, max_anillos):
+        """
+        Devuelve los índices de los k puntos más cercanos, o None si no se pudo asegurar
+        el resultado revisando a lo más 'max_anillos' anillos de celdas.
+        """
+        fila, columna = self._celda(lat, lon)
+        f_min, f_max, c_min, c_max = self.limites
+        ultimo_anillo = max(abs(fila - f_min), abs(fila - f_max), abs(columna - c_min), abs(columna - c_max))
+
+        # Los candidatos se ordenan en una proyección equirectangular local (km), que para
+        # distancias de decenas de km coincide con haversine; esta se calcula solo para los k finales.
+        ky = KM_POR_GRADO
+        kx = KM_POR_GRADO * math.cos(math.radians(lat))
+        candidatos = []
+        for r in range(min(ultimo_anillo, max_anillos) + 1):
+            for celda in self._celdas_anillo(fila, columna, r):
+                candidatos.extend([
+                    (((lon_e - lon) * kx) ** 2 + ((lat_e - lat) * ky) ** 2, indice)
+                    for lat_e, lon_e, indice in celda
+                ])
+            if len(candidatos) >= k:
+                kesimo = heapq.nsmallest(k, candidatos)[-1][0]
+                if kesimo <= self._distancia_borde_km(lat, lon, fila, columna, r, kx) ** 2:
+                    break
+        else:
+            if ultimo_anillo > max_anillos:
+                return None
+
+        return [indice for _, indice in heapq.nsmallest(k, candidatos)]
+
+
+class _IndiceTipo:
+    """
+    Índice de las estaciones que venden un combustible. Usa dos grillas: una fina para
+    zonas densas (ciudades) y una gruesa para rutas donde la estación más cercana está a
+    decenas de km. Si ninguna resuelve la consulta, se calcula por fuerza bruta con numpy.
+    """
+
+    NIVELES = ((0.02, 6), (0.25, 20))  # (tamaño de celda en grados, máximo de anillos a revisar)
+    MAX_FUERZA_BRUTA_DIRECTA = 64  # Con tan pocas estaciones (ej. GNC) no vale la pena usar las grillas
+
+    def __init__(self, estaciones):
+        self.estaciones = estaciones
+        self.lats = np.array([e["latitud"] for e in estaciones], dtype=np.float64)
+        self.lons = np.array([e["longitud"] for e in estaciones], dtype=np.float64)
+        self.lats_lista, self.lons_lista = self.lats.tolist(), self.lons.tolist()
+        puntos = list(zip(self.lats_lista, self.lons_lista, range(len(estaciones))))
+        self.grillas = [(_Grilla(puntos, tamano), max_anillos) for tamano, max_anillos in self.NIVELES]
+
+    def _fuerza_bruta(self, lat, lon, k):
+        distancias = _haversine_km(lat, lon, self.lats, self.lons)
+        if len(distancias) > k:
+            return np.argpartition(distancias, k - 1)[:k].tolist()
+        return list(range(len(distancias)))
+
+    def cercanas(self, lat, lon, k):
+        """Devuelve [(indice, distancia_km), ...] con las k estaciones más cercanas, ordenadas por distancia."""
+        k = min(k, len(self.estaciones))
+        if k == 0:
+            return []
+
+        if len(self.estaciones) <= self.MAX_FUERZA_BRUTA_DIRECTA:
+            indices = range(len(self.estaciones))
+        else:
+            for grilla, max_anillos in self.grillas:
+                indices = grilla.buscar(lat, lon, k, max_anillos)
+                if indices is not None:
+                    break
+            else:
+                indices = self._fuerza_bruta(lat, lon, k)
+
+        resultado = [
+            (i, _haversine_punto_km(lat, lon, self.lats_lista[i], self.lons_lista[i])) for i in indices
+        ]
+        if len(resultado) > k:
+            resultado = heapq.nsmallest(k, resultado, key=lambda par: (par[1], par[0]))
+        return sorted(resultado, key=lambda par: (par[1], par[0]))
+
+
+class IndiceEstaciones(CacheVersionada):
+    """
+    Índice espacial en memoria (una grilla por tipo de combustible) para responder
+    consultas de "k estaciones más cercanas" sin ir a la base de datos. Se reconstruye
+    cuando 'CargadorCombustible' registra una nueva carga en 'versiones_datos'.
+    """
+
+    def __init__(self, obtener_conexion, intervalo_verificacion=60):
+        super().__init__("combustibles", obtener_conexion, intervalo_verificacion)
+
+    def _cargar(self, cur):
+        cur.execute(
+            """
+            SELECT e.id, e.nombre, e.marca, e.direccion, e.comuna, e.region,
+                   ST_Y(e.ubicacion), ST_X(e.ubicacion),
+                   p.tipo_combustible, p.precio, p.fecha_actualizacion
+            FROM estaciones_servicio e
+            JOIN precios_combustibles p ON p.estacion_id = e.id
+            WHERE e.ubicacion IS NOT NULL
+            ORDER BY e.id;
+            """
+        )
+        estaciones = {}
+        for (est_id, nombre, marca, direccion, comuna, region, lat, lon,
+             tipo, precio, fecha) in cur.fetchall():
+            estacion = estaciones.get(est_id)
+            if estacion is None:
+                estacion = estaciones[est_id] = {
+                    "id": est_id, "nombre": nombre, "marca": marca, "direccion": direccion,
+                    "comuna": comuna, "region": region, "latitud": lat, "longitud": lon,
+                    "precios": {}
+                }
+            estacion["precios"][tipo] = {
+                "precio": precio,
+                "fecha_actualizacion": fecha.isoformat() if fecha else None
+            }
+
+        por_tipo = defaultdict(list)
+        for estacion in estaciones.values():
+            for tipo in estacion["precios"]:
+                por_tipo[tipo].append(estacion)
+        return {tipo: _IndiceTipo(lista) for tipo, lista in por_tipo.items()}
+
+    def cercanas(self, lat, lon, tipo_combustible, k=5):
+        """
+        Devuelve las k estaciones más cercanas que venden 'tipo_combustible', con sus precios.
+        Retorna None si el índice no está disponible (el llamador debe usar la consulta en BD).
+        """
+        indices = self.obtener()
+        if indices is None:
+            return None
+        indice_tipo = indices.get(tipo_combustible)
+        if indice_tipo is None:
+            return []
+
+        resultado = []
+        for indice, distancia in indice_tipo.cercanas(lat, lon, k):
+            estacion = indice_tipo.estaciones[indice]
+            resultado.append({
+                **estacion,
+                "distancia_km": round(distancia, 3),
+                "precio": estacion["precios"][tipo_combustible]["precio"]
+            })
+        return resultado
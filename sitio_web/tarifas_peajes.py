@@ -0,0 +1,194 @@
+import re
+import numpy as np
+from cache_datos import CacheVersionada
+
+# Periodos tarifarios (última dimensión del tensor de tarifas)
+PERIODO_BASE = 0       # TBFP / NORMAL: tarifa fuera de punta o única
+PERIODO_PUNTA = 1      # TBP / PUNTA
+PERIODO_SATURACION = 2  # TS
+TOTAL_PERIODOS = 3
+
+PERIODO_POR_TIPO_TARIFA = {
+    "TBFP": PERIODO_BASE, "NORMAL": PERIODO_BASE, "UNICA": PERIODO_BASE,
+    "TARIFA ÚNICA (MANUAL Y ELECTRÓNICO)": PERIODO_BASE,
+    "TBP": PERIODO_PUNTA, "PUNTA": PERIODO_PUNTA,
+    "TS": PERIODO_SATURACION,
+    # Peajes que cobran distinto según la forma de pago: la ruta se calcula con TAG, como en las urbanas
+    "TAG": PERIODO_BASE,
+}  # Otros tipos (ej. 'PASE DIARIO' o 'MANUAL') no se cobran por pasada con TAG y se ignoran
+
+# Filas de la tabla de horarios: lunes (0) a domingo (6) según datetime.weekday(), y 7 = festivo
+FILA_FESTIVO = 7
+MINUTOS_DIA = 24 * 60
+
+# Prefijo de la clave en 'horarios' -> periodo. 'fuera_punta' va primero porque también contiene 'punta'.
+PREFIJOS_HORARIO = (("fuera_punta", PERIODO_BASE), ("saturacion", PERIODO_SATURACION), ("punta", PERIODO_PUNTA))
+
+
+def _minuto_del_dia(texto):
+    horas, minutos = texto.strip().split(":")
+    return int(horas) * 60 + int(minutos)
+
+
+def _filas_de_clave(clave):
+    """Filas (días) a las que aplica una clave de horario, ej. 'punta_sabado_festivos_tbp' -> [5, 7]."""
+    filas = []
+    if "laboral" in clave:
+        filas.extend(range(5))
+    if "sabado" in clave:
+        filas.append(5)
+    if "domingo" in clave:
+        filas.append(6)
+    if "festivo" in clave:
+        filas.append(FILA_FESTIVO)
+    return filas
+
+
+def compilar_horario(horarios):
+    """
+    Convierte el diccionario 'horarios' de un pórtico (ej. {"punta_laboral_tbp": ["07:30-09:30"]})
+    en una tabla uint8 de (8 días x 1440 minutos) con el periodo vigente en cada minuto.
+    Los minutos no cubiertos quedan en PERIODO_BASE. Si dos rangos se solapan gana el más caro.
+    """
+    tabla = np.zeros((FILA_FESTIVO + 1, MINUTOS_DIA), dtype=np.uint8)
+    for clave, rangos in (horarios or {}).items():
+        periodo = next((p for prefijo, p in PREFIJOS_HORARIO if clave.startswith(prefijo)), None)
+        filas = _filas_de_clave(clave)
+        if periodo is None or not filas:
+            continue
+        for rango in rangos or []:
+            if not re.fullmatch(r"\s*\d{1,2}:\d{2}\s*-\s*\d{1,2}:\d{2}\s*", rango):
+                print(f"Advertencia: Rango horario no reconocido '{rango}' en '{clave}'.")
+                continue
+            inicio, fin = (_minuto_del_dia(parte) for parte in rango.split("-"))
+            if fin <= inicio:
+                fin += MINUTOS_DIA  # ej. '15:00-00:00' termina a medianoche
+            for fila in filas:
+                tramo = tabla[fila, inicio:min(fin, MINUTOS_DIA)]
+                np.maximum(tramo, periodo, out=tramo)
+                if fin > MINUTOS_DIA and fila != FILA_FESTIVO:
+                    # Cruza la medianoche: continúa al inicio del día siguiente
+                    siguiente = tabla[(fila + 1) % 7, :fin - MINUTOS_DIA]
+                    np.maximum(siguiente, periodo, out=siguiente)
+    return tabla
+
+
+class MotorTarifasPeajes(CacheVersionada):
+    """
+    Motor de tarifas de peajes en memoria. Carga 'tarifas_peaje' en un tensor denso de NumPy
+    [peaje, categoría de vehículo, periodo] y compila los horarios de cada peaje en tablas
+    [día, minuto] -> periodo, para calcular el costo de todos los peajes de una ruta con unas
+    pocas operaciones vectorizadas, sin comparar textos en cada consulta.
+
+    Los horarios se deduplican: los peajes con el mismo horario comparten la misma tabla.
+    Se reconstruye cuando 'CargadorPeajes' registra una nueva carga en 'versiones_datos'.
+    """
+
+    def __init__(self, obtener_conexion, intervalo_verificacion=60):
+        super().__init__("peajes", obtener_conexion, intervalo_verificacion)
+
+    def _cargar(self, cur):
+        cur.execute("SELECT id, nombre, concesionaria, horarios FROM peajes ORDER BY id;")
+        filas_peajes = cur.fetchall()
+        cur.execute(
+            """
+            SELECT t.peaje_id, c.nombre, tt.codigo, t.precio
+            FROM tarifas_peaje t
+            JOIN categorias_vehiculo c ON c.id = t.categoria_id
+            JOIN tipos_tarifa tt ON tt.id = t.tipo_tarifa_id;
+            """
+        )
+        filas_tarifas = cur.fetchall()
+
+        ids = np.array([fila[0] for fila in filas_peajes], dtype=np.int64)
+        indice_por_id = np.full(int(ids.max()) + 1 if len(ids) else 1, -1, dtype=np.int32)
+        indice_por_id[ids] = np.arange(len(ids), dtype=np.int32)
+
+        # Horarios distintos -> una tabla compilada cada uno (la 0 es "sin horario": todo en PERIODO_BASE)
+        tablas = [np.zeros((FILA_FESTIVO + 1, MINUTOS_DIA), dtype=np.uint8)]
+        tabla_por_horario = {}
+        horario_por_peaje = np.zeros(len(ids), dtype=np.int32)
+        for posicion, (_, _, _, horarios) in enumerate(filas_peajes):
+            if not horarios:
+                continue
+            clave = repr(sorted((k, tuple(v or ())) for k, v in horarios.items()))
+            if clave not in tabla_por_horario:
+                tabla_por_horario[clave] = len(tablas)
+                tablas.append(compilar_horario(horarios))
+            horario_por_peaje[posicion] = tabla_por_horario[clave]
+
+        categorias = sorted({fila[1] for fila in filas_tarifas})
+        indice_categoria = {categoria: i for i, categoria in enumerate(categorias)}
+        tarifas = np.full((len(ids), len(categorias), TOTAL_PERIODOS), np.nan, dtype=np.float64)
+        for peaje_id, categoria, tipo_tarifa, precio in filas_tarifas:
+            periodo = PERIODO_POR_TIPO_TARIFA.get((tipo_tarifa or "").upper())
+            if periodo is None or precio is None:
+                continue
+            tarifas[indice_por_id[peaje_id], indice_categoria[categoria], periodo] = float(precio)
+
+        # Sin tarifa punta/saturación publicada se cobra la del periodo anterior (TS -> TBP -> base)
+        for periodo in (PERIODO_PUNTA, PERIODO_SATURACION):
+            faltantes = np.isnan(tarifas[:, :, periodo])
+            tarifas[:, :, periodo][faltantes] = tarifas[:, :, periodo - 1][faltantes]
+
+        return {
+            "ids": ids,
+            "indice_por_id": indice_por_id,
+            "nombres": [fila[1] for fila in filas_peajes],
+            "concesionarias": [fila[2] for fila in filas_peajes],
+            "categorias": indice_categoria,
+            "tarifas": tarifas,
+            "horarios": np.stack(tablas),
+            "horario_por_peaje": horario_por_peaje
+        }
+
+    def categorias(self):
+        datos = self.obtener()
+        return list(datos["categorias"]) if datos else []
+
+    def costo_ruta(self, peaje_ids, salida, categoria, segundos_desde_salida=None, festivo=False):
+        """
+        Calcula el costo de pasar por los peajes 'peaje_ids' (en orden) saliendo en 'salida' (datetime).
+        'segundos_desde_salida' permite indicar cuándo se llega a cada peaje; si se omite, todos se
+        tarifican a la hora de salida. Con 'festivo' se usan los rangos marcados como festivos.
+
+        Retorna None si el motor no está disponible, o un dict con el total, el precio y periodo de
+        cada peaje y los ids sin tarifa para la categoría. Lanza KeyError si la categoría no existe.
+        """
+        datos = self.obtener()
+        if datos is None:
+            return None
+        c = datos["categorias"][categoria]
+
+        ids = np.asarray(peaje_ids, dtype=np.int64)
+        validos = (ids >= 0) & (ids < len(datos["indice_por_id"]))
+        indices = np.full(len(ids), -1, dtype=np.int32)
+        indices[validos] = datos["indice_por_id"][ids[validos]]
+        conocidos = indices >= 0
+        indices_conocidos = indices[conocidos]
+
+        # Minuto del día y fila (día de la semana o festivo) en que se cruza cada peaje
+        minuto_salida = salida.hour * 60 + salida.minute
+        if segundos_desde_salida is None:
+            minutos = np.full(len(indices_conocidos), minuto_salida, dtype=np.int64)
+            filas = np.full(len(indices_conocidos), FILA_FESTIVO if festivo else salida.weekday(), dtype=np.int64)
+        else:
+            desfase = np.asarray(segundos_desde_salida, dtype=np.int64)[conocidos] // 60
+            absolutos = salida.weekday() * MINUTOS_DIA + minuto_salida + desfase
+            minutos = absolutos % MINUTOS_DIA
+            filas = np.full(len(absolutos), FILA_FESTIVO) if festivo else (absolutos // MINUTOS_DIA) % 7
+
+        periodos = datos["horarios"][datos["horario_por_peaje"][indices_conocidos], filas, minutos]
+        precios = datos["tarifas"][indices_conocidos, c, periodos]
+        sin_tarifa = np.isnan(precios)
+
+        detalle_precios = np.full(len(ids), np.nan)
+        detalle_precios[conocidos] = precios
+        detalle_periodos = np.full(len(ids), -1, dtype=np.int64)
+        detalle_periodos[conocidos] = periodos
+        return {
+            "total": round(float(np.nansum(precios)), 2),
+            "precios": detalle_precios,
+            "periodos": detalle_periodos,
+            "sin_tarifa": ids[~conocidos].tolist() + ids[conocidos][sin_tarifa].tolist()
+        }